@@ -0,0 +1,127 @@
+import html
+import os
+import re
+from urllib.parse import urlparse
+
+from document import document_for
+
+
+def normalize_src(src: str) -> str:
+    path = urlparse(src.strip()).path
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/").lower()
+
+
+class CaptionIndex:
+    """Resolves an <img> src to a caption by full relative path, then basename."""
+
+    def __init__(self, captions: dict[str, str]):
+        self.by_path = {}
+        by_name = {}
+        for key, caption in captions.items():
+            if not caption or caption.startswith("[Error"):
+                continue
+            path = normalize_src(key)
+            self.by_path[path] = caption
+            by_name.setdefault(os.path.basename(path), []).append(caption)
+        # A basename shared by different images is ambiguous, so it can't be used
+        self.by_name = {
+            name: found[0] for name, found in by_name.items() if len(set(found)) == 1
+        }
+
+    def lookup(self, src: str) -> str | None:
+        path = normalize_src(src)
+        if path in self.by_path:
+            return self.by_path[path]
+        for known, caption in self.by_path.items():
+            if path.endswith("/" + known) or known.endswith("/" + path):
+                return caption
+        return self.by_name.get(os.path.basename(path))
+
+
+def scan_start_tag(html_code: str, start: int):
+    """The attributes of the start tag at `start` and the offset past it.
+
+    Attributes are (name, start, end) spans, read the way a browser
+    tokenizes them: a quoted value is taken whole, so a ">" or " alt"
+    inside it is neither the end of the tag nor another attribute. One pass
+    over the tag; None if it isn't closed.
+    """
+    size = len(html_code)
+    pos = start + 1
+    while pos < size and html_code[pos] not in " \t\n\r\f/>":
+        pos += 1
+    attributes = []
+    while True:
+        while pos < size and html_code[pos] in " \t\n\r\f/":
+            pos += 1
+        if pos >= size:
+            return None
+        if html_code[pos] == ">":
+            return attributes, pos + 1
+        begin = pos
+        pos += 1  # a name may start with "=", but not contain one
+        while pos < size and html_code[pos] not in " \t\n\r\f/>=":
+            pos += 1
+        name = html_code[begin:pos]
+        after_name = pos
+        while pos < size and html_code[pos] in " \t\n\r\f":
+            pos += 1
+        if pos < size and html_code[pos] == "=":
+            pos += 1
+            while pos < size and html_code[pos] in " \t\n\r\f":
+                pos += 1
+            if pos < size and html_code[pos] in "\"'":
+                close = html_code.find(html_code[pos], pos + 1)
+                if close == -1:
+                    return None
+                pos = close + 1
+            else:
+                while pos < size and html_code[pos] not in " \t\n\r\f>":
+                    pos += 1
+        else:
+            pos = after_name
+        attributes.append((name, begin, pos))
+
+
+def start_tag_end(html_code: str, start: int) -> int | None:
+    """Offset just past the start tag at `start`, or None if it can't be parsed."""
+    scanned = scan_start_tag(html_code, start)
+    return scanned[1] if scanned else None
+
+
+def set_alt(start_tag: str, alt: str) -> str:
+    value = f'alt="{html.escape(alt, quote=True)}"'
+    attributes, _ = scan_start_tag(start_tag, 0)
+    for name, begin, end in attributes:
+        if name.lower() == "alt":
+            return start_tag[:begin] + value + start_tag[end:]
+    return re.sub(r"^<img\b", lambda m: f"{m.group(0)} {value}", start_tag, flags=re.I)
+
+
+def inject_alt_text(html_code: str, captions: dict[str, str]) -> tuple[str, int]:
+    """Write captions into the alt attribute of matching <img> elements.
+
+    Only the <img> start tags are rewritten; the rest of the document is left
+    byte-identical. Returns the new document and the number of images updated.
+    """
+    index = CaptionIndex(captions)
+    if not index.by_path:
+        return html_code, 0
+
+    document = document_for(html_code)
+    edits = []
+    for img in document.positioned.find_all("img", src=True):
+        caption = index.lookup(img["src"])
+        start = document.start(img)
+        if caption is None or start is None:
+            continue
+        end = start_tag_end(html_code, start)
+        if end is None:
+            continue
+        edits.append((start, end, set_alt(html_code[start:end], caption)))
+
+    for start, end, start_tag in sorted(edits, reverse=True):
+        html_code = html_code[:start] + start_tag + html_code[end:]
+    return html_code, len(edits)
@@ -0,0 +1,160 @@
+import codecs
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from profiling import timed
+
+# Stylesheets and scripts of a site, read one at a time. Sites can ship
+# hundreds of megabytes of bundled JavaScript, so files are listed with
+# their size and hash first, their text is read only when a stage asks
+# for it, and the text kept in memory is capped (ASSET_TEXT_CACHE).
+
+# Files larger than this are left out of analysis and correction
+MAX_ASSET_BYTES = int(os.getenv("MAX_ASSET_BYTES", str(5 * 1024 * 1024)))
+# Characters of text an AssetFiles keeps after reading them; a site whose
+# assets fit is read once, a larger one is read again as stages need it
+ASSET_TEXT_CACHE = int(os.getenv("ASSET_TEXT_CACHE", str(64 * 1024 * 1024)))
+
+_CHUNK = 1 << 20
+
+
+class Asset:
+    """A text file of the site: where it is, how big, and its content hash."""
+
+    def __init__(self, path: str, name: str, size: int, digest: str):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.digest = digest
+
+    @property
+    def text(self) -> str:
+        # Read on every access; AssetFiles decides what to keep
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def _scan(path: str) -> tuple[str, str | None]:
+    # Hash in chunks; the reason to skip the file, or None if it is text
+    digest = hashlib.sha256()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    problem = None
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK):
+            digest.update(chunk)
+            if problem is not None:
+                continue
+            if b"\0" in chunk:
+                problem = "binary"
+                continue
+            try:
+                decoder.decode(chunk)
+            except UnicodeDecodeError:
+                problem = "not UTF-8"
+    if problem is None:
+        try:
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            problem = "not UTF-8"
+    return digest.hexdigest(), problem
+
+
+def iter_assets(directory: str, suffix: str, max_bytes: int = MAX_ASSET_BYTES):
+    """Yield an Asset for each text file ending in `suffix` under `directory`.
+
+    Files over `max_bytes` and files that aren't UTF-8 text are skipped with
+    a warning. Only one chunk of one file is in memory at a time.
+    """
+    kind = suffix.lstrip(".")
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith(suffix):
+                continue
+            path = os.path.join(root, file)
+            size = os.path.getsize(path)
+            if size > max_bytes:
+                print(
+                    f"⚠️ Skipping {file}: {size / 1e6:.1f} MB is over the "
+                    f"{max_bytes / 1e6:.1f} MB limit (MAX_ASSET_BYTES)."
+                )
+                continue
+            with timed(f"read_{kind}", file):
+                digest, problem = _scan(path)
+            if problem is not None:
+                print(f"⚠️ Skipping {file}: {problem}.")
+                continue
+            yield Asset(path, file, size, digest)
+
+
+class AssetFiles(Mapping):
+    """Filename -> text of a set of assets, read from disk on access.
+
+    Works wherever the pipeline expects a dict of files. `transform`, if
+    given, is applied to the text (e.g. minification). Recently used texts
+    are kept up to `keep` characters in total, so repeated access is cheap
+    but memory stays bounded however large the site is.
+    """
+
+    def __init__(self, assets, transform=None, keep: int = ASSET_TEXT_CACHE):
+        self.assets = {}
+        for asset in assets:
+            # Files are known by name; the first of two with the same name wins
+            self.assets.setdefault(asset.name, asset)
+        self.transform = transform
+        self.keep = keep
+        self.texts = OrderedDict()
+        self.kept = 0
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> str:
+        asset = self.assets[name]
+        with self.lock:
+            if name in self.texts:
+                self.texts.move_to_end(name)
+                return self.texts[name]
+        text = asset.text
+        if self.transform is not None:
+            text = self.transform(text)
+        with self.lock:
+            if name not in self.texts:
+                self.texts[name] = text
+                self.kept += len(text)
+            while self.kept > self.keep and len(self.texts) > 1:
+                self.kept -= len(self.texts.popitem(last=False)[1])
+        return text
+
+    def __iter__(self):
+        return iter(self.assets)
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    def derive(self, transform) -> "AssetFiles":
+        """The same assets with `transform` applied on top of this one's."""
+        inner = self.transform
+        return AssetFiles(
+            self.assets.values(),
+            transform if inner is None else (lambda text: transform(inner(text))),
+            self.keep,
+        )
+
+    def only(self, names) -> "AssetFiles":
+        """The same view limited to `names`."""
+        names = set(names)
+        return AssetFiles(
+            [asset for name, asset in self.assets.items() if name in names],
+            self.transform,
+            self.keep,
+        )
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(asset.size for asset in self.assets.values())
+
+
+def read_assets(directory: str, suffix: str) -> AssetFiles:
+    return AssetFiles(iter_assets(directory, suffix))
@@ -0,0 +1,92 @@
+"""Audit and correct SITE_DIR (before/) into OUTPUT_DIR (after/).
+
+    python audit.py                      every stage
+    python audit.py analyze              find issues
+    python audit.py caption              caption images and set alt text
+    python audit.py correct --only css   correct the stylesheets again
+    python audit.py verify --only css js
+
+A command runs its own stages and reads whatever else they need (issues,
+captions, corrected files) from earlier runs of the same site. Arguments
+are parsed before the pipeline is imported, and each stage imports its
+agents when it runs, so `--help` and small partial runs start quickly.
+"""
+
+import argparse
+import sys
+
+# Kept in step with orchestrator.COMMANDS and KINDS, which aren't imported
+# until the arguments are known to be valid
+COMMANDS = ("analyze", "caption", "correct", "verify")
+KINDS = ("html", "css", "js")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]),
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=COMMANDS,
+        help="stages to run (default: the whole audit)",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=KINDS,
+        default=KINDS,
+        metavar="KIND",
+        help="work on these kinds of file only: html, css and/or js",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record per-stage wall/CPU time, peak memory and per-file timings "
+        "under outputs/profiles/<run id>/ (stages run one at a time)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="with --profile, also write a cProfile dump per stage",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="send LLM requests as batch jobs (LLM_BATCH_PROVIDER) and resume "
+        "stages as results arrive; state is kept in outputs/batches/",
+    )
+    args = parser.parse_args(argv)
+    if args.command == "caption" and "html" not in args.only:
+        parser.error("caption works on HTML only; drop --only or include html")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    import orchestrator
+    from llm_client import CASSETTE
+
+    results = orchestrator.run_audit(
+        args.batch, args.profile, args.cprofile, args.command, args.only
+    )
+    if CASSETTE is not None and CASSETTE.misses:
+        print(f"\n📼 {len(CASSETTE.misses)} requests were not in {CASSETTE.path}.")
+        if CASSETTE.strict:
+            # Misses failed their stages; the run fails even if none was required
+            return 1
+    if all(result.status == "ok" for result in results.values()):
+        print("\n🎉 All steps completed successfully!")
+        return 0
+    print("\n⚠️ Pipeline finished with failed or skipped stages.")
+    # Skipped stages follow from a failure upstream, or from a batch that
+    # is still waiting, which a later run resumes
+    failed = any(r.status in ("failed", "timeout") for r in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
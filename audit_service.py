@@ -0,0 +1,278 @@
+"""HTTP service that audits sites from a persistent job queue.
+
+    POST /audits                        {"url": ...} or a multipart "bundle"
+                                        (.zip/.tar.gz of index.html, css/, js/,
+                                        images/); returns the job id
+    GET  /audits/<id>                   job status and stage results
+    GET  /audits/<id>/artifacts         files the job produced
+    GET  /audits/<id>/artifacts/<path>  one of those files
+    GET  /health                        queue counts and worker liveness
+
+Jobs are run by a fixed pool of worker processes. Each worker imports the
+pipeline once and keeps its backends, clients and cassette between jobs,
+so a job pays only for its own work.
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tarfile
+import threading
+import time
+import traceback
+import zipfile
+
+from flask import Flask, abort, jsonify, request, send_from_directory
+
+from job_queue import Heartbeat, JobQueue, QueueFull
+
+# Where the queue, the issue database and each job's files live
+AUDIT_DIR = os.getenv("AUDIT_DIR", "service")
+AUDIT_WORKERS = int(os.getenv("AUDIT_WORKERS", "2"))
+# Submissions are refused with 503 while this many jobs are waiting
+AUDIT_MAX_QUEUED = int(os.getenv("AUDIT_MAX_QUEUED", "100"))
+# Largest request body accepted, in bytes; bigger uploads get a 413
+AUDIT_MAX_UPLOAD = int(os.getenv("AUDIT_MAX_UPLOAD", str(100 * 1024 * 1024)))
+# Seconds an idle worker waits before checking the queue again
+AUDIT_POLL = float(os.getenv("AUDIT_POLL", "1"))
+# Exit code of a worker that stopped because its job was taken over
+LEASE_LOST_EXIT = 3
+
+
+def job_dir(job_id: str) -> str:
+    return os.path.join(AUDIT_DIR, "jobs", job_id)
+
+
+def unpack_bundle(path: str, site_dir: str):
+    # Refuses members that would land outside site_dir
+    root = os.path.realpath(site_dir)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as bundle:
+            for name in bundle.namelist():
+                target = os.path.realpath(os.path.join(root, name))
+                if os.path.commonpath([root, target]) != root:
+                    raise ValueError(f"Unsafe path in bundle: {name}")
+            bundle.extractall(root)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as bundle:
+            bundle.extractall(root, filter="data")
+    else:
+        raise ValueError("Bundle is neither a zip nor a tar archive")
+    # Accept bundles with everything inside a single top-level folder
+    entries = os.listdir(root)
+    if "index.html" not in entries and len(entries) == 1:
+        inner = os.path.join(root, entries[0])
+        if os.path.isdir(inner):
+            for name in os.listdir(inner):
+                shutil.move(os.path.join(inner, name), root)
+            os.rmdir(inner)
+    if not os.path.exists(os.path.join(root, "index.html")):
+        raise ValueError("Bundle has no index.html")
+
+
+def prepare_site(job: dict, site_dir: str):
+    os.makedirs(site_dir, exist_ok=True)
+    payload = job["payload"]
+    if payload.get("url"):
+        from temp.get_website_code import process_website_assets
+
+        process_website_assets(payload["url"], site_dir)
+    else:
+        unpack_bundle(payload["bundle"], site_dir)
+
+
+def run_job(job: dict) -> dict:
+    import orchestrator
+
+    directory = job_dir(job["id"])
+    site_dir = os.path.join(directory, "site")
+    # Drop whatever an earlier, abandoned attempt left behind
+    for name in ("after", "outputs"):
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    prepare_site(job, site_dir)
+    return orchestrator.audit_site(
+        site_dir,
+        os.path.join(directory, "after"),
+        os.path.join(directory, "outputs"),
+        run_id=f"{time.strftime('%Y%m%d-%H%M%S')}-{job['id']}-{job['attempts']}",
+    )
+
+
+def abandon_job(job_id: str):
+    # The pipeline's threads can't be interrupted, so the process exits and
+    # the pool starts a fresh worker in its place
+    print(
+        f"⚠️ Lost the lease on job {job_id}; another worker has it. Exiting.",
+        file=sys.__stderr__,
+        flush=True,
+    )
+    os._exit(LEASE_LOST_EXIT)
+
+
+def worker_main(name: str):
+    # Point the pipeline's shared files at the service directory before it
+    # is imported
+    os.environ.setdefault("ISSUE_DB", os.path.join(AUDIT_DIR, "issues.db"))
+    import orchestrator  # noqa: F401  (imported once, warm for every job)
+
+    queue = JobQueue(os.path.join(AUDIT_DIR, "jobs.db"))
+    while True:
+        job = queue.claim(name)
+        if job is None:
+            time.sleep(AUDIT_POLL)
+            continue
+        directory = job_dir(job["id"])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "log.txt"), "w", encoding="utf-8") as log:
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                try:
+                    with Heartbeat(
+                        queue, job["id"], name, on_lost=lambda: abandon_job(job["id"])
+                    ) as heartbeat:
+                        result = run_job(job)
+                except Exception as e:
+                    traceback.print_exc()
+                    queue.finish(
+                        job["id"],
+                        "failed",
+                        error=f"{type(e).__name__}: {e}",
+                        worker=name,
+                    )
+                    continue
+        if heartbeat.lost:
+            continue
+        failed = [
+            stage
+            for stage, report in result["stages"].items()
+            if report["status"] != "ok"
+        ]
+        queue.finish(
+            job["id"],
+            "failed" if failed else "done",
+            error=f"stages not ok: {', '.join(failed)}" if failed else None,
+            result=result,
+            worker=name,
+        )
+
+
+class WorkerPool:
+    """A fixed number of worker processes; dead ones are replaced."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = {}
+
+    def start(self):
+        for n in range(self.size):
+            self._spawn(f"worker-{n}")
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _spawn(self, name: str):
+        process = self.context.Process(target=worker_main, args=(name,), daemon=True)
+        process.start()
+        self.workers[name] = process
+
+    def _watch(self):
+        while True:
+            time.sleep(5)
+            for name, process in list(self.workers.items()):
+                if not process.is_alive():
+                    print(f"⚠️ {name} exited ({process.exitcode}); restarting it.")
+                    self._spawn(name)
+
+    def alive(self) -> dict[str, bool]:
+        return {name: p.is_alive() for name, p in self.workers.items()}
+
+
+def create_app(queue: JobQueue, pool: WorkerPool | None = None) -> Flask:
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = AUDIT_MAX_UPLOAD
+
+    def get_job(job_id: str) -> dict:
+        job = queue.get(job_id)
+        if job is None:
+            abort(404)
+        return job
+
+    @app.post("/audits")
+    def submit():
+        payload = {}
+        upload = request.files.get("bundle")
+        if upload is not None:
+            os.makedirs(os.path.join(AUDIT_DIR, "uploads"), exist_ok=True)
+            path = os.path.join(
+                AUDIT_DIR, "uploads", f"{time.time_ns()}-{os.getpid()}.bundle"
+            )
+            upload.save(path)
+            payload["bundle"] = os.path.abspath(path)
+        else:
+            body = request.get_json(silent=True) or {}
+            if not body.get("url"):
+                return jsonify(error="expected a JSON url or a bundle upload"), 400
+            payload["url"] = body["url"]
+        try:
+            job_id = queue.submit(payload)
+        except QueueFull as e:
+            return jsonify(error=str(e)), 503
+        return jsonify(id=job_id, status="queued"), 202
+
+    @app.get("/audits/<job_id>")
+    def status(job_id):
+        return jsonify(get_job(job_id))
+
+    @app.get("/audits/<job_id>/artifacts")
+    def artifacts(job_id):
+        get_job(job_id)
+        directory = job_dir(job_id)
+        found = []
+        for sub in ("after", "outputs"):
+            for root, _, files in os.walk(os.path.join(directory, sub)):
+                found += [
+                    os.path.relpath(os.path.join(root, name), directory)
+                    for name in files
+                ]
+        if os.path.exists(os.path.join(directory, "log.txt")):
+            found.append("log.txt")
+        return jsonify(sorted(found))
+
+    @app.get("/audits/<job_id>/artifacts/<path:name>")
+    def artifact(job_id, name):
+        get_job(job_id)
+        if name != "log.txt" and name.split("/", 1)[0] not in ("after", "outputs"):
+            abort(404)
+        return send_from_directory(os.path.abspath(job_dir(job_id)), name)
+
+    @app.get("/health")
+    def health():
+        return jsonify(
+            jobs=queue.counts(), workers=pool.alive() if pool is not None else {}
+        )
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=AUDIT_WORKERS)
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(os.path.join(AUDIT_DIR, "jobs.db"), max_queued=AUDIT_MAX_QUEUED)
+    requeued = queue.requeue_running()
+    if requeued:
+        print(f"🔁 Requeued {requeued} jobs left running by the last process.")
+    pool = WorkerPool(args.workers)
+    pool.start()
+    print(
+        f"🚀 Audit service on http://{args.host}:{args.port} ({args.workers} workers)"
+    )
+    create_app(queue, pool).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import json
+import os
+import threading
+import time
+
+from openai import OpenAI
+from openai.types.chat import ChatCompletion
+
+from cassette import Cassette
+
+# Offline batch mode. Requests are not sent one by one: chat_completion queues
+# them here and defers the stage. Between pipeline rounds the queue is written
+# as a JSONL file in the provider's batch-request format, submitted, polled,
+# and the results are stored by request fingerprint so the next round gets
+# its answers immediately. State lives on disk, so an interrupted run picks
+# up its outstanding batches when restarted.
+#
+#   LLM_BATCH_PROVIDER  "openai" (Batch API) or "local" (stand-in that sends
+#                       each line to the backend's chat endpoint itself)
+#   LLM_BATCH_POLL      seconds between status checks (default 30)
+#   LLM_BATCH_ATTEMPTS  batches a request may fail in before its stage gets
+#                       the error (default 3)
+BATCH_PROVIDER = os.getenv("LLM_BATCH_PROVIDER", "openai")
+POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL", "30"))
+MAX_ATTEMPTS = int(os.getenv("LLM_BATCH_ATTEMPTS", "3"))
+# Provider limit on requests per batch file
+MAX_REQUESTS = 50_000
+ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRequestFailed(Exception):
+    pass
+
+
+def _read_jsonl(text: str) -> list[dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class OpenAIBatchProvider:
+    name = "openai"
+
+    def __init__(self, client: OpenAI):
+        self.client = client
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> tuple[str, list[dict] | None]:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in FINAL_STATUSES:
+            return batch.status, None
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(_read_jsonl(self.client.files.content(file_id).text))
+        return batch.status, lines
+
+
+class LocalBatchProvider:
+    """Stand-in for a batch API: works through the JSONL file on a thread.
+
+    Each line's body is sent to the backend's chat endpoint (e.g. the fake
+    server in benchmarks/) and the output file uses the provider's format.
+    """
+
+    name = "local"
+    _running = {}  # batch id -> thread
+
+    def __init__(self, client: OpenAI):
+        self.client = client
+
+    def submit(self, path: str) -> str:
+        batch_id = "local-" + os.path.splitext(os.path.basename(path))[0]
+        thread = threading.Thread(target=self._process, args=(path,), daemon=True)
+        LocalBatchProvider._running[batch_id] = (thread, path)
+        thread.start()
+        return batch_id
+
+    def _process(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            requests = _read_jsonl(f.read())
+        out = []
+        for i, request in enumerate(requests):
+            line = {"id": f"batch_req_{i}", "custom_id": request["custom_id"]}
+            try:
+                response = self.client.chat.completions.create(**request["body"])
+                line["response"] = {
+                    "status_code": 200,
+                    "body": response.model_dump(mode="json"),
+                }
+                line["error"] = None
+            except Exception as e:
+                line["response"] = None
+                line["error"] = {"code": type(e).__name__, "message": str(e)}
+            out.append(json.dumps(line))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(out) + "\n")
+        os.replace(path + ".tmp", path[: -len(".jsonl")] + ".output.jsonl")
+
+    def poll(self, batch_id: str) -> tuple[str, list[dict] | None]:
+        running = LocalBatchProvider._running.get(batch_id)
+        if running is None:
+            return "expired", None  # lost with the process that ran it
+        thread, path = running
+        if thread.is_alive():
+            return "in_progress", None
+        with open(path[: -len(".jsonl")] + ".output.jsonl", "r", encoding="utf-8") as f:
+            return "completed", _read_jsonl(f.read())
+
+
+PROVIDERS = {"openai": OpenAIBatchProvider, "local": LocalBatchProvider}
+
+
+class BatchQueue:
+    def __init__(self, directory: str, provider: str = BATCH_PROVIDER):
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown batch provider: {provider}")
+        self.directory = directory
+        self.provider = provider
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.state_path = os.path.join(directory, "state.json")
+        self.results = Cassette(os.path.join(directory, "results.jsonl"), "replay")
+        self.state = {"batches": [], "errors": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        self.state.setdefault("attempts", {})  # fingerprint -> batches sent in
+        self.pending = {}  # client key -> {"client", "requests": {fingerprint: line}}
+
+    def _save_state(self):
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def lookup(self, key: str, template: str | None):
+        """The stored response for a request, or None if it has to be queued.
+
+        A request that failed in a batch is queued again (most failures are
+        rate limits and server errors) until it has been sent MAX_ATTEMPTS
+        times; after that its error is raised.
+        """
+        with self.lock:
+            error = self.state["errors"].get(key)
+            if error is not None:
+                if self.state["attempts"].get(key, 1) >= MAX_ATTEMPTS:
+                    raise BatchRequestFailed(error)
+                del self.state["errors"][key]
+                return None
+        return self.results.replay(key, template)
+
+    def enqueue(self, client, key: str, body: dict, stage: str | None, template):
+        # Backends wrap an OpenAI client; batches are grouped per endpoint,
+        # key and model, since a batch file may only target one model
+        raw = getattr(client, "client", client)
+        api_key_env = getattr(client, "api_key_env", "OPENAI_API_KEY")
+        group = (str(raw.base_url), api_key_env, body["model"])
+        with self.lock:
+            entry = self.pending.setdefault(group, {"client": raw, "requests": {}})
+            entry["requests"].setdefault(
+                key, {"stage": stage or "unstaged", "template": template, "body": body}
+            )
+
+    def _write(self, requests: dict) -> tuple[str, dict]:
+        name = f"batch-{time.strftime('%Y%m%d-%H%M%S')}-{len(self.state['batches'])}"
+        path = os.path.join(self.directory, name + ".jsonl")
+        index = {}
+        with open(path, "w", encoding="utf-8") as f:
+            for n, (key, request) in enumerate(requests.items()):
+                # custom_id names the stage the answer goes back to
+                custom_id = f"{request['stage']}-{n}"
+                index[custom_id] = {
+                    "fingerprint": key,
+                    "stage": request["stage"],
+                    "template": request["template"],
+                }
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": ENDPOINT,
+                    "body": request["body"],
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return path, index
+
+    def submit(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for group, entry in pending.items():
+            items = list(entry["requests"].items())
+            for start in range(0, len(items), MAX_REQUESTS):
+                path, index = self._write(dict(items[start : start + MAX_REQUESTS]))
+                for request in index.values():
+                    key = request["fingerprint"]
+                    self.state["attempts"][key] = self.state["attempts"].get(key, 0) + 1
+                provider = PROVIDERS[self.provider](entry["client"])
+                batch_id = provider.submit(path)
+                self.state["batches"].append(
+                    {
+                        "id": batch_id,
+                        "provider": self.provider,
+                        "base_url": group[0],
+                        "api_key_env": group[1],
+                        "input": path,
+                        "requests": index,
+                        "status": "submitted",
+                    }
+                )
+                self._save_state()
+                stages = sorted({r["stage"] for r in index.values()})
+                print(
+                    f"📤 Submitted batch {batch_id}: {len(index)} requests "
+                    f"for {', '.join(stages)}"
+                )
+
+    def _collect(self, batch: dict, lines: list[dict]):
+        answered = 0
+        for line in lines:
+            request = batch["requests"].get(line.get("custom_id"))
+            if request is None:
+                continue
+            response = line.get("response") or {}
+            if response.get("status_code") == 200:
+                completion = ChatCompletion.model_validate(response["body"])
+                self.results.record(
+                    request["fingerprint"], request["template"], completion, 0.0
+                )
+                answered += 1
+            else:
+                error = line.get("error") or response.get("body") or {}
+                self.state["errors"][
+                    request["fingerprint"]
+                ] = f"Batch request {line['custom_id']} failed: {error}"
+        missing = len(batch["requests"]) - answered
+        print(
+            f"📥 Batch {batch['id']} {batch['status']}: {answered} answered"
+            + (f", {missing} failed" if missing else "")
+        )
+
+    def wait(self):
+        """Submit queued requests and block until every open batch is done."""
+        self.submit()
+        while True:
+            open_batches = [
+                b for b in self.state["batches"] if b["status"] not in FINAL_STATUSES
+            ]
+            if not open_batches:
+                return
+            for batch in open_batches:
+                client = OpenAI(
+                    api_key=os.getenv(batch["api_key_env"]) or "unused",
+                    base_url=batch["base_url"],
+                )
+                provider = PROVIDERS[batch["provider"]](client)
+                status, lines = provider.poll(batch["id"])
+                if status in FINAL_STATUSES:
+                    batch["status"] = status
+                    self._collect(batch, lines or [])
+                    self._save_state()
+            if any(b["status"] not in FINAL_STATUSES for b in open_batches):
+                time.sleep(POLL_INTERVAL)
@@ -0,0 +1,239 @@
+"""A local OpenAI-compatible chat completions server for benchmarks.
+
+Answers are cheap heuristics shaped like what each prompt template asks for
+(Python lists of issues, dictionaries of corrected files, HTML fragments,
+captions), so the whole pipeline runs end to end. Response time is simulated
+from a fixed latency plus prefill and decode token rates.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_FILE_MARKER = re.compile(r"^(?:/\* FILE: (.+?) \*/|// FILE: (.+?))$", re.M)
+_IMG = re.compile(r"<img\b[^>]*>", re.I)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "\n".join(
+        part.get("text", "") for part in content if part.get("type") == "text"
+    )
+
+
+def _payload(user: str, label: str) -> str:
+    index = user.rfind(label)
+    return user[index + len(label) :] if index >= 0 else ""
+
+
+def _split_files(code: str) -> dict[str, str]:
+    files, matches = {}, list(_FILE_MARKER.finditer(code))
+    for i, match in enumerate(matches):
+        name = match.group(1) or match.group(2)
+        name = re.sub(r" \(part \d+/\d+\)$", "", name)
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(code)
+        files[name] = files.get(name, "") + code[match.end() : end].strip("\n")
+    return files
+
+
+def html_issues(code: str) -> list[str]:
+    issues = []
+    if not re.search(r"<html\b[^>]*\blang=", code, re.I):
+        issues.append("Missing `lang` attribute on the <html> element.")
+    for tag in _IMG.findall(code):
+        if " alt=" not in tag:
+            src = re.search(r'src="([^"]+)"', tag)
+            issues.append(
+                f"Image element <img src=\"{src.group(1) if src else ''}\"> missing alt text."
+            )
+    for form in re.findall(r'<form id="([\w-]+)"', code):
+        issues.append(f"Input in form #{form} has no associated <label>.")
+    if "click here" in code:
+        issues.append("Link text 'click here' is not descriptive.")
+    return issues
+
+
+def css_issues(code: str) -> list[str]:
+    issues = []
+    for name, text in (_split_files(code) or {"": code}).items():
+        where = f" in {name}" if name else ""
+        for selector, body in re.findall(r"([^{}]+)\{([^}]*)\}", text):
+            selector = " ".join(selector.split()).split("*/")[-1].strip()
+            if re.search(r"outline\s*:\s*none", body):
+                issues.append(f"Focus outline removed for '{selector}'{where}.")
+            color = re.search(r"(?<!-)color\s*:\s*(#[0-9a-f]{3,6})", body, re.I)
+            if color and color.group(1).lower() in ("#ccc", "#aaa", "#999", "#e0e0e0"):
+                issues.append(
+                    f"Text color {color.group(1)} in '{selector}' has insufficient contrast{where}."
+                )
+    return issues
+
+
+def js_issues(code: str) -> list[str]:
+    issues = []
+    for name, text in (_split_files(code) or {"": code}).items():
+        where = f" in {name}" if name else ""
+        for element in re.findall(
+            r"getElementById\('([\w-]+)'\)\s*;?\s*\n?\s*\w*\.?addEventListener\('click'",
+            text,
+        ):
+            issues.append(
+                f"Element #{element} has a click handler without keyboard support{where}."
+            )
+        if "alert(" in text:
+            issues.append(f"alert() interrupts screen reader users{where}.")
+    return issues
+
+
+def fix_html(code: str) -> str:
+    return _IMG.sub(
+        lambda m: m.group(0) if " alt=" in m.group(0) else m.group(0)[:-1] + ' alt="">',
+        code,
+    )
+
+
+def answer(messages: list[dict]) -> str:
+    system = _text(messages[0]["content"]) if messages else ""
+    last = messages[-1]["content"] if messages else ""
+    user = _text(last)
+    if not isinstance(last, str):
+        return "A plain colored rectangle used as a placeholder photo."
+    if "Python list of strings" in user:
+        if "HTML Code:\n" in user:
+            found = html_issues(_payload(user, "HTML Code:\n"))
+        elif "CSS Code:\n" in user:
+            found = css_issues(_payload(user, "CSS Code:\n"))
+        else:
+            found = js_issues(_payload(user, "JavaScript Code:\n"))
+        return repr(found[:40])
+    if "Supported tools:" in user:
+        images = re.findall(r'src="([^"]+)"', _payload(user, "Accessibility Issues:\n"))
+        return repr({"image_captioning_tool": sorted(set(images))})
+    if "HTML Fragment:\n" in user:
+        return fix_html(_payload(user, "HTML Fragment:\n").rstrip("\n"))
+    if "HTML Code:\n" in user:
+        return fix_html(_payload(user, "HTML Code:\n").rstrip("\n"))
+    if "CSS Code:\n" in user:
+        files = _split_files(_payload(user, "CSS Code:\n"))
+        return repr(
+            {
+                name: re.sub(r"outline\s*:\s*none", "outline:2px solid #000", code)
+                for name, code in files.items()
+            }
+        )
+    if "JavaScript Code:\n" in user:
+        return repr(_split_files(_payload(user, "JavaScript Code:\n")))
+    return f"Unrecognized request ({system[:40]})"
+
+
+class FakeLLM:
+    def __init__(
+        self,
+        latency: float = 0.05,
+        prefill_tps: float = 50_000,
+        decode_tps: float = 1_000,
+    ):
+        self.latency = latency
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def complete(self, request: dict) -> dict:
+        messages = request.get("messages", [])
+        content = answer(messages)
+        prompt_tokens = sum(estimate_tokens(json.dumps(m["content"])) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        time.sleep(
+            self.latency
+            + prompt_tokens / self.prefill_tps
+            + completion_tokens / self.decode_tps
+        )
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            number = self.stats["requests"]
+        return {
+            "id": f"chatcmpl-bench-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+
+def make_handler(llm: FakeLLM):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with llm.lock:
+                    self._send(200, dict(llm.stats))
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            self._send(200, llm.complete(request))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(
+    llm: FakeLLM, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    """Serve `llm` on a background thread; the base URL is http://host:port/v1."""
+    server = ThreadingHTTPServer((host, port), make_handler(llm))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--prefill-tps", type=float, default=50_000)
+    parser.add_argument("--decode-tps", type=float, default=1_000)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port),
+        make_handler(FakeLLM(args.latency, args.prefill_tps, args.decode_tps)),
+    )
+    print(f"🧪 Fake LLM server on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,177 @@
+"""Generate a synthetic site in the layout the orchestrator audits.
+
+The pipeline audits a single index.html, so "pages" become top-level
+<section>s of that document, each with its own landmarks, images and forms.
+"""
+
+import argparse
+import os
+import random
+
+from PIL import Image
+
+COLORS = ["#777", "#999", "#aaa", "#ccc", "#333", "#0645ad", "#e0e0e0", "#fff"]
+WORDS = (
+    "access computing universal design students disability technology "
+    "resources program campus research outreach learning services"
+).split()
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def page_html(rng: random.Random, page: int, images: list[str]) -> str:
+    # Every page carries the same kinds of problems as the real fixture:
+    # images without alt, a click-only widget, an unlabeled input
+    figures = "\n".join(
+        f'      <div class="card card-{page}-{i}"><img src="images/{name}">'
+        f"<p>{_sentence(rng)}</p></div>"
+        for i, name in enumerate(images)
+    )
+    return f"""  <section id="page-{page}" class="page">
+    <div class="header header-{page}"><h3>{_sentence(rng, 4)}</h3></div>
+    <div class="menu" id="menu-{page}"><span class="menu-item" onclick="openMenu({page})">Menu</span>
+      <ul><li><a href="#page-{page}">click here</a></li><li><a href="#top">{rng.choice(WORDS)}</a></li></ul></div>
+    <div class="content">
+      <p>{_sentence(rng, 30)}</p>
+{figures}
+    </div>
+    <form id="form-{page}"><input type="text" id="name-{page}" placeholder="Name">
+      <div class="button" id="submit-{page}">Send</div></form>
+  </section>"""
+
+
+def css_file(rng: random.Random, index: int, rules: int, pages: int) -> str:
+    out = [f"/* Synthetic stylesheet {index} */"]
+    for i in range(rules):
+        page = rng.randrange(max(pages, 1))
+        selector = rng.choice(
+            [f".card-{page}-{i % 4}", f"#menu-{page} .menu-item", f".header-{page} h3",
+             f"#submit-{page}", f".page .content p:nth-child({i % 5 + 1})"]
+        )  # fmt: skip
+        decls = [
+            f"color: {rng.choice(COLORS)};",
+            f"background-color: {rng.choice(COLORS)};",
+            f"font-size: {rng.choice([9, 10, 11, 12, 14])}px;",
+        ]
+        if i % 7 == 0:
+            decls.append("outline: none;")
+        if i % 11 == 0:
+            decls.append("animation: blink 0.3s infinite;")
+        body = "\n".join(f"  {d}" for d in decls)
+        out.append(f"{selector} {{\n{body}\n}}")
+    return "\n\n".join(out) + "\n"
+
+
+def js_file(rng: random.Random, index: int, functions: int, pages: int) -> str:
+    out = [f"// Synthetic script {index}"]
+    for i in range(functions):
+        page = rng.randrange(max(pages, 1))
+        name = f"widget{index}_{i}"
+        out.append(
+            f"function {name}() {{\n"
+            f"  var el = document.getElementById('submit-{page}');\n"
+            f"  el.addEventListener('click', function () {{\n"
+            f"    document.getElementById('menu-{page}').style.display = 'block';\n"
+            f"    alert('{rng.choice(WORDS)} updated');\n"
+            f"  }});\n"
+            f"}}\n"
+        )
+    out.append(
+        "function openMenu(page) {\n  document.getElementById('menu-' + page).classList.toggle('open');\n}\n"
+    )
+    return "\n".join(out)
+
+
+def bundle_file(rng: random.Random, size: int) -> str:
+    # One long line, like a minified vendor library
+    parts = []
+    while sum(len(p) for p in parts) < size:
+        a, b = rng.randrange(10**6), rng.randrange(10**6)
+        parts.append(f"function f{a}(t){{return t*{b}+{a}}};var v{a}=f{a}({b});")
+    return "".join(parts) + "\n"
+
+
+def generate_site(
+    out_dir: str,
+    pages: int = 1,
+    css_files: int = 3,
+    css_rules: int = 40,
+    js_files: int = 3,
+    js_functions: int = 10,
+    images: int = 4,
+    bundles: int = 1,
+    bundle_size: int = 90_000,
+    seed: int = 0,
+) -> dict:
+    """Write index.html, css/, js/ and images/ under `out_dir`; returns its stats."""
+    rng = random.Random(seed)
+    for sub in ("css", "js", "images"):
+        os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+
+    names = [f"bench.example.org_images_photo{i}.png" for i in range(images)]
+    for i, name in enumerate(names):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new("RGB", (64, 48), color).save(os.path.join(out_dir, "images", name))
+
+    css_names = [f"bench.example.org_styles_site-{i}.css" for i in range(css_files)]
+    js_names = [f"bench.example.org_scripts_site-{i}.js" for i in range(js_files)]
+    js_names += [f"cdn.example.org_libs_vendor{i}.min.js" for i in range(bundles)]
+    links = "\n".join(f'  <link rel="stylesheet" href="css/{n}">' for n in css_names)
+    scripts = "\n".join(f'  <script src="js/{n}"></script>' for n in js_names)
+
+    per_page = [names[i::pages] if names else [] for i in range(pages)]
+    body = "\n".join(page_html(rng, p, per_page[p]) for p in range(pages))
+    html = (
+        f'<!DOCTYPE html>\n<html>\n<head>\n  <meta charset="utf-8">\n'
+        f"  <title>Synthetic site</title>\n{links}\n</head>\n<body>\n"
+        f'<div id="top"></div>\n{body}\n{scripts}\n</body>\n</html>\n'
+    )
+    files = {"index.html": html}
+    for i, name in enumerate(css_names):
+        files[os.path.join("css", name)] = css_file(rng, i, css_rules, pages)
+    for i in range(js_files):
+        files[os.path.join("js", js_names[i])] = js_file(rng, i, js_functions, pages)
+    for i in range(bundles):
+        files[os.path.join("js", js_names[js_files + i])] = bundle_file(
+            rng, bundle_size
+        )
+
+    for rel, text in files.items():
+        with open(os.path.join(out_dir, rel), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    return {
+        "pages": pages,
+        "images": images,
+        "css_files": css_files,
+        "js_files": js_files + bundles,
+        "bytes": sum(len(text.encode("utf-8")) for text in files.values()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--css-files", type=int, default=3)
+    parser.add_argument("--css-rules", type=int, default=40)
+    parser.add_argument("--js-files", type=int, default=3)
+    parser.add_argument("--js-functions", type=int, default=10)
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--bundles", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    stats = generate_site(
+        args.out_dir,
+        pages=args.pages,
+        css_files=args.css_files,
+        css_rules=args.css_rules,
+        js_files=args.js_files,
+        js_functions=args.js_functions,
+        images=args.images,
+        bundles=args.bundles,
+        seed=args.seed,
+    )
+    print(f"✅ Generated {stats['bytes']} bytes of site in {args.out_dir}")
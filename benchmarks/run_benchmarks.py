@@ -0,0 +1,274 @@
+"""Run the full pipeline against synthetic sites of growing size.
+
+Each size gets a freshly generated site and its own after/ and outputs/
+directories. The orchestrator runs in a subprocess against the fake LLM
+server, so the numbers cover local work plus simulated model latency.
+Process startup (the CLI and a bare import of the pipeline, as service and
+fleet workers do) is timed on its own. Results are written as JSON; pass
+--compare to diff against an earlier run.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLM, start_server  # noqa: E402
+from generate_site import generate_site  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def site_config(size: int) -> dict:
+    # Everything grows with `size` except the number of vendor bundles
+    return {
+        "pages": size,
+        "css_files": 2 + size,
+        "css_rules": 30 * size,
+        "js_files": 2 + size,
+        "js_functions": 8 * size,
+        "images": 2 * size,
+        "bundles": 1,
+    }
+
+
+def run_orchestrator(
+    work_dir: str, base_url: str, args: list[str], max_batch_size: int = 1
+) -> dict:
+    backends = os.path.join(work_dir, "llm_backends.json")
+    with open(backends, "w", encoding="utf-8") as f:
+        json.dump({"default": {"max_batch_size": max_batch_size}}, f)
+    env = dict(
+        os.environ,
+        SITE_DIR=os.path.join(work_dir, "site"),
+        OUTPUT_DIR=os.path.join(work_dir, "after"),
+        OUTPUTS_DIR=os.path.join(work_dir, "outputs"),
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="benchmark",
+        LLM_CASSETTE_MODE="off",
+        LLM_BACKENDS=backends,
+    )
+    log_path = os.path.join(work_dir, "orchestrator.log")
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, "audit.py"), *args],
+            cwd=REPO_DIR,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    return {
+        "wall": wall,
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "cpu": usage.ru_utime + usage.ru_stime,
+        "max_rss_mb": usage.ru_maxrss / 1024,  # KiB on Linux
+        "log": log_path,
+    }
+
+
+def measure_startup(repeat: int = 5) -> dict:
+    # Median wall seconds per command; the interpreter alone is the floor
+    commands = {
+        "python": ["-c", "pass"],
+        "cli_help": [os.path.join(REPO_DIR, "audit.py"), "--help"],
+        "import_orchestrator": ["-c", "import orchestrator"],
+    }
+    with tempfile.TemporaryDirectory(prefix="a11y-startup-") as work_dir:
+        env = dict(os.environ, OUTPUTS_DIR=work_dir)
+        env.pop("ISSUE_DB", None)
+        startup = {}
+        for name, args in commands.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, *args],
+                    cwd=REPO_DIR,
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                )
+                times.append(time.perf_counter() - start)
+            startup[name] = statistics.median(times)
+    return startup
+
+
+def collect_outputs(outputs_dir: str) -> dict:
+    reports = sorted(glob.glob(os.path.join(outputs_dir, "metrics", "run_*.json")))
+    report = {}
+    if reports:
+        with open(reports[-1], "r", encoding="utf-8") as f:
+            report = json.load(f)
+    issues = {}
+    for path in glob.glob(
+        os.path.join(outputs_dir, "issues", "accessibility_issues_*.json")
+    ):
+        category = os.path.basename(path)[len("accessibility_issues_") : -len(".json")]
+        with open(path, "r", encoding="utf-8") as f:
+            issues[category] = len(json.load(f))
+    return {
+        "stages": report.get("pipeline", {}),
+        "llm": report.get("run", {}),
+        "issues": issues,
+    }
+
+
+def run_size(
+    size: int, server, llm: FakeLLM, keep: bool, max_batch_size: int = 1
+) -> dict:
+    work_dir = tempfile.mkdtemp(prefix=f"a11y-bench-{size}-")
+    config = site_config(size)
+    site = generate_site(os.path.join(work_dir, "site"), **config)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    with llm.lock:
+        before = dict(llm.stats)
+    process = run_orchestrator(work_dir, base_url, [], max_batch_size)
+    with llm.lock:
+        server_stats = {key: llm.stats[key] - before[key] for key in before}
+    outputs = collect_outputs(os.path.join(work_dir, "outputs"))
+
+    result = {
+        "size": size,
+        "site": site,
+        "process": process,
+        "server": server_stats,
+        **outputs,
+        "throughput": {
+            "bytes_per_second": site["bytes"] / process["wall"],
+            "files_per_second": (1 + site["css_files"] + site["js_files"])
+            / process["wall"],
+            "requests_per_second": server_stats["requests"] / process["wall"],
+        },
+    }
+    result["work_dir"] = work_dir if keep else None
+    if not keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list[str]:
+    # Slower-than-threshold sizes, by end-to-end wall time
+    old = {run["size"]: run for run in previous.get("runs", [])}
+    regressions = []
+    for run in current["runs"]:
+        base = old.get(run["size"])
+        if base is None:
+            continue
+        change = run["process"]["wall"] / base["process"]["wall"] - 1
+        line = f"  size {run['size']:>3}: {base['process']['wall']:7.2f}s → {run['process']['wall']:7.2f}s ({change:+.0%})"
+        print(line)
+        if change > threshold:
+            regressions.append(line.strip())
+    before, after = previous.get("startup", {}), current.get("startup", {})
+    for name in after:
+        if name == "python" or name not in before:
+            continue
+        change = after[name] / before[name] - 1
+        line = f"  {name}: {before[name]:.3f}s → {after[name]:.3f}s ({change:+.0%})"
+        print(line)
+        if change > threshold:
+            regressions.append(line.strip())
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,4,16", help="comma-separated site sizes")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="fixed seconds per request"
+    )
+    parser.add_argument("--prefill-tps", type=float, default=50_000)
+    parser.add_argument("--decode-tps", type=float, default=1_000)
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="results file (default: benchmarks/results/<time>.json)",
+    )
+    parser.add_argument(
+        "--compare", default=None, help="earlier results file to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="slowdown that counts as a regression",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=1,
+        help="micro-batch size for every agent backend (see llm_backends.py)",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the generated sites and outputs"
+    )
+    args = parser.parse_args(argv)
+
+    llm = FakeLLM(args.latency, args.prefill_tps, args.decode_tps)
+    server = start_server(llm)
+    results = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "server": {
+            "latency": args.latency,
+            "prefill_tps": args.prefill_tps,
+            "decode_tps": args.decode_tps,
+        },
+        "max_batch_size": args.max_batch_size,
+        "runs": [],
+    }
+    print("🏁 Startup...", flush=True)
+    results["startup"] = measure_startup()
+    print(
+        "   "
+        + "  ".join(f"{name} {wall:.3f}s" for name, wall in results["startup"].items())
+    )
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            print(f"🏁 Size {size}...", flush=True)
+            run = run_size(size, server, llm, args.keep, args.max_batch_size)
+            results["runs"].append(run)
+            stages = ", ".join(
+                f"{name} {s['duration']:.1f}s" for name, s in run["stages"].items()
+            )
+            print(
+                f"   {run['site']['bytes']:>9} bytes  {run['process']['wall']:7.2f}s  "
+                f"{run['server']['requests']:>4} requests  {run['process']['max_rss_mb']:.0f} MiB"
+                f"{'' if run['process']['exit_code'] == 0 else '  (FAILED)'}\n   {stages}"
+            )
+    finally:
+        server.shutdown()
+
+    output = args.output or os.path.join(
+        REPO_DIR, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"⚠️ {len(regressions)} regressions over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Record/replay of LLM traffic at the chat_completion boundary.
+#
+#   LLM_CASSETTE_MODE=record  call the API and store every response
+#   LLM_CASSETTE_MODE=replay  serve stored responses; misses go to the API and
+#                             are added to the cassette unless LLM_CASSETTE_STRICT=1
+#   LLM_CASSETTE              cassette file (JSON lines)
+#   LLM_REPLAY_LATENCY        "recorded" to sleep as long as the original call
+#                             took, or a fixed number of seconds (default 0)
+#
+# Replay never contacts the API, so it needs no API key.
+MODES = ("off", "record", "replay")
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def fingerprint(model: str, messages: list, kwargs: dict) -> str:
+    # Canonical JSON of everything that affects the answer; image payloads of
+    # vision requests are part of the messages and are hashed with them
+    payload = json.dumps(
+        {"model": model, "messages": messages, "kwargs": kwargs},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, strict: bool = False, latency: str = "0"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.strict = strict
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.entries = {}  # fingerprint -> [entry, ...] in recording order
+        self.served = {}  # fingerprint -> entries served so far
+        self.misses = []
+        # A recording starts from scratch, but only once it has something to
+        # keep: a run that makes no calls leaves the old cassette alone
+        self.truncate = mode == "record"
+        if mode == "replay" and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["fingerprint"], []).append(entry)
+
+    @classmethod
+    def from_env(cls) -> "Cassette | None":
+        mode = os.getenv("LLM_CASSETTE_MODE", "off")
+        if mode == "off":
+            return None
+        return cls(
+            os.getenv("LLM_CASSETTE", "outputs/cassettes/llm.jsonl"),
+            mode,
+            strict=os.getenv("LLM_CASSETTE_STRICT", "0") == "1",
+            latency=os.getenv("LLM_REPLAY_LATENCY", "0"),
+        )
+
+    def replay(self, key: str, template: str | None):
+        """The stored response for `key`, or None when it should go live."""
+        if self.mode != "replay":
+            return None
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.misses.append(template or key)
+                if self.strict:
+                    raise CassetteMiss(
+                        f"No recorded response for {template or 'request'} ({key[:12]})"
+                    )
+                return None
+            # Identical requests are answered in recording order; the last
+            # answer repeats once they run out
+            index = self.served.get(key, 0)
+            self.served[key] = index + 1
+            entry = entries[min(index, len(entries) - 1)]
+
+        if self.latency == "recorded":
+            time.sleep(entry["latency"])
+        elif float(self.latency) > 0:
+            time.sleep(float(self.latency))
+        from openai.types.chat import ChatCompletion
+
+        return ChatCompletion.model_validate(entry["response"])
+
+    def record(self, key: str, template: str | None, response, latency: float):
+        if self.mode == "off":
+            return
+        entry = {
+            "fingerprint": key,
+            "template": template,
+            "latency": latency,
+            "response": response.model_dump(mode="json"),
+        }
+        with self.lock:
+            self.entries.setdefault(key, []).append(entry)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w" if self.truncate else "a", encoding="utf-8") as f:
+                self.truncate = False
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
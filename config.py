@@ -0,0 +1,8 @@
+from dotenv import load_dotenv
+
+# Settings are read from the environment, and from a .env file in the
+# working directory for anything the environment doesn't set. Modules that
+# read settings at import time import this module first; being a module,
+# it loads the file once per process however many modules import it.
+
+load_dotenv()
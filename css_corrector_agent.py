@@ -1,25 +1,44 @@
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+import config  # noqa: F401  (loads .env first)
+from cassette import CassetteMiss
+from llm_backends import get_cascade
+from pipeline import has_deferred
+from prompt_templates import PROMPTS, bullet_list
+from issue_routing import correct_per_file
+from static_checks import validate_correction
+
+
+def parse_corrections(response_text: str):
+    # Remove ```python fences if present
+    if response_text.startswith("```python"):
+        response_text = response_text[len("```python") :].strip()
+    if response_text.endswith("```"):
+        response_text = response_text[:-3].strip()
+    # Safely evaluate the dictionary (no builtins for security)
+    return eval(response_text, {"__builtins__": None}, {})
 
 
 class BaseAgent:
-    def __init__(self, model: str = "gpt-4o-mini"):
-        self.model = model
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, model: str | None = None):
+        self.backend = get_cascade(type(self).__name__, model)
+        self.model = self.backend.model
 
-    def call_llm(self, messages: list) -> str:
+    def call_llm(
+        self, messages: list, template: str | None = None, validate=None
+    ) -> str:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = self.backend.complete(
+                messages,
+                validate=validate,
+                template=template,
+                agent=type(self).__name__,
                 temperature=0,
             )
             return response.choices[0].message.content
+        except CassetteMiss:
+            raise  # a strict replay fails the stage at the miss
         except Exception as e:
             print(f"❌ Error calling OpenAI API: {e}")
             return ""
@@ -27,19 +46,8 @@ class BaseAgent:
 
 class CssCorrectorAgent(BaseAgent):
     def build_prompt(self, css_code: str, issues: list[str]) -> str:
-        issues_text = "\n".join(f"- {issue}" for issue in issues)
-        return (
-            "You are an expert web developer specializing in CSS accessibility.\n\n"
-            "You will be given:\n"
-            "- A list of CSS accessibility issues.\n"
-            "- CSS code from one or more files (with filename markers).\n\n"
-            "**Your task:**\n"
-            "- Fix the accessibility issues *only* in the CSS.\n"
-            "- Keep unrelated styles unchanged.\n"
-            "- Return your answer strictly as a Python dictionary mapping each filename to its corrected CSS code.\n"
-            "- Do NOT return explanations, just the dictionary object.\n\n"
-            f"Accessibility Issues:\n{issues_text}\n\n"
-            f"CSS Code:\n{css_code}\n"
+        return PROMPTS["css_correction"].user_content(
+            issues=bullet_list(issues), code=css_code
         )
 
     def analyze_and_correct(
@@ -50,30 +58,18 @@ class CssCorrectorAgent(BaseAgent):
             f"/* FILE: {filename} */\n{code}" for filename, code in css_files.items()
         )
 
-        prompt = self.build_prompt(combined_code, issues)
-
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an expert in web accessibility and CSS.",
-            },
-            {
-                "role": "user",
-                "content": prompt,
-            },
-        ]
-
-        response_text = self.call_llm(messages)
-
-        # Remove ```python fences if present
-        if response_text.startswith("```python"):
-            response_text = response_text[len("```python") :].strip()
-        if response_text.endswith("```"):
-            response_text = response_text[:-3].strip()
+        template = PROMPTS["css_correction"]
+        messages = template.messages(issues=bullet_list(issues), code=combined_code)
+        response_text = self.call_llm(
+            messages,
+            template=template.key,
+            validate=lambda text: self.validate(text, css_files, issues),
+        )
+        if has_deferred():
+            return {}  # a batch placeholder; the stage reruns with the answer
 
         try:
-            # Safely evaluate the dictionary (no builtins for security)
-            corrected_dict = eval(response_text, {"__builtins__": None}, {})
+            corrected_dict = parse_corrections(response_text)
             if isinstance(corrected_dict, dict):
                 return {k: str(v) for k, v in corrected_dict.items()}
             else:
@@ -83,6 +79,42 @@ class CssCorrectorAgent(BaseAgent):
             print(f"❌ Error parsing response as dictionary: {e}")
             return {}
 
+    @staticmethod
+    def validate(
+        response_text: str, css_files: dict[str, str], issues: list[str]
+    ) -> list[str]:
+        # Problems that make the model cascade ask a stronger model
+        try:
+            corrected = parse_corrections(response_text)
+        except Exception as e:
+            return [f"unparseable response: {e}"]
+        if not isinstance(corrected, dict):
+            return ["response is not a dictionary"]
+        names = [name for name in corrected if name in css_files]
+        if not names:
+            return ["no corrected files in response"]
+        before = "\n".join(css_files[name] for name in names)
+        after = "\n".join(str(corrected[name]) for name in names)
+        return validate_correction(before, after, issues, "css")
+
+    def correct_files(
+        self,
+        css_files: dict[str, str],
+        issues: list[str],
+        max_workers: int = 4,
+        hints: dict[str, set[str]] | None = None,
+    ) -> dict[str, str]:
+        # One smaller request per file that has issues routed to it; `hints`
+        # are the files each issue was found in
+        return correct_per_file(
+            self.analyze_and_correct,
+            css_files,
+            issues,
+            "css",
+            max_workers=max_workers,
+            hints=hints,
+        )
+
 
 if __name__ == "__main__":
     css_dir = "before/css"
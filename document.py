@@ -0,0 +1,160 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, Tag
+
+# One parsed tree per distinct HTML text, shared by everything that reads
+# it: static rules, region splitting, alt text injection and verification
+# all ask document_for() and get the same Document back for the same text.
+# Trees are shared, so callers must not modify them.
+
+# "html.parser" (built in) or "lxml" (faster, if installed). lxml doesn't
+# record source positions, so with it the tree that offsets come from is
+# parsed separately, and only when asked for. bs4 itself is imported on the
+# first parse, so modules that only import this one stay cheap to load.
+HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+# Documents kept; pages, corrected pages and verified fragments of a run
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "64"))
+
+# Parsers that record sourceline/sourcepos on each tag
+_POSITIONED = {"html.parser", "html5lib"}
+
+
+def line_offsets_for(html: str) -> list[int]:
+    offsets = [0]
+    for match in re.finditer("\n", html):
+        offsets.append(match.end())
+    return offsets
+
+
+class Document:
+    """A parsed HTML page with indexes of its elements.
+
+    The tree and the indexes are built on first use. `by_tag`, `by_id`,
+    `by_class` and `by_role` map to elements in document order.
+    """
+
+    def __init__(self, source: str, parser: str = HTML_PARSER):
+        self.source = source
+        self.parser = parser
+        self.lock = threading.Lock()
+        self._soup = None
+        self._positioned = None
+        self._indexes = None
+        self._line_offsets = None
+
+    def _parse(self, parser: str) -> "BeautifulSoup":
+        from bs4 import BeautifulSoup
+        from bs4.exceptions import FeatureNotFound
+
+        try:
+            return BeautifulSoup(self.source, parser)
+        except FeatureNotFound:
+            print(f"⚠️ HTML parser {parser!r} is not installed; using html.parser.")
+            self.parser = "html.parser"
+            return BeautifulSoup(self.source, "html.parser")
+
+    @property
+    def soup(self) -> "BeautifulSoup":
+        with self.lock:
+            if self._soup is None:
+                self._soup = self._parse(self.parser)
+            return self._soup
+
+    @property
+    def positioned(self) -> "BeautifulSoup":
+        """A tree whose tags carry source positions (see start())."""
+        soup = self.soup
+        if self.parser in _POSITIONED:
+            return soup
+        with self.lock:
+            if self._positioned is None:
+                self._positioned = self._parse("html.parser")
+            return self._positioned
+
+    def _index(self) -> dict:
+        with self.lock:
+            if self._indexes is not None:
+                return self._indexes
+        elements = self.soup.find_all(True)
+        by_tag, by_id, by_class, by_role = {}, {}, {}, {}
+        for el in elements:
+            by_tag.setdefault(el.name, []).append(el)
+            if el.get("id"):
+                by_id.setdefault(el["id"], el)
+            for name in el.get("class", []):
+                by_class.setdefault(name, []).append(el)
+            if el.get("role"):
+                by_role.setdefault(el["role"], []).append(el)
+        indexes = {
+            "all": elements,
+            "tag": by_tag,
+            "id": by_id,
+            "class": by_class,
+            "role": by_role,
+        }
+        with self.lock:
+            self._indexes = indexes
+        return indexes
+
+    @property
+    def by_tag(self) -> dict[str, list["Tag"]]:
+        return self._index()["tag"]
+
+    @property
+    def by_id(self) -> dict[str, "Tag"]:
+        return self._index()["id"]
+
+    @property
+    def by_class(self) -> dict[str, list["Tag"]]:
+        return self._index()["class"]
+
+    @property
+    def by_role(self) -> dict[str, list["Tag"]]:
+        return self._index()["role"]
+
+    def tags(self, *names: str) -> list["Tag"]:
+        """Elements with any of these tag names, in document order."""
+        if len(names) == 1:
+            return self.by_tag.get(names[0], [])
+        return [el for el in self._index()["all"] if el.name in names]
+
+    @property
+    def line_offsets(self) -> list[int]:
+        if self._line_offsets is None:
+            self._line_offsets = line_offsets_for(self.source)
+        return self._line_offsets
+
+    def start(self, el: "Tag") -> int | None:
+        """Offset of `el`'s start tag in the source; `el` from `positioned`."""
+        if el.sourceline is None:
+            return None
+        return self.line_offsets[el.sourceline - 1] + el.sourcepos
+
+
+_documents = OrderedDict()  # (source, parser) -> Document, least recent first
+_lock = threading.Lock()
+
+
+def document_for(source: str, parser: str = HTML_PARSER) -> Document:
+    """The shared Document for `source`, parsed at most once while cached."""
+    key = (source, parser)
+    with _lock:
+        document = _documents.get(key)
+        if document is not None:
+            _documents.move_to_end(key)
+            return document
+        document = _documents[key] = Document(source, parser)
+        while len(_documents) > DOCUMENT_CACHE_SIZE:
+            _documents.popitem(last=False)
+        return document
+
+
+def clear_documents():
+    # Between sites audited by the same process
+    with _lock:
+        _documents.clear()
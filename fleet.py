@@ -0,0 +1,191 @@
+"""Audit many sites with worker processes that share a job queue.
+
+    python fleet.py enqueue sites/*          one job per site directory
+    python fleet.py work --workers 8         work until the queue is empty
+    python fleet.py status
+
+Run `work` on as many hosts as you like against the same FLEET_DIR on a
+shared filesystem (with SQLITE_JOURNAL_MODE=DELETE). A job is leased to one
+worker at a time and kept alive by heartbeats; if the worker dies, the lease
+runs out and another worker picks the job up. Each job builds its results in
+a private directory and moves them into place when it is done, so a retried
+or duplicated job leaves exactly one complete copy.
+
+A job is a whole site. The pipeline audits a single page per site, so page
+jobs would be the same jobs, and its stages share one process through the
+pipeline DAG. Splitting a site into stage jobs (analyze, caption, correct,
+verify, as audit.py can run them) would need jobs that wait for other jobs,
+which the queue doesn't support yet; that is left as follow-up work.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import time
+import traceback
+
+from job_queue import Heartbeat, JobQueue
+
+# Queue, issue database and per-site results
+FLEET_DIR = os.getenv("FLEET_DIR", "fleet")
+# Seconds an idle worker waits before checking the queue again
+FLEET_POLL = float(os.getenv("FLEET_POLL", "1"))
+
+
+def queue_path() -> str:
+    return os.path.join(FLEET_DIR, "queue.db")
+
+
+def site_key(site_dir: str) -> str:
+    # Readable and unique: two sites can share a directory name
+    path = os.path.realpath(site_dir)
+    digest = hashlib.sha1(path.encode()).hexdigest()[:8]
+    return f"{os.path.basename(path.rstrip(os.sep))}-{digest}"
+
+
+def enqueue(site_dirs: list[str], max_attempts: int = 3) -> int:
+    queue = JobQueue(queue_path())
+    before = sum(queue.counts().values())
+    for site_dir in site_dirs:
+        if not os.path.exists(os.path.join(site_dir, "index.html")):
+            print(f"⚠️ Skipping {site_dir}: no index.html")
+            continue
+        queue.submit(
+            {"site": os.path.realpath(site_dir)},
+            key=site_key(site_dir),
+            max_attempts=max_attempts,
+        )
+    added = sum(queue.counts().values()) - before
+    print(f"📥 Queued {added} new jobs ({len(site_dirs) - added} already known).")
+    return added
+
+
+def publish(work_dir: str, final_dir: str):
+    # Swap the finished results in; whichever copy lands last is complete
+    os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+    old = f"{final_dir}.old-{os.getpid()}"
+    if os.path.exists(final_dir):
+        os.rename(final_dir, old)
+    os.rename(work_dir, final_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def run_site_job(queue: JobQueue, job: dict, worker: str):
+    import orchestrator
+
+    key = job["key"]
+    final_dir = os.path.join(FLEET_DIR, "sites", key)
+    work_dir = os.path.join(FLEET_DIR, "work", f"{key}-{worker}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    with Heartbeat(queue, job["id"], worker) as heartbeat:
+        with open(os.path.join(work_dir, "log.txt"), "w", encoding="utf-8") as log:
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                try:
+                    result = orchestrator.audit_site(
+                        job["payload"]["site"],
+                        os.path.join(work_dir, "after"),
+                        os.path.join(work_dir, "outputs"),
+                        run_id=f"{time.strftime('%Y%m%d-%H%M%S')}-{job['id']}-{job['attempts']}",
+                    )
+                except Exception as e:
+                    traceback.print_exc()
+                    result, error = None, f"{type(e).__name__}: {e}"
+    if heartbeat.lost:
+        # Another worker took the job over; its copy is the one to keep
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+    if result is None:
+        queue.finish(job["id"], "failed", error=error, worker=worker)
+        return
+    publish(work_dir, final_dir)
+    failed = [name for name, s in result["stages"].items() if s["status"] != "ok"]
+    queue.finish(
+        job["id"],
+        "failed" if failed else "done",
+        error=f"stages not ok: {', '.join(failed)}" if failed else None,
+        result=result,
+        worker=worker,
+    )
+
+
+def worker_main(worker: str, until_empty: bool):
+    os.environ.setdefault("ISSUE_DB", os.path.join(FLEET_DIR, "issues.db"))
+    import orchestrator  # noqa: F401  (imported once, warm for every job)
+
+    queue = JobQueue(queue_path())
+    done = 0
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            counts = queue.counts()
+            # Running jobs may still come back if their worker dies
+            if until_empty and not counts["queued"] and not counts["running"]:
+                break
+            time.sleep(FLEET_POLL)
+            continue
+        print(f"🔧 {worker}: {job['key']} (attempt {job['attempts']})", flush=True)
+        run_site_job(queue, job, worker)
+        done += 1
+    print(f"✅ {worker}: {done} jobs", flush=True)
+
+
+def work(workers: int, until_empty: bool = True) -> float:
+    context = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    processes = [
+        context.Process(
+            target=worker_main, args=(f"{host}-{os.getpid()}-{n}", until_empty)
+        )
+        for n in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return time.perf_counter() - start
+
+
+def status():
+    queue = JobQueue(queue_path())
+    counts = queue.counts()
+    print("  ".join(f"{name} {count}" for name, count in counts.items()))
+    for job in queue.jobs("failed"):
+        print(f"  ❌ {job['key'] or job['id']}: {job['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("enqueue", help="queue one audit per site directory")
+    add.add_argument("sites", nargs="+")
+    add.add_argument("--max-attempts", type=int, default=3)
+    run = commands.add_parser("work", help="run worker processes")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    run.add_argument(
+        "--forever",
+        action="store_true",
+        help="keep polling when the queue is empty instead of exiting",
+    )
+    commands.add_parser("status", help="job counts and failures")
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        enqueue(args.sites, args.max_attempts)
+    elif args.command == "work":
+        wall = work(args.workers, until_empty=not args.forever)
+        print(f"⏱️ {args.workers} workers finished in {wall:.1f}s")
+        status()
+    else:
+        status()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,45 @@
 import os
 import json
 from typing import List, Dict
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# Load API key
-load_dotenv()
+import config  # noqa: F401  (loads .env first)
+from cassette import CassetteMiss
+from llm_backends import get_cascade
+from pipeline import has_deferred
+from prompt_templates import PROMPTS, bullet_list
 
 
-class BaseAgent:
-    def __init__(self, model: str = "gpt-4o-mini"):
-        self.model = model
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def parse_response(response_text: str):
+    # Clean up ```python fences if present
+    if response_text.startswith("```python"):
+        response_text = response_text[len("```python") :].strip()
+    if response_text.endswith("```"):
+        response_text = response_text[:-3].strip()
+    return eval(response_text, {"__builtins__": None}, {})
+
 
-    def call_llm(self, messages: List[Dict[str, str]]) -> str:
+class BaseAgent:
+    def __init__(self, model: str | None = None):
+        self.backend = get_cascade(type(self).__name__, model)
+        self.model = self.backend.model
+
+    def call_llm(
+        self,
+        messages: List[Dict[str, str]],
+        template: str | None = None,
+        validate=None,
+    ) -> str:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = self.backend.complete(
+                messages,
+                validate=validate,
+                template=template,
+                agent=type(self).__name__,
                 temperature=0,
             )
             return response.choices[0].message.content
+        except CassetteMiss:
+            raise  # a strict replay fails the stage at the miss
         except Exception as e:
             print(f"❌ Error calling OpenAI API: {e}")
             return ""
@@ -28,41 +47,19 @@ class BaseAgent:
 
 class ExternalToolRecommenderAgent(BaseAgent):
     def build_prompt(self, issues: List[str]) -> str:
-        issue_text = "\n".join(f"- {issue}" for issue in issues)
-        return (
-            "You are an expert accessibility engineer.\n"
-            "You are given a list of accessibility issues detected in HTML, CSS, or JavaScript files.\n"
-            "Your job is to recommend which external tools should be used based on the issues.\n\n"
-            "Supported tools:\n"
-            "- 'image_captioning_tool': Use if image alt attributes are missing or non-descriptive.\n"
-            "- 'video_transcription_tool': Use if video elements are missing captions.\n"
-            "- Other tools may be included if you can justify them based on accessibility needs.\n\n"
-            "Return your answer strictly as a Python dictionary in this format:\n"
-            "{\n"
-            "  'image_captioning_tool': ['img1.jpg', 'img2.png'],\n"
-            "  'video_transcription_tool': ['video1.mp4']\n"
-            "}\n"
-            "Use only the file name or relative path from the issue description if available.\n"
-            "If the file is not specified, write 'UNKNOWN'.\n\n"
-            f"Accessibility Issues:\n{issue_text}\n"
-        )
+        return PROMPTS["tool_recommendation"].user_content(issues=bullet_list(issues))
 
     def recommend_tools(self, issues: List[str]) -> Dict[str, List[str]]:
-        prompt = self.build_prompt(issues)
-        messages = [
-            {"role": "system", "content": "You are an expert accessibility engineer."},
-            {"role": "user", "content": prompt},
-        ]
-        response_text = self.call_llm(messages)
-
-        # Clean up ```python fences if present
-        if response_text.startswith("```python"):
-            response_text = response_text[len("```python") :].strip()
-        if response_text.endswith("```"):
-            response_text = response_text[:-3].strip()
+        template = PROMPTS["tool_recommendation"]
+        messages = template.messages(issues=bullet_list(issues))
+        response_text = self.call_llm(
+            messages, template=template.key, validate=self.validate
+        )
+        if has_deferred():
+            return {}  # a batch placeholder; the stage reruns with the answer
 
         try:
-            result = eval(response_text, {"__builtins__": None}, {})
+            result = parse_response(response_text)
             if isinstance(result, dict):
                 return {tool: list(map(str, files)) for tool, files in result.items()}
             else:
@@ -72,6 +69,16 @@ class ExternalToolRecommenderAgent(BaseAgent):
             print(f"❌ Error parsing response: {e}")
             return {}
 
+    @staticmethod
+    def validate(response_text: str) -> List[str]:
+        try:
+            result = parse_response(response_text)
+        except Exception as e:
+            return [f"unparseable response: {e}"]
+        if not isinstance(result, dict):
+            return ["response is not a dictionary"]
+        return []
+
 
 if __name__ == "__main__":
     issues_path = "accessibility_issues_html.json"
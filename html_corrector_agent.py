@@ -1,30 +1,119 @@
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 
-# Load environment variables from .env file
-load_dotenv()
+import config  # noqa: F401  (loads .env first)
+from cassette import CassetteMiss
+from html_regions import assign_issues, split_regions, splice_regions
+from prompt_minify import for_prompt
+from pipeline import has_deferred, with_stage
+from profiling import timed
+from llm_backends import get_cascade
+from prompt_templates import PROMPTS, bullet_list
+from static_checks import rules_for, validate_correction
 
 
 class BaseAgent:
-    def __init__(self, model: str = "gpt-4o-mini"):
-        self.model = model
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, model: str | None = None):
+        self.backend = get_cascade(type(self).__name__, model)
+        self.model = self.backend.model
 
-    def call_llm(self, messages: list) -> str:
+    def call_llm(
+        self, messages: list, template: str | None = None, validate=None
+    ) -> str:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = self.backend.complete(
+                messages,
+                validate=validate,
+                template=template,
+                agent=type(self).__name__,
                 temperature=0,
             )
             return response.choices[0].message.content
+        except CassetteMiss:
+            raise  # a strict replay fails the stage at the miss
         except Exception as e:
             print(f"Error calling OpenAI API: {e}")
             return ""
 
 
+def strip_html_fences(response_text: str) -> str:
+    # Remove code block fences if present
+    response_text = response_text.strip()
+    if response_text.startswith("```html"):
+        response_text = response_text[len("```html") :].strip()
+    if response_text.endswith("```"):
+        response_text = response_text[:-3].strip()
+    return response_text
+
+
+def is_alt_issue(issue: str) -> bool:
+    return "img_alt" in {rule.name for rule in rules_for(issue, "html")}
+
+
+def left_to_captions(issue: str, captioned: set[str]) -> bool:
+    # A missing-alt issue about an image that alt_text.py captions afterwards
+    text = issue.lower()
+    return is_alt_issue(issue) and any(
+        os.path.basename(path).lower() in text for path in captioned
+    )
+
+
+def prompt_fields(
+    code: str,
+    issues: list[str],
+    image_captions: dict[str, str],
+    captioned: set[str] = frozenset(),
+) -> dict[str, str]:
+    # `captioned` images get their alt text from alt_text.inject_alt_text
+    # after the correction; every other image is the model's to fix
+    captions_text = ""
+    if image_captions:
+        alt_guideline = "- Use provided image captions to add descriptive `alt` text where `<img>` is missing it.\n"
+        captions_text = "Image Captions:\n" + "\n".join(
+            f"{fname}: {caption}" for fname, caption in image_captions.items()
+        )
+        captions_text += "\n\n"
+    elif captioned:
+        names = ", ".join(sorted(os.path.basename(path) for path in captioned))
+        alt_guideline = (
+            f"- `alt` text of these images is filled in from captions afterwards; "
+            f"leave it alone: {names}. Add concise, descriptive `alt` text to any "
+            "other `<img>` missing it.\n"
+        )
+    else:
+        alt_guideline = (
+            "- Add concise, descriptive `alt` text to any `<img>` missing it.\n"
+        )
+    issues = [issue for issue in issues if not left_to_captions(issue, captioned)]
+    return {
+        "alt_guideline": alt_guideline,
+        "issues": bullet_list(issues),
+        "captions": captions_text,
+        "code": code,
+    }
+
+
+def region_problem(fragment: str, response_text: str) -> str | None:
+    # A fragment that lost its outer element (or got truncated) would corrupt
+    # the document when spliced back
+    tag = fragment[1:].split(None, 1)[0].rstrip(">").lower()
+    corrected = response_text.lower()
+    closing = f"</{tag}>" if fragment.rstrip().lower().endswith(f"</{tag}>") else ">"
+    if not corrected.startswith(f"<{tag}") or not corrected.endswith(closing):
+        return f"correction lost the <{tag}> element"
+    return None
+
+
+def checked_issues(
+    issues: list[str], image_captions: dict[str, str], captioned: set[str]
+) -> list[str]:
+    # Captioned images are still without alt text until alt_text.py runs
+    if image_captions or not captioned:
+        return issues
+    return [issue for issue in issues if not is_alt_issue(issue)]
+
+
 class HtmlCorrectorAgent(BaseAgent):
     def build_prompt(
         self,
@@ -32,28 +121,111 @@ class HtmlCorrectorAgent(BaseAgent):
         issues: list[str],
         image_captions: dict[str, str] = {},
     ) -> str:
-        issues_text = "\n".join(f"- {issue}" for issue in issues)
-        captions_text = (
-            "\n".join(
-                f"{fname}: {caption}" for fname, caption in image_captions.items()
+        return PROMPTS["html_correction"].user_content(
+            **prompt_fields(html_code, issues, image_captions)
+        )
+
+    def build_region_prompt(
+        self,
+        fragment: str,
+        issues: list[str],
+        image_captions: dict[str, str] = {},
+    ) -> str:
+        return PROMPTS["html_region_correction"].user_content(
+            **prompt_fields(fragment, issues, image_captions)
+        )
+
+    def correct_region(
+        self,
+        fragment: str,
+        issues: list[str],
+        image_captions: dict[str, str] = {},
+        captioned: set[str] = frozenset(),
+    ) -> str:
+        minified = for_prompt(fragment, "html")
+        template = PROMPTS["html_region_correction"]
+        messages = template.messages(
+            **prompt_fields(minified.text, issues, image_captions, captioned)
+        )
+        response_text = strip_html_fences(
+            self.call_llm(
+                messages,
+                template=template.key,
+                validate=lambda text: self.validate_region(
+                    fragment,
+                    minified,
+                    text,
+                    checked_issues(issues, image_captions, captioned),
+                ),
+            )
+        )
+        if has_deferred():
+            return fragment  # a batch placeholder; the stage reruns with the answer
+
+        problem = region_problem(fragment, response_text)
+        if problem:
+            print(f"⚠️ Discarding invalid correction: {problem}.")
+            return fragment
+        return minified.restore(response_text)
+
+    @staticmethod
+    def validate_region(fragment, minified, response_text, issues) -> list[str]:
+        # The splice check above, then the static rules for the region's issues
+        response_text = strip_html_fences(response_text)
+        problem = region_problem(fragment, response_text)
+        if problem:
+            return [problem]
+        corrected = minified.restore(response_text)
+        return validate_correction(fragment, corrected, issues, "html")
+
+    def correct_regions(
+        self,
+        html_code: str,
+        issues: list[str],
+        image_captions: dict[str, str] = {},
+        max_region_chars: int = 12000,
+        max_workers: int = 4,
+        captioned: set[str] = frozenset(),
+    ) -> str:
+        with timed("split_regions", "index.html"):
+            regions = split_regions(html_code, max_region_chars=max_region_chars)
+        unassigned = assign_issues(regions, issues)
+        if unassigned:
+            # Page-level issues (lang, skip links, heading order) belong to no
+            # one region, so the page is corrected as a whole instead
+            print(
+                f"⚠️ {len(unassigned)} HTML issues could not be tied to a region; "
+                "correcting the whole page:"
             )
-            if image_captions
-            else "None"
+            for issue in unassigned:
+                print(f"   - {issue}")
+            return self.correct_document(html_code, issues, image_captions, captioned)
+
+        affected = [region for region in regions if region.issues]
+        print(
+            f"🧩 Correcting {len(affected)} of {len(regions)} HTML regions "
+            f"({sum(r.size for r in affected)} of {len(html_code)} chars)."
         )
 
-        return (
-            "You are an expert web developer specialized in accessibility.\n\n"
-            "Your job is to fix **only** the HTML-based accessibility issues listed below.\n"
-            "These issues are related to structure, missing attributes, or semantic markup.\n\n"
-            "**Guidelines:**\n"
-            "- Do NOT fix issues requiring audio/video transcripts.\n"
-            "- Do NOT change any CSS or JavaScript logic.\n"
-            "- Use provided image captions to add descriptive `alt` text where `<img>` is missing it.\n"
-            "- Keep the structure and styling intact unless needed for fixing the issue.\n"
-            "- Do NOT introduce extra explanations. Just return the corrected HTML code.\n\n"
-            f"Issues:\n{issues_text}\n\n"
-            f"Image Captions:\n{captions_text}\n\n"
-            f"HTML Code:\n{html_code}\n"
+        def correct(region):
+            fragment = html_code[region.start : region.end]
+            captions = {
+                fname: caption
+                for fname, caption in image_captions.items()
+                if os.path.basename(fname) in fragment
+            }
+            in_region = {
+                path for path in captioned if os.path.basename(path) in fragment
+            }
+            with timed("correct_html_region", region.name):
+                return self.correct_region(fragment, region.issues, captions, in_region)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            corrected = list(executor.map(with_stage(correct), affected))
+
+        return splice_regions(
+            html_code,
+            {(r.start, r.end): text for r, text in zip(affected, corrected)},
         )
 
     def analyze_and_correct(
@@ -61,28 +233,53 @@ class HtmlCorrectorAgent(BaseAgent):
         html_files: dict[str, str],
         issues: list[str],
         image_captions: dict[str, str] = {},
+        mode: str = "document",
+        captioned: set[str] = frozenset(),
     ) -> dict[str, str]:
+        """Correct index.html for `issues`.
+
+        `captioned` names the images whose alt text alt_text.py fills in
+        from captions afterwards; missing-alt issues about them are left out.
+        """
         filename = "index.html"
         html_code = html_files.get(filename, "")
-        prompt = self.build_prompt(html_code, issues, image_captions)
-
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an expert in accessible HTML coding.",
-            },
-            {"role": "user", "content": prompt},
-        ]
-
-        response_text = self.call_llm(messages)
-
-        # Remove code block fences if present
-        if response_text.startswith("```html"):
-            response_text = response_text[len("```html") :].strip()
-        if response_text.endswith("```"):
-            response_text = response_text[:-3].strip()
+        if mode == "regions":
+            corrected = self.correct_regions(
+                html_code, issues, image_captions, captioned=captioned
+            )
+        else:
+            corrected = self.correct_document(
+                html_code, issues, image_captions, captioned
+            )
+        return {filename: corrected}
 
-        return {filename: response_text}
+    def correct_document(
+        self,
+        html_code: str,
+        issues: list[str],
+        image_captions: dict[str, str] = {},
+        captioned: set[str] = frozenset(),
+    ) -> str:
+        minified = for_prompt(html_code, "html")
+        template = PROMPTS["html_correction"]
+        messages = template.messages(
+            **prompt_fields(minified.text, issues, image_captions, captioned)
+        )
+        response_text = strip_html_fences(
+            self.call_llm(
+                messages,
+                template=template.key,
+                validate=lambda text: validate_correction(
+                    html_code,
+                    minified.restore(strip_html_fences(text)),
+                    checked_issues(issues, image_captions, captioned),
+                    "html",
+                ),
+            )
+        )
+        if not response_text:
+            return response_text
+        return minified.restore(response_text)
 
 
 if __name__ == "__main__":
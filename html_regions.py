@@ -0,0 +1,190 @@
+import re
+from bs4 import Tag
+
+from document import document_for
+
+LANDMARK_TAGS = {
+    "header",
+    "nav",
+    "main",
+    "section",
+    "article",
+    "aside",
+    "form",
+    "footer",
+}
+LANDMARK_ROLES = {
+    "banner",
+    "navigation",
+    "main",
+    "region",
+    "complementary",
+    "form",
+    "search",
+    "contentinfo",
+}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}  # fmt: skip
+
+# Words in an issue that point at a landmark even without naming the tag
+LANDMARK_WORDS = {
+    "header": {"header", "banner"},
+    "nav": {"nav", "navigation", "menu", "submenu", "dropdown"},
+    "form": {"form", "label", "input", "field", "captcha", "submit"},
+    "footer": {"footer", "contentinfo", "license"},
+    "head": {"title", "meta", "viewport", "charset"},
+    "html": {"lang", "language"},
+}
+
+
+class Region:
+    def __init__(self, name: str, start: int, end: int, element: Tag | None = None):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.element = element
+        self.issues = []
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+    def features(self) -> tuple[set[str], set[str], set[str], str]:
+        # (tag names, ids/classes, attribute values, visible text), lower-cased
+        if self.element is None:
+            return {self.name}, set(), set(), ""
+        tags, idents, values = set(), set(), set()
+        for el in [self.element, *self.element.find_all(True)]:
+            tags.add(el.name)
+            if el.get("id"):
+                idents.add(el["id"].lower())
+            idents.update(c.lower() for c in el.get("class", []))
+            for attr in ("src", "href", "for", "name", "role", "type"):
+                value = el.get(attr)
+                if isinstance(value, str) and value:
+                    values.add(value.lower())
+                    values.add(value.rsplit("/", 1)[-1].lower())
+        return tags, idents, values, self.element.get_text(" ").lower()
+
+
+def element_end(html: str, start: int, tag_name: str) -> int:
+    """Offset just past the closing tag of the element opened at `start`."""
+    open_end = html.index(">", start) + 1
+    if tag_name in VOID_TAGS or html[open_end - 2] == "/":
+        return open_end
+
+    pattern = re.compile(rf"<!--.*?-->|<(/?){re.escape(tag_name)}\b[^>]*>", re.S | re.I)
+    depth = 1
+    for match in pattern.finditer(html, open_end):
+        if match.group(0).startswith("<!--"):
+            continue
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.end()
+    # Unclosed element: html.parser closes it at the end of its parent
+    return len(html)
+
+
+def _is_landmark(el: Tag) -> bool:
+    return el.name in LANDMARK_TAGS or el.get("role") in LANDMARK_ROLES
+
+
+def _region_name(el: Tag, parent_name: str) -> str:
+    name = el.name
+    if el.get("id"):
+        name += f"#{el['id']}"
+    elif el.get("class"):
+        name += "." + ".".join(el["class"])
+    return f"{parent_name} > {name}" if parent_name else name
+
+
+def split_regions(html: str, max_region_chars: int = 12000) -> list[Region]:
+    """Partition a document into non-overlapping landmark/section regions.
+
+    Non-landmark wrappers that contain landmarks, and anything larger than
+    `max_region_chars`, are split into their child elements.
+    """
+    document = document_for(html)
+    soup = document.positioned
+    regions = []
+
+    root = soup.find("html")
+    if root is not None and root.sourceline is not None:
+        start = document.start(root)
+        regions.append(Region("html", start, html.index(">", start) + 1))
+
+    head = soup.find("head")
+    if head is not None and head.sourceline is not None:
+        start = document.start(head)
+        regions.append(Region("head", start, element_end(html, start, "head"), head))
+
+    def visit(container: Tag, parent_name: str):
+        for el in container.find_all(True, recursive=False):
+            start = document.start(el)
+            if start is None:
+                continue
+            end = element_end(html, start, el.name)
+            name = _region_name(el, parent_name)
+            has_children = el.find(True) is not None
+            wraps_landmarks = not _is_landmark(el) and any(
+                _is_landmark(child) for child in el.find_all(True)
+            )
+            if has_children and (wraps_landmarks or end - start > max_region_chars):
+                visit(el, name)
+            else:
+                regions.append(Region(name, start, end, el))
+
+    visit(soup.find("body") or soup, "")
+    return regions
+
+
+def _issue_terms(issue: str) -> tuple[set[str], set[str], set[str]]:
+    text = issue.lower()
+    quoted = set(re.findall(r"[\"'`]([^\"'`]+)[\"'`]", text))
+    names = {q.rsplit("/", 1)[-1] for q in quoted} | quoted
+    names.update(re.findall(r"[#.]([a-z][\w-]*)", text))
+    names.update(re.findall(r"\bid\s*=?\s*[\"']?([\w-]+)", text))
+    tags = set(re.findall(r"<\s*([a-z][a-z0-9]*)", text))
+    words = {w for w in re.findall(r"[a-z][\w-]*", text) if len(w) >= 4}
+    return names, tags, words
+
+
+def _score(region: Region, features, issue: str) -> int:
+    tags, idents, values, text = features
+    names, issue_tags, words = _issue_terms(issue)
+    score = 3 * len(names & (idents | values))
+    score += 3 * sum(
+        1 for q in names if len(q) >= 4 and re.search(rf"\b{re.escape(q)}\b", text)
+    )
+    score += len(issue_tags & tags)
+    # Words like "carousel" or "modal" that are part of an id or class
+    score += 2 * sum(1 for w in words if any(w in ident for ident in idents))
+    landmark = region.name.split(" > ")[-1].split("#")[0].split(".")[0]
+    if words & LANDMARK_WORDS.get(landmark, set()):
+        score += 2
+    return score
+
+
+def assign_issues(regions: list[Region], issues: list[str]) -> list[str]:
+    """Attach each issue to its best-matching regions; return unassigned issues."""
+    features = [region.features() for region in regions]
+    unassigned = []
+    for issue in issues:
+        scores = [_score(r, f, issue) for r, f in zip(regions, features)]
+        best = max(scores, default=0)
+        if best == 0:
+            unassigned.append(issue)
+            continue
+        for region, score in zip(regions, scores):
+            if score == best:
+                region.issues.append(issue)
+    return unassigned
+
+
+def splice_regions(html: str, replacements: dict[tuple[int, int], str]) -> str:
+    # Apply from the end so earlier offsets stay valid
+    for (start, end), text in sorted(replacements.items(), reverse=True):
+        html = html[:start] + text + html[end:]
+    return html
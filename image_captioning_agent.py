@@ -2,16 +2,30 @@ import base64
 from PIL import Image
 from io import BytesIO
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# Load environment variables for OpenAI API key
-load_dotenv()
+import config  # noqa: F401  (loads .env first)
+from cassette import CassetteMiss
+from llm_backends import get_cascade
+from prompt_templates import PROMPTS
+from profiling import timed
+
+MAX_CAPTION_CHARS = 300
 
 
 class ImageCaptioningAgent:
     def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # The key comes from the backend settings (OPENAI_API_KEY by default)
+        self.backend = get_cascade(type(self).__name__, default_model="gpt-4o")
+
+    @staticmethod
+    def validate(caption: str) -> list[str]:
+        # Alt text is a sentence or two; anything else is a refusal or a ramble
+        caption = caption.strip()
+        if not caption:
+            return ["empty caption"]
+        if len(caption) > MAX_CAPTION_CHARS:
+            return [f"caption longer than {MAX_CAPTION_CHARS} characters"]
+        return []
 
     def generate_alt_text(self, image_path: str) -> str:
         try:
@@ -21,42 +35,46 @@ class ImageCaptioningAgent:
                 img_bytes = buffered.getvalue()
                 img_base64 = base64.b64encode(img_bytes).decode("utf-8")
 
-            result = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an assistant that generates concise and descriptive alt text for web accessibility.",
-                    },
+            # The instruction text goes before the image so it stays in the
+            # cacheable prefix
+            template = PROMPTS["image_caption"]
+            result = self.backend.complete(
+                [
+                    {"role": "system", "content": template.system},
                     {
                         "role": "user",
                         "content": [
+                            {"type": "text", "text": template.instructions},
                             {
                                 "type": "image_url",
                                 "image_url": {
                                     "url": f"data:image/png;base64,{img_base64}"
                                 },
                             },
-                            {
-                                "type": "text",
-                                "text": "Describe this image in one sentence as alt text.",
-                            },
                         ],
                     },
                 ],
+                validate=self.validate,
+                template=template.key,
+                agent=type(self).__name__,
             )
             return result.choices[0].message.content.strip()
 
+        except CassetteMiss:
+            raise
         except Exception as e:
             return f"[Error generating alt text: {str(e)}]"
 
-    def process_images(self, image_paths: list[str]) -> dict[str, str]:
+    def process_images(
+        self, image_paths: list[str], base_dir: str = "before"
+    ) -> dict[str, str]:
         result = {}
         for rel_path in image_paths:
             full_path = os.path.join(
-                "before", rel_path
+                base_dir, rel_path
             )  # build full path from relative path
             print(f"🔎 Processing: {full_path}")
-            caption = self.generate_alt_text(full_path)
+            with timed("caption", rel_path):
+                caption = self.generate_alt_text(full_path)
             result[rel_path] = caption
         return result
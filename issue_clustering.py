@@ -0,0 +1,178 @@
+import hashlib
+import re
+from itertools import combinations
+
+# Words that carry no signal about which problem an issue describes
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "does",
+    "doesn", "for", "from", "has", "have", "in", "into", "is", "it", "its",
+    "not", "of", "on", "or", "such", "that", "the", "their", "there", "these",
+    "this", "to", "when", "which", "while", "with", "without", "e", "g", "eg",
+}  # fmt: skip
+
+# Kinds of element or page region an issue can be about; issues about
+# different ones are different issues however alike their wording
+ELEMENTS = {
+    "accordion", "anchor", "audio", "banner", "button", "carousel", "checkbox",
+    "dialog", "dropdown", "field", "footer", "form", "header", "heading",
+    "icon", "iframe", "image", "img", "input", "link", "list", "logo", "menu",
+    "modal", "nav", "navigation", "paragraph", "radio", "select", "sidebar",
+    "slider", "tab", "table", "textarea", "tooltip", "video",
+}  # fmt: skip
+
+NUM_PERM = 64
+BANDS = 32  # NUM_PERM / BANDS rows per band for the LSH candidate search
+_MERSENNE = (1 << 61) - 1
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def normalize_tokens(text: str) -> list[str]:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return [_stem(w) for w in words if w not in STOPWORDS]
+
+
+def shingles(text: str) -> set[str]:
+    tokens = normalize_tokens(text)
+    found = set(tokens)
+    found.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return found
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest())
+
+
+# Fixed permutation coefficients so signatures are identical across runs
+_PERMUTATIONS = [
+    (_hash(f"a{i}") % _MERSENNE | 1, _hash(f"b{i}") % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+
+_ELEMENT_STEMS = {_stem(word) for word in ELEMENTS}
+
+
+def minhash(shingle_set: set[str]) -> tuple[int, ...]:
+    hashes = [_hash(s) for s in shingle_set] or [0]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def extract_element(text: str) -> str | None:
+    # The first tag, selector or quoted name an issue mentions, if any
+    match = re.search(r"<[a-zA-Z][^>]*>|[#.][a-zA-Z][\w-]*|[\"'`][^\"'`]+[\"'`]", text)
+    return match.group(0).strip("\"'`") if match else None
+
+
+def identifiers(text: str) -> set[str]:
+    # Quoted names, colors, ids and selectors that pin an issue to one element
+    found = set(re.findall(r"[\"'`]([^\"'`]+)[\"'`]", text))
+    found.update(re.findall(r"[#.][a-zA-Z0-9][\w-]*", text))
+    return {f.lower() for f in found}
+
+
+def canonical_form(text: str) -> str:
+    # Word order, case, stopwords and inflection don't change an issue
+    return " ".join(sorted(set(normalize_tokens(text))))
+
+
+def subjects(text: str) -> set[str]:
+    # Stemmed once more, so "headings" and "heading" agree as well as "links"
+    # and "link"
+    return {_stem(token) for token in normalize_tokens(text)} & _ELEMENT_STEMS
+
+
+def issue_id(category: str, texts: list[str]) -> str:
+    # Hash a canonical form picked from the members, not the representative,
+    # which shifts with any member's wording. The tersest form (smallest on
+    # ties) stays put as wordier variants of the same issue come and go
+    forms = {canonical_form(text) for text in texts}
+    key = category + ":" + min(forms, key=lambda form: (len(form.split()), form))
+    return f"{category}-{hashlib.sha1(key.encode()).hexdigest()[:10]}"
+
+
+def cluster_issues(
+    records: list[dict], category: str, threshold: float = 0.4
+) -> list[dict]:
+    """Merge near-duplicate issues.
+
+    `records` are dicts with a "text" key and optional "chunk", "file" and
+    "element" provenance. Candidates come from MinHash LSH buckets and are
+    confirmed with the exact Jaccard similarity of their shingle sets; two
+    issues that name different identifiers or kinds of element never merge.
+    """
+    sets = [shingles(record["text"]) for record in records]
+    pinned = [identifiers(record["text"]) for record in records]
+    about = [subjects(record["text"]) for record in records]
+    signatures = [minhash(s) for s in sets]
+
+    parent = list(range(len(records)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERM // BANDS
+    candidates = set()
+    for band in range(BANDS):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            key = signature[band * rows : (band + 1) * rows]
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            candidates.update(combinations(members, 2))
+
+    for i, j in sorted(candidates):
+        # Same wording about different elements (e.g. two images) is not a duplicate
+        if pinned[i] and pinned[j] and pinned[i] != pinned[j]:
+            continue
+        # Nor is it about different kinds of element ("buttons" vs "links")
+        if about[i] and about[j] and about[i] != about[j]:
+            continue
+        if find(i) != find(j) and jaccard(sets[i], sets[j]) >= threshold:
+            parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(len(records)):
+        groups.setdefault(find(i), []).append(i)
+
+    clusters = []
+    for members in sorted(groups.values()):
+        # Representative: the member most similar to the rest of its cluster
+        rep = max(
+            members,
+            key=lambda i: (sum(jaccard(sets[i], sets[j]) for j in members), -i),
+        )
+        text = records[rep]["text"]
+        clusters.append(
+            {
+                "id": issue_id(category, [records[i]["text"] for i in members]),
+                "category": category,
+                "text": text,
+                "count": len(members),
+                "sources": [
+                    {
+                        "text": records[i]["text"],
+                        "chunk": records[i].get("chunk"),
+                        "file": records[i].get("file"),
+                        "element": records[i].get("element")
+                        or extract_element(records[i]["text"]),
+                    }
+                    for i in members
+                ],
+            }
+        )
+    return clusters
@@ -0,0 +1,275 @@
+import re
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+
+from issue_clustering import STOPWORDS
+from prompt_minify import for_prompt
+from pipeline import has_deferred, with_stage
+from profiling import timed
+from static_checks import PARSE_JS_AST, node_parse
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_JS_SELECTOR = re.compile(r"""[\$\(]\s*['"]([#.][\w-]+)""")
+_JS_DOM_ID = re.compile(
+    r"""getElementById\(\s*['"]([\w-]+)|getElementsByClassName\(\s*['"]([\w-]+)"""
+)
+_JS_FUNCTION = re.compile(
+    r"function\s+([A-Za-z_$][\w$]*)"
+    r"|([A-Za-z_$][\w$]*)\s*[:=]\s*(?:function\b|\([^)]*\)\s*=>)"
+)
+
+
+def is_vendor_file(filename: str) -> bool:
+    # Minified third-party bundles (e.g. jquery.min.js) are never corrected
+    return ".min." in filename
+
+
+def _line_of(code: str, offset: int) -> int:
+    return code.count("\n", 0, offset) + 1
+
+
+def css_symbols(code: str) -> dict[str, list[int]]:
+    """Map each id, class and full selector in a stylesheet to its line numbers."""
+    # Blank out comments but keep their newlines so line numbers stay right
+    code = _CSS_COMMENT.sub(lambda m: re.sub(r"[^\n]", " ", m.group(0)), code)
+    symbols = {}
+    for match in re.finditer(r"([^{};]+)\{", code):
+        prelude = match.group(1).strip()
+        if not prelude or prelude.startswith("@"):
+            continue
+        line = _line_of(
+            code, match.start(1) + len(match.group(1)) - len(match.group(1).lstrip())
+        )
+        for selector in prelude.split(","):
+            selector = " ".join(selector.split()).lower()
+            names = [selector] + re.findall(r"[#.][\w-]+", selector)
+            for name in names:
+                symbols.setdefault(name, []).append(line)
+    return symbols
+
+
+def _js_ast_symbols(code: str) -> dict[str, list[int]] | None:
+    # Uses temp/parse_js_ast.js (esprima) when node and its modules are available
+    ast, _ = node_parse(PARSE_JS_AST, code, ".js")
+    if ast is None:
+        return None
+
+    symbols = {}
+
+    def add(name, node):
+        if name:
+            symbols.setdefault(name.lower(), []).append(node["loc"]["start"]["line"])
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        kind = node.get("type")
+        if kind == "FunctionDeclaration" and node.get("id"):
+            add(node["id"]["name"], node)
+        elif kind == "VariableDeclarator" and (node.get("init") or {}).get("type") in (
+            "FunctionExpression",
+            "ArrowFunctionExpression",
+        ):
+            add(node["id"].get("name"), node)
+        elif kind == "Literal" and isinstance(node.get("value"), str):
+            for name in re.findall(r"[#.][\w-]+", node["value"]):
+                add(name, node)
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                walk(value)
+
+    walk(ast)
+    return symbols
+
+
+def js_symbols(code: str) -> dict[str, list[int]]:
+    """Map function names and DOM selectors/ids used by a script to line numbers."""
+    symbols = _js_ast_symbols(code)
+    if symbols is not None:
+        return symbols
+
+    symbols = {}
+    for pattern in (_JS_FUNCTION, _JS_SELECTOR, _JS_DOM_ID):
+        for match in pattern.finditer(code):
+            name = next(g for g in match.groups() if g)
+            if pattern is _JS_DOM_ID:
+                name = ("#" if match.group(1) else ".") + name
+            symbols.setdefault(name.lower(), []).append(_line_of(code, match.start()))
+    return symbols
+
+
+def _literals(issue: str) -> set[str]:
+    # Colors and "property: value" pairs quoted from the code, e.g. "outline: none"
+    text = issue.lower()
+    found = set(re.findall(r"#[0-9a-f]{3,8}\b", text))
+    found.update(
+        f"{prop}:{value}"
+        for prop, value in re.findall(r"\b([a-z-]{3,}):\s*([#\w-]+)", text)
+    )
+    return found
+
+
+def _file_keywords(filenames: list[str]) -> dict[str, set[str]]:
+    # Name parts that tell files apart, e.g. "carousel" in "...before-carousel.js"
+    parts = {
+        name: {p for p in re.split(r"[^a-z0-9]+", name.lower()) if len(p) >= 4}
+        for name in filenames
+    }
+    shared = set.intersection(*parts.values()) if len(parts) > 1 else set()
+    return {name: found - shared - {"before", "after"} for name, found in parts.items()}
+
+
+class RoutingIndex:
+    def __init__(self):
+        self.by_file = {}  # filename -> [issue, ...]
+        self.matches = {}  # issue -> {filename: [matched symbol, ...]}
+        self.unrouted = []
+        self.candidates = []  # files issues may be routed to (not vendored)
+
+    def to_dict(self) -> dict:
+        return {
+            "by_file": self.by_file,
+            "matches": self.matches,
+            "unrouted": self.unrouted,
+        }
+
+
+def build_routing_index(
+    files: dict[str, str],
+    issues: list[str],
+    kind: str,
+    hints: dict[str, set[str]] | None = None,
+) -> RoutingIndex:
+    """Route each issue to the files it concerns.
+
+    Evidence, strongest first: the filename in the issue or the files the
+    issue was found in (`hints`, from the issue's cluster sources), ids,
+    classes and functions the issue names that the file defines or uses,
+    then distinctive words of the filename ("carousel", "modal"), and last
+    the file whose code shares the most words with the issue. Issues with
+    no evidence at all are left in `unrouted`.
+    """
+    hints = hints or {}
+    candidates = [name for name in files if not is_vendor_file(name)]
+    extract = css_symbols if kind == "css" else js_symbols
+    keywords = _file_keywords(candidates)
+    terms = []
+    for issue in issues:
+        text = issue.lower()
+        named = set(re.findall(r"[#.][\w-]+", text))
+        words = {w for w in re.findall(r"[a-z][\w-]*", text) if len(w) >= 4}
+        terms.append((text, named, words, _literals(issue)))
+
+    # One file at a time, so only one file's code is held while routing
+    strong = {issue: {} for issue in issues}
+    weak = {issue: {} for issue in issues}
+    loose = {issue: {} for issue in issues}
+    for name in candidates:
+        code = files[name]
+        symbols = extract(code)
+        compact = re.sub(r"\s*:\s*", ":", code.lower())
+        vocabulary = set(re.findall(r"[a-z][\w-]*", compact))
+        for issue, (text, named, words, literals) in zip(issues, terms):
+            found = []
+            if name.lower() in text or name in hints.get(issue, ()):
+                found.append(name)
+            for symbol, lines in symbols.items():
+                bare = symbol.lstrip("#.")
+                if symbol in named or (len(bare) >= 4 and bare in words):
+                    found.append(f"{symbol}:{lines[0]}")
+            for literal in literals:
+                offset = compact.find(literal)
+                if offset >= 0:
+                    found.append(f"{literal}:{_line_of(compact, offset)}")
+            if found:
+                strong[issue][name] = found
+            elif words & keywords[name]:
+                weak[issue][name] = sorted(words & keywords[name])
+            elif (words - STOPWORDS) & vocabulary:
+                loose[issue][name] = sorted((words - STOPWORDS) & vocabulary)
+
+    index = RoutingIndex()
+    for issue in issues:
+        routed = strong[issue] or weak[issue]
+        if not routed and loose[issue]:
+            # Only the file(s) sharing the most words, not every file
+            # sharing one
+            best = max(len(found) for found in loose[issue].values())
+            routed = {
+                name: found
+                for name, found in loose[issue].items()
+                if len(found) == best
+            }
+        if not routed:
+            index.unrouted.append(issue)
+            continue
+        index.matches[issue] = routed
+        for name in routed:
+            index.by_file.setdefault(name, []).append(issue)
+    index.candidates = candidates
+    return index
+
+
+def correct_per_file(
+    correct,
+    files: dict[str, str],
+    issues: list[str],
+    kind: str,
+    max_workers: int = 4,
+    hints: dict[str, set[str]] | None = None,
+) -> dict[str, str]:
+    """Correct each file in its own request with only the issues routed to it.
+
+    `correct` is an agent's analyze_and_correct. Issues that match no file
+    are added to every candidate file's request, so none are dropped and no
+    request holds more than one file. Files without issues, and files whose
+    correction fails, are returned unchanged.
+    """
+    index = build_routing_index(files, issues, kind, hints)
+    by_file = {
+        name: index.by_file.get(name, [])
+        + (index.unrouted if name in index.candidates else [])
+        for name in files
+    }
+    targets = [name for name in files if by_file[name]]
+    print(
+        f"🧭 Routed {len(issues) - len(index.unrouted)} {kind.upper()} issues to "
+        f"{len(index.by_file)} of {len(files)} files."
+    )
+
+    def run(name):
+        # The model sees minified code; its answer is mapped back onto the
+        # original formatting
+        with timed(f"correct_{kind}", name):
+            minified = for_prompt(files[name], kind)
+            corrected = correct({name: minified.text}, by_file[name])
+            # The model may echo the name without directories; accept a single entry
+            if name not in corrected and len(corrected) == 1:
+                corrected = {name: next(iter(corrected.values()))}
+            if corrected.get(name, "").strip():
+                return {name: minified.restore(corrected[name])}
+            if not has_deferred():
+                print(f"⚠️ No usable correction for {name}; keeping original.")
+            return {}
+
+    if index.unrouted and index.candidates:
+        print(
+            f"🧭 {len(index.unrouted)} {kind.upper()} issues matched no file; "
+            f"adding them to each of {len(index.candidates)} files' requests."
+        )
+    elif index.unrouted:
+        print(
+            f"⚠️ {len(index.unrouted)} {kind.upper()} issues matched no file, "
+            "and there is no file to correct."
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = {}
+        for found in executor.map(with_stage(run), targets):
+            results.update(found)
+    # Files that were not corrected are read from `files` when asked for
+    return ChainMap(results, files)
@@ -0,0 +1,421 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from static_checks import rules_for
+
+# Issues, captions and corrections of every run, kept in one SQLite file so
+# they can be queried across sites and runs. The per-category JSON lists in
+# outputs/issues/ are still written, as an export of the current run.
+
+# WAL lets readers and the writer work at once; hosts sharing the file over a
+# network filesystem need DELETE (see job_queue.py)
+JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    id INTEGER PRIMARY KEY,
+    root TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    started REAL NOT NULL,
+    finished REAL,
+    status TEXT NOT NULL DEFAULT 'running'
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    UNIQUE (site_id, path)
+);
+CREATE TABLE IF NOT EXISTS issues (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    file_id INTEGER REFERENCES files(id),
+    category TEXT NOT NULL,
+    cluster TEXT NOT NULL,
+    rule TEXT,
+    text TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'open',
+    sources TEXT
+);
+CREATE INDEX IF NOT EXISTS issues_site ON issues (site_id, run_id);
+CREATE INDEX IF NOT EXISTS issues_file ON issues (file_id);
+CREATE INDEX IF NOT EXISTS issues_category ON issues (category, run_id);
+CREATE INDEX IF NOT EXISTS issues_rule ON issues (rule);
+CREATE INDEX IF NOT EXISTS issues_status ON issues (status);
+CREATE INDEX IF NOT EXISTS issues_run_cluster ON issues (run_id, cluster);
+CREATE TABLE IF NOT EXISTS captions (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    site_id INTEGER NOT NULL REFERENCES sites(id),
+    image TEXT NOT NULL,
+    caption TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captions_site ON captions (site_id, image);
+CREATE TABLE IF NOT EXISTS corrections (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    status TEXT NOT NULL,
+    changed_lines INTEGER NOT NULL DEFAULT 0,
+    retried INTEGER NOT NULL DEFAULT 0,
+    errors TEXT
+);
+CREATE INDEX IF NOT EXISTS corrections_file ON corrections (file_id);
+CREATE INDEX IF NOT EXISTS corrections_status ON corrections (status);
+CREATE TABLE IF NOT EXISTS analyses (
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    issues TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, digest, analyzer)
+);
+"""
+
+# Columns a query may filter issues on, and the SQL for each
+_FILTERS = {
+    "run_id": "i.run_id = ?",
+    "site": "s.root = ?",
+    "file": "f.path = ?",
+    "category": "i.category = ?",
+    "rule": "i.rule = ?",
+    "status": "i.status = ?",
+}
+
+
+class IssueStore:
+    """The issue database; safe to use from the pipeline's worker threads.
+
+    Each thread gets its own connection. Writes are grouped into one
+    transaction per call, and queries yield rows as they are read instead
+    of loading whole result sets.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()  # guards the site id cache
+        self.site_ids = {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.connection as conn:
+            conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+            conn.executescript(SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = conn
+        return conn
+
+    def site_id(self, root: str) -> int:
+        root = os.path.abspath(root)
+        with self.lock:
+            if root not in self.site_ids:
+                with self.connection as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO sites (root) VALUES (?)", (root,)
+                    )
+                    self.site_ids[root] = conn.execute(
+                        "SELECT id FROM sites WHERE root = ?", (root,)
+                    ).fetchone()[0]
+            return self.site_ids[root]
+
+    def _file_ids(self, conn, site_id: int, files: dict[str, str]) -> dict[str, int]:
+        # files: path -> kind; creates the rows that don't exist yet
+        conn.executemany(
+            "INSERT OR IGNORE INTO files (site_id, path, kind) VALUES (?, ?, ?)",
+            [(site_id, path, kind) for path, kind in files.items()],
+        )
+        return {
+            path: conn.execute(
+                "SELECT id FROM files WHERE site_id = ? AND path = ?", (site_id, path)
+            ).fetchone()[0]
+            for path in files
+        }
+
+    def start_run(self, run_id: str, site_root: str) -> int:
+        # A run id that is already taken raises sqlite3.IntegrityError rather
+        # than replacing the other run's row
+        site_id = self.site_id(site_root)
+        with self.connection as conn:
+            conn.execute(
+                "INSERT INTO runs (id, site_id, started) VALUES (?, ?, ?)",
+                (run_id, site_id, time.time()),
+            )
+        return site_id
+
+    def finish_run(self, run_id: str, status: str):
+        with self.connection as conn:
+            conn.execute(
+                "UPDATE runs SET finished = ?, status = ? WHERE id = ?",
+                (time.time(), status, run_id),
+            )
+
+    def _run_site(self, conn, run_id: str) -> int:
+        row = conn.execute(
+            "SELECT site_id FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown run: {run_id}")
+        return row[0]
+
+    def add_issues(self, run_id: str, category: str, clusters: list[dict]):
+        """Store the deduplicated issues of one category (see cluster_issues)."""
+        with self.connection as conn:
+            site_id = self._run_site(conn, run_id)
+            files = {
+                source["file"]: category
+                for cluster in clusters
+                for source in cluster.get("sources", [])
+                if source.get("file")
+            }
+            file_ids = self._file_ids(conn, site_id, files)
+            rows = []
+            for cluster in clusters:
+                named = [s["file"] for s in cluster.get("sources", []) if s.get("file")]
+                rules = rules_for(cluster["text"], category)
+                rows.append(
+                    (
+                        run_id,
+                        site_id,
+                        file_ids[named[0]] if named else None,
+                        category,
+                        cluster["id"],
+                        rules[0].name if rules else None,
+                        cluster["text"],
+                        cluster.get("count", 1),
+                        json.dumps(cluster.get("sources", []), ensure_ascii=False),
+                    )
+                )
+            conn.execute(
+                "DELETE FROM issues WHERE run_id = ? AND category = ?",
+                (run_id, category),
+            )
+            conn.executemany(
+                "INSERT INTO issues (run_id, site_id, file_id, category, cluster, "
+                "rule, text, count, sources) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def add_captions(self, run_id: str, captions: dict[str, str]):
+        with self.connection as conn:
+            site_id = self._run_site(conn, run_id)
+            conn.execute("DELETE FROM captions WHERE run_id = ?", (run_id,))
+            conn.executemany(
+                "INSERT INTO captions (run_id, site_id, image, caption) "
+                "VALUES (?, ?, ?, ?)",
+                [(run_id, site_id, image, text) for image, text in captions.items()],
+            )
+
+    def add_verification(self, run_id: str, results: list):
+        """Store verification results and update the status of the run's issues.
+
+        `results` are verification.FileVerification objects. Problems the
+        corrections introduced are added as issues with status "new".
+        """
+        with self.connection as conn:
+            site_id = self._run_site(conn, run_id)
+            file_ids = self._file_ids(conn, site_id, {r.name: r.kind for r in results})
+            conn.executemany(
+                "INSERT INTO corrections (run_id, file_id, status, changed_lines, "
+                "retried, errors) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        file_ids[r.name],
+                        r.status,
+                        r.changed_lines,
+                        int(r.retried),
+                        json.dumps(r.errors, ensure_ascii=False),
+                    )
+                    for r in results
+                ],
+            )
+            updates = [
+                (status, run_id, r.kind, text)
+                for r in results
+                for status, texts in (
+                    ("resolved", r.resolved),
+                    ("open", r.open),
+                    ("unverified", r.unverified),
+                )
+                for text in texts
+            ]
+            conn.executemany(
+                "UPDATE issues SET status = ? "
+                "WHERE run_id = ? AND category = ? AND text = ?",
+                updates,
+            )
+            conn.executemany(
+                "INSERT INTO issues (run_id, site_id, file_id, category, cluster, "
+                "text, status) VALUES (?, ?, ?, ?, 'new', ?, 'new')",
+                [
+                    (run_id, site_id, file_ids[r.name], r.kind, text)
+                    for r in results
+                    for text in r.new
+                ],
+            )
+
+    def cached_analyses(
+        self, kind: str, analyzer: str, digests
+    ) -> dict[str, list[str]]:
+        """Stored analysis results of files by content digest (see save_analyses)."""
+        digests = list(dict.fromkeys(digests))
+        found = {}
+        with self.connection as conn:
+            # In slices, to stay under SQLite's limit on query parameters
+            for i in range(0, len(digests), 500):
+                part = digests[i : i + 500]
+                rows = conn.execute(
+                    "SELECT digest, issues FROM analyses WHERE kind = ? "
+                    f"AND analyzer = ? AND digest IN ({', '.join('?' * len(part))})",
+                    [kind, analyzer, *part],
+                ).fetchall()
+                found.update((row["digest"], json.loads(row["issues"])) for row in rows)
+            conn.executemany(
+                "UPDATE analyses SET hits = hits + 1, used = ? "
+                "WHERE kind = ? AND digest = ? AND analyzer = ?",
+                [(time.time(), kind, digest, analyzer) for digest in found],
+            )
+        return found
+
+    def save_analyses(self, kind: str, analyzer: str, results: dict[str, list[str]]):
+        """Store the issues an analyzer found in each file, by content digest.
+
+        `analyzer` names everything that shapes the result (prompt version,
+        models, minification), so a change there misses the stored results.
+        """
+        now = time.time()
+        with self.connection as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analyses (kind, digest, analyzer, issues, "
+                "created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        kind,
+                        digest,
+                        analyzer,
+                        json.dumps(issues, ensure_ascii=False),
+                        now,
+                        now,
+                    )
+                    for digest, issues in results.items()
+                ],
+            )
+
+    def iter_issues(self, batch_size: int = 500, **filters):
+        """Yield issues as dicts, filtered by run_id, site, file, category,
+        rule and/or status."""
+        unknown = set(filters) - set(_FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown issue filters: {', '.join(sorted(unknown))}")
+        if "site" in filters:
+            filters["site"] = os.path.abspath(filters["site"])
+        where = [_FILTERS[name] for name in filters]
+        cursor = self.connection.execute(
+            "SELECT i.id, i.run_id, s.root AS site, f.path AS file, i.category, "
+            "i.cluster, i.rule, i.text, i.count, i.status FROM issues i "
+            "JOIN sites s ON s.id = i.site_id LEFT JOIN files f ON f.id = i.file_id"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY i.id",
+            list(filters.values()),
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+    def issue_texts(self, run_id: str, category: str) -> list[str]:
+        return [
+            row["text"]
+            for row in self.iter_issues(run_id=run_id, category=category)
+            if row["status"] != "new"
+        ]
+
+    def issue_files(self, run_id: str, category: str) -> dict[str, set[str]]:
+        """Map each issue text of a run to the files it was found in."""
+        files = {}
+        for text, sources in self.connection.execute(
+            "SELECT text, sources FROM issues WHERE run_id = ? AND category = ?",
+            (run_id, category),
+        ):
+            named = {s["file"] for s in json.loads(sources or "[]") if s.get("file")}
+            if named:
+                files.setdefault(text, set()).update(named)
+        return files
+
+    def latest_run(
+        self, site: str, category: str, exclude: str | None = None
+    ) -> str | None:
+        """The id of the latest run of `site` with issues of `category`."""
+        row = self.connection.execute(
+            "SELECT r.id FROM runs r JOIN sites s ON s.id = r.site_id "
+            "WHERE s.root = ? AND r.id IS NOT ? AND EXISTS (SELECT 1 FROM issues i "
+            "WHERE i.run_id = r.id AND i.category = ?) "
+            "ORDER BY r.started DESC LIMIT 1",
+            (os.path.abspath(site), exclude, category),
+        ).fetchone()
+        return row["id"] if row else None
+
+    def copy_issues(self, source_run: str, run_id: str, category: str):
+        """Record the issues of `category` found by `source_run` in `run_id` too."""
+        with self.connection as conn:
+            conn.execute(
+                "DELETE FROM issues WHERE run_id = ? AND category = ?",
+                (run_id, category),
+            )
+            conn.execute(
+                "INSERT INTO issues (run_id, site_id, file_id, category, cluster, "
+                "rule, text, count, status, sources) SELECT ?, site_id, file_id, "
+                "category, cluster, rule, text, count, status, sources FROM issues "
+                "WHERE run_id = ? AND category = ? ORDER BY id",
+                (run_id, source_run, category),
+            )
+
+    def trend(self, site: str, category: str | None = None):
+        """Yield (run id, status, issue count) per run of `site`, oldest first."""
+        query = (
+            "SELECT r.id, i.status, COUNT(*) FROM runs r "
+            "JOIN issues i ON i.run_id = r.id "
+            "WHERE r.site_id = (SELECT id FROM sites WHERE root = ?)"
+            + (" AND i.category = ?" if category else "")
+            + " GROUP BY r.id, i.status ORDER BY r.started, i.status"
+        )
+        params = [os.path.abspath(site)] + ([category] if category else [])
+        yield from self.connection.execute(query, params)
+
+    def export_json(self, run_id: str, category: str, path: str):
+        """Write a run's issue texts of one category as a flat JSON list."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("[")
+            empty = True
+            for row in self.iter_issues(run_id=run_id, category=category):
+                if row["status"] == "new":
+                    continue
+                f.write("\n  " if empty else ",\n  ")
+                f.write(json.dumps(row["text"], ensure_ascii=False))
+                empty = False
+            f.write("]" if empty else "\n]")
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Persistent queue of audit jobs in a SQLite file, shared by any number of
+# worker processes, on one machine or on several hosts that mount the same
+# filesystem. For the latter set SQLITE_JOURNAL_MODE=DELETE: WAL needs shared
+# memory, which network filesystems don't provide.
+#
+# A worker that claims a job holds a lease on it and renews it with
+# heartbeats. A job whose lease runs out (its worker died or hung) is
+# claimed again by the next worker, up to max_attempts times.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    worker TEXT,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+# Columns added after the first version of the table
+COLUMNS = {
+    "key": "TEXT",
+    "lease_until": "REAL",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "max_attempts": "INTEGER NOT NULL DEFAULT 3",
+}
+
+# queued -> running -> done | failed
+STATUSES = ("queued", "running", "done", "failed")
+
+JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+# Seconds a claim is valid without a heartbeat
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _job(row) -> dict | None:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        max_queued: int | None = None,
+        lease: float = LEASE_SECONDS,
+    ):
+        self.path = path
+        self.max_queued = max_queued
+        self.lease = lease
+        self.local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self.connection
+        conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        conn.executescript(SCHEMA)
+        with self._transaction() as conn:
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, declaration in COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {declaration}")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS jobs_key ON jobs (key) "
+                "WHERE key IS NOT NULL"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (status, lease_until)"
+            )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit; transactions are opened explicitly where needed
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers never read
+        # the same queued job and both claim it
+        conn = self.connection
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def submit(
+        self, payload: dict, key: str | None = None, max_attempts: int = 3
+    ) -> str:
+        """Queue a job; returns its id.
+
+        Submitting a `key` that is already queued, running or done returns
+        the existing job instead of adding one, so re-submitting a whole
+        batch only adds what is missing. A failed job with that key is
+        queued again.
+        """
+        with self._transaction() as conn:
+            if key is not None:
+                row = conn.execute(
+                    "SELECT id, status FROM jobs WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row["status"] == "failed":
+                        conn.execute(
+                            "UPDATE jobs SET status = 'queued', attempts = 0, "
+                            "error = NULL, worker = NULL, lease_until = NULL "
+                            "WHERE id = ?",
+                            (row["id"],),
+                        )
+                    return row["id"]
+            if self.max_queued is not None:
+                (queued,) = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+                ).fetchone()
+                if queued >= self.max_queued:
+                    raise QueueFull(f"{queued} jobs already queued")
+            job_id = uuid.uuid4().hex[:12]
+            conn.execute(
+                "INSERT INTO jobs (id, key, status, payload, created, max_attempts) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, key, json.dumps(payload), time.time(), max_attempts),
+            )
+        return job_id
+
+    def claim(self, worker: str) -> dict | None:
+        """Lease the oldest available job to `worker`, or None if there is none.
+
+        Available means queued, or running with an expired lease. Jobs that
+        used up their attempts that way are marked failed.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, "
+                "error = 'lease expired ' || attempts || ' times' "
+                "WHERE status = 'running' AND lease_until < ? "
+                "AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started = ?, worker = ?, "
+                "lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (now, worker, now + self.lease, row["id"]),
+            )
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """Renew `worker`'s lease; False if the job is no longer its own."""
+        cursor = self.connection.execute(
+            "UPDATE jobs SET lease_until = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease, job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        error: str | None = None,
+        result: dict | None = None,
+        worker: str | None = None,
+    ) -> bool:
+        """Record a job's outcome; with `worker`, only if it still holds it."""
+        if status not in ("done", "failed"):
+            raise ValueError(f"Not a final job status: {status}")
+        query = (
+            "UPDATE jobs SET status = ?, finished = ?, error = ?, result = ?, "
+            "lease_until = NULL WHERE id = ?"
+        )
+        params = [
+            status,
+            time.time(),
+            error,
+            json.dumps(result) if result is not None else None,
+            job_id,
+        ]
+        if worker is not None:
+            query += " AND worker = ?"
+            params.append(worker)
+        return self.connection.execute(query, params).rowcount == 1
+
+    def requeue_running(self) -> int:
+        # Jobs a previous service process was running when it stopped
+        cursor = self.connection.execute(
+            "UPDATE jobs SET status = 'queued', started = NULL, worker = NULL, "
+            "lease_until = NULL WHERE status = 'running'"
+        )
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> dict | None:
+        return _job(
+            self.connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        )
+
+    def jobs(self, status: str | None = None):
+        query = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "")
+        for row in self.connection.execute(
+            query + " ORDER BY created", [status] if status else []
+        ):
+            yield _job(row)
+
+    def counts(self) -> dict[str, int]:
+        found = dict(
+            self.connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        )
+        return {status: found.get(status, 0) for status in STATUSES}
+
+
+class Heartbeat:
+    """Renew a job's lease in the background while a worker runs it.
+
+    `on_lost` is called from the heartbeat thread if the lease is lost, so a
+    worker can stop work another worker has taken over.
+    """
+
+    def __init__(self, queue: JobQueue, job_id: str, worker: str, on_lost=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker = worker
+        self.on_lost = on_lost
+        self.stopped = threading.Event()
+        self.lost = False
+        self.thread = threading.Thread(target=self._beat, daemon=True)
+
+    def _beat(self):
+        while not self.stopped.wait(self.queue.lease / 3):
+            if not self.queue.heartbeat(self.job_id, self.worker):
+                self.lost = True
+                if self.on_lost is not None:
+                    self.on_lost()
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,227 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from cassette import CassetteMiss
+from llm_client import METRICS, chat_completion, is_placeholder
+
+# Per-agent backend settings. The file is optional, e.g.
+#
+#   {
+#     "default": {"model": "gpt-4o-mini"},
+#     "agents": {
+#       "CssAgent": {"base_url": "http://localhost:8000/v1", "model": "qwen2.5-coder",
+#                    "max_batch_size": 16, "batch_window_ms": 20},
+#       "ImageCaptioningAgent": {"model": "gpt-4o"},
+#       "HtmlCorrectorAgent": {"cascade": [{"model": "gpt-4o-mini"}, {"model": "gpt-4o"}]}
+#     }
+#   }
+#
+# Agent entries override "default", which overrides the agent's own default.
+# A "cascade" lists models to try in order; each tier overrides the agent's
+# settings. Later tiers are only asked when an answer fails the agent's
+# validation (see Cascade).
+BACKENDS_PATH = os.getenv("LLM_BACKENDS", "llm_backends.json")
+
+DEFAULTS = {
+    "base_url": None,  # None uses OPENAI_BASE_URL or the OpenAI API
+    "model": None,
+    "api_key_env": "OPENAI_API_KEY",
+    "max_batch_size": 1,  # 1 sends every request as soon as it is made
+    "batch_window_ms": 10,
+}
+
+
+def load_backend_config(path: str = BACKENDS_PATH) -> dict:
+    if not os.path.exists(path):
+        return {"default": {}, "agents": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return {"default": config.get("default", {}), "agents": config.get("agents", {})}
+
+
+class MicroBatcher:
+    """Send requests that arrive within a short window to the server together.
+
+    The chat completions API takes one conversation per request, so a batch
+    is a burst of concurrent requests that a batching inference server can
+    schedule together. At most `max_size` requests are in flight at once.
+    """
+
+    def __init__(self, send, max_size: int, window: float):
+        self.send = send
+        self.max_size = max_size
+        self.window = window
+        self.queue = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=max_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.batch_sizes = []
+
+    def submit(self, *args, **kwargs) -> Future:
+        future = Future()
+        # Keep the caller's context (e.g. the current stage) for metrics
+        self.queue.put((future, contextvars.copy_context(), args, kwargs))
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._collect, daemon=True)
+                self.thread.start()
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batch_sizes.append(len(batch))
+            for item in batch:
+                self.pool.submit(self._run, *item)
+
+    def _run(self, future, context, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(self.send, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+
+class Backend:
+    def __init__(self, base_url, model, api_key_env, max_batch_size, batch_window_ms):
+        self.base_url = base_url
+        self.model = model
+        self.api_key_env = api_key_env
+        self.lock = threading.Lock()
+        self._client = None
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = MicroBatcher(
+                self._send, max_batch_size, batch_window_ms / 1000
+            )
+
+    @property
+    def client(self):
+        # Created on first use, so replaying a cassette needs no API key (and
+        # a run that sends no requests never imports openai)
+        with self.lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                api_key = os.getenv(self.api_key_env)
+                if api_key is None and self.base_url:
+                    api_key = "unused"  # local servers usually ignore the key
+                self._client = OpenAI(api_key=api_key, base_url=self.base_url)
+            return self._client
+
+    @property
+    def chat(self):
+        # Lets the backend stand in for its client in chat_completion, which
+        # only touches the client for requests a cassette doesn't answer
+        return self.client.chat
+
+    def _send(self, messages: list, **kwargs):
+        return chat_completion(self, self.model, messages, **kwargs)
+
+    def complete(self, messages: list, **kwargs):
+        if self.batcher is None:
+            return self._send(messages, **kwargs)
+        return self.batcher.submit(messages, **kwargs).result()
+
+
+class Cascade:
+    """Backends tried in order, cheapest first.
+
+    An answer goes back to the agent unless its `validate` callback finds
+    problems with it; then the next tier is asked. The last tier's answer
+    is returned whatever it looks like.
+    """
+
+    def __init__(self, agent: str, tiers: list[Backend]):
+        self.agent = agent
+        self.tiers = tiers
+        self.model = tiers[0].model
+
+    def complete(self, messages: list, validate=None, **kwargs):
+        for n, tier in enumerate(self.tiers):
+            last = n == len(self.tiers) - 1
+            try:
+                response = tier.complete(messages, **kwargs)
+            except CassetteMiss:
+                raise  # another tier's request would be a different miss
+            except Exception as e:
+                if last:
+                    raise
+                problems = [f"{type(e).__name__}: {e}"]
+            else:
+                # Placeholders for queued batch requests are judged next round
+                if last or validate is None or is_placeholder(response):
+                    return response
+                problems = validate(response.choices[0].message.content or "")
+                if not problems:
+                    return response
+            following = self.tiers[n + 1].model
+            print(
+                f"↗️ {self.agent}: {tier.model} answer rejected ({problems[0]}), "
+                f"escalating to {following}"
+            )
+            METRICS.escalate(self.agent, tier.model, following, problems[0])
+
+
+_BACKENDS = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+def _agent_settings(agent: str, default_model: str) -> dict:
+    config = load_backend_config()
+    settings = {
+        **DEFAULTS,
+        **config["default"],
+        **config["agents"].get(agent, {}),
+    }
+    settings["model"] = settings["model"] or default_model
+    return settings
+
+
+def _shared_backend(settings: dict) -> Backend:
+    key = tuple(sorted(settings.items()))
+    with _BACKENDS_LOCK:
+        if key not in _BACKENDS:
+            _BACKENDS[key] = Backend(**settings)
+        return _BACKENDS[key]
+
+
+def get_backend(
+    agent: str, model: str | None = None, default_model: str = "gpt-4o-mini"
+) -> Backend:
+    """The backend `agent` should use; agents with equal settings share one."""
+    settings = _agent_settings(agent, default_model)
+    settings.pop("cascade", None)
+    if model:
+        settings["model"] = model
+    return _shared_backend(settings)
+
+
+def get_cascade(
+    agent: str, model: str | None = None, default_model: str = "gpt-4o-mini"
+) -> Cascade:
+    """The model cascade `agent` should use.
+
+    Without a "cascade" setting, or with an explicit `model`, it has a single
+    tier: the agent's backend.
+    """
+    settings = _agent_settings(agent, default_model)
+    tiers = settings.pop("cascade", None)
+    if model or not tiers:
+        return Cascade(agent, [get_backend(agent, model, default_model)])
+    return Cascade(agent, [_shared_backend({**settings, **tier}) for tier in tiers])
@@ -0,0 +1,395 @@
+import json
+import os
+import threading
+import time
+import uuid
+from functools import cache
+
+import config  # noqa: F401  (loads .env first)
+from cassette import Cassette, fingerprint
+from pipeline import CURRENT_STAGE, defer, stop_if_cancelled
+
+# Transient API errors retried by chat_completion, on top of the client's own
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+
+@cache
+def retryable_errors() -> tuple:
+    # openai is imported on the first request, not when the pipeline starts
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+# USD per 1M tokens: (prompt, cached prompt, completion). Models missing here
+# are reported with a cost of 0.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+class PromptCacheStats:
+    # Prompt and cached prompt tokens per template, to check prefix caching
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_template = {}
+
+    def reset(self):
+        with self.lock:
+            self.by_template = {}
+
+    def record(self, template: str, prompt_tokens: int, cached_tokens: int):
+        with self.lock:
+            stats = self.by_template.setdefault(
+                template, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+            )
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                template: {
+                    **stats,
+                    "hit_ratio": (
+                        stats["cached_tokens"] / stats["prompt_tokens"]
+                        if stats["prompt_tokens"]
+                        else 0.0
+                    ),
+                }
+                for template, stats in self.by_template.items()
+            }
+
+    def print_report(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("\n🗄️ Prompt cache:")
+        for template, stats in sorted(summary.items()):
+            print(
+                f"  {template:<28} {stats['calls']:>4} calls  "
+                f"{stats['cached_tokens']:>8}/{stats['prompt_tokens']:<8} tokens cached "
+                f"({stats['hit_ratio']:.0%})"
+            )
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+CACHE_STATS = PromptCacheStats()
+
+
+class CallRecord:
+    def __init__(self, agent, model, template, stage):
+        self.agent = agent or "unknown"
+        self.model = model
+        self.template = template or "untemplated"
+        self.stage = stage or "unstaged"
+        self.started = time.time()
+        self.latency = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.outcome = "ok"
+        self.source = "api"  # api | cassette | batch
+
+    @property
+    def cost(self) -> float:
+        prompt, cached, completion = MODEL_PRICES.get(self.model, (0.0, 0.0, 0.0))
+        return (
+            (self.prompt_tokens - self.cached_tokens) * prompt
+            + self.cached_tokens * cached
+            + self.completion_tokens * completion
+        ) / 1_000_000
+
+    def to_dict(self) -> dict:
+        return {**vars(self), "cost_usd": self.cost}
+
+
+def _aggregate(records: list[CallRecord]) -> dict:
+    latencies = sorted(r.latency for r in records)
+    return {
+        "calls": len(records),
+        "errors": sum(1 for r in records if r.outcome.startswith("error")),
+        "deferred": sum(1 for r in records if r.outcome == "deferred"),
+        "retries": sum(r.retries for r in records),
+        "prompt_tokens": sum(r.prompt_tokens for r in records),
+        "completion_tokens": sum(r.completion_tokens for r in records),
+        "cached_tokens": sum(r.cached_tokens for r in records),
+        "cost_usd": sum(r.cost for r in records),
+        "latency_total": sum(latencies),
+        "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "latency_max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def new_run_id() -> str:
+    # Sortable by start time, and unique across processes started together
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class RunMetrics:
+    # Every LLM request of a run: who made it, what it cost and how it went
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.run_id = new_run_id()
+        self.records = []
+        self.escalations = []
+
+    def reset(self, run_id: str | None = None):
+        # Start a new run in a process that runs several (see audit_service.py)
+        with self.lock:
+            self.run_id = run_id or new_run_id()
+            self.records = []
+            self.escalations = []
+
+    def add(self, record: CallRecord):
+        with self.lock:
+            self.records.append(record)
+
+    def escalate(self, agent: str, model: str, to_model: str, reason: str):
+        # An answer the model cascade rejected and asked a stronger model for
+        with self.lock:
+            self.escalations.append(
+                {
+                    "agent": agent or "unknown",
+                    "stage": CURRENT_STAGE.get() or "unstaged",
+                    "model": model,
+                    "to_model": to_model,
+                    "reason": reason,
+                }
+            )
+
+    def snapshot(self) -> list[CallRecord]:
+        with self.lock:
+            return list(self.records)
+
+    def grouped(self, key: str) -> dict[str, dict]:
+        groups = {}
+        for record in self.snapshot():
+            groups.setdefault(getattr(record, key), []).append(record)
+        return {name: _aggregate(records) for name, records in sorted(groups.items())}
+
+    def report(self) -> dict:
+        records = self.snapshot()
+        return {
+            "run_id": self.run_id,
+            "run": _aggregate(records),
+            "stages": self.grouped("stage"),
+            "agents": self.grouped("agent"),
+            "models": self.grouped("model"),
+            "escalations": list(self.escalations),
+            "calls": [record.to_dict() for record in records],
+        }
+
+    def print_report(self):
+        stages = self.grouped("stage")
+        if not stages:
+            return
+        print("\n📈 LLM usage by stage:")
+        for stage, stats in stages.items():
+            print(
+                f"  {stage:<20} {stats['calls']:>4} calls  "
+                f"{stats['prompt_tokens']:>8} in / {stats['completion_tokens']:<7} out  "
+                f"{stats['latency_total']:7.1f}s  ${stats['cost_usd']:.4f}  "
+                f"{stats['errors']} errors"
+            )
+        if self.escalations:
+            agents = {}
+            for escalation in self.escalations:
+                agents[escalation["agent"]] = agents.get(escalation["agent"], 0) + 1
+            print(
+                f"  ↗️ {len(self.escalations)} escalations: "
+                + ", ".join(f"{agent} {n}" for agent, n in sorted(agents.items()))
+            )
+
+    def save_json(self, path: str, **extra):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**self.report(), **extra}, f, indent=2)
+
+    def save_prometheus(self, path: str):
+        # Textfile-collector format; written atomically so a scrape never
+        # sees a half-written file
+        groups = {}
+        for r in self.snapshot():
+            labels = (r.stage, r.agent, r.model, r.outcome)
+            groups.setdefault(labels, []).append(r)
+
+        lines = [
+            "# HELP llm_requests_total LLM requests made by the pipeline.",
+            "# TYPE llm_requests_total counter",
+            "# HELP llm_retries_total Retries of transient LLM API errors.",
+            "# TYPE llm_retries_total counter",
+            "# HELP llm_tokens_total Tokens used by LLM requests.",
+            "# TYPE llm_tokens_total counter",
+            "# HELP llm_cost_usd_total Estimated cost of LLM requests in USD.",
+            "# TYPE llm_cost_usd_total counter",
+            "# HELP llm_request_latency_seconds Wall time of LLM requests.",
+            "# TYPE llm_request_latency_seconds summary",
+        ]
+        for (stage, agent, model, outcome), records in sorted(groups.items()):
+            stats = _aggregate(records)
+            labels = (
+                f'run_id="{self.run_id}",stage="{_label(stage)}",agent="{_label(agent)}",'
+                f'model="{_label(model)}",outcome="{_label(outcome)}"'
+            )
+            lines.append(f"llm_requests_total{{{labels}}} {stats['calls']}")
+            lines.append(f"llm_retries_total{{{labels}}} {stats['retries']}")
+            for kind in ("prompt", "completion", "cached"):
+                lines.append(
+                    f'llm_tokens_total{{{labels},kind="{kind}"}} {stats[kind + "_tokens"]}'
+                )
+            lines.append(f"llm_cost_usd_total{{{labels}}} {stats['cost_usd']:.6f}")
+            lines.append(
+                f"llm_request_latency_seconds_sum{{{labels}}} {stats['latency_total']:.6f}"
+            )
+            lines.append(
+                f"llm_request_latency_seconds_count{{{labels}}} {stats['calls']}"
+            )
+
+        escalated = {}
+        for e in list(self.escalations):
+            labels = (e["stage"], e["agent"], e["model"], e["to_model"])
+            escalated[labels] = escalated.get(labels, 0) + 1
+        lines += [
+            "# HELP llm_escalations_total Answers rejected by the model cascade.",
+            "# TYPE llm_escalations_total counter",
+        ]
+        for (stage, agent, model, to_model), count in sorted(escalated.items()):
+            lines.append(
+                f'llm_escalations_total{{run_id="{self.run_id}",stage="{_label(stage)}",'
+                f'agent="{_label(agent)}",model="{_label(model)}",'
+                f'to_model="{_label(to_model)}"}} {count}'
+            )
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+METRICS = RunMetrics()
+CASSETTE = Cassette.from_env()
+# Set to a batch_jobs.BatchQueue by the orchestrator's --batch mode
+BATCH = None
+
+
+def _placeholder(model: str):
+    # Stands in for a queued request so the stage can queue the rest of its
+    # requests in the same round; the stage's outputs are discarded
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(
+        {
+            "id": "deferred",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": ""},
+                }
+            ],
+        }
+    )
+
+
+def is_placeholder(response) -> bool:
+    return getattr(response, "id", None) == "deferred"
+
+
+def usage_tokens(response) -> tuple[int, int, int]:
+    # (prompt, completion, cached prompt) tokens; any of them may be missing
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    return (
+        getattr(usage, "prompt_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", 0) or 0,
+        cached or 0,
+    )
+
+
+def chat_completion(
+    client,
+    model: str,
+    messages: list,
+    template: str | None = None,
+    agent: str | None = None,
+    **kwargs,
+):
+    """Shared call path for every agent's chat completion request.
+
+    Retries transient API errors and records tokens, latency, retries and
+    outcome of the call in METRICS. Errors are re-raised to the agent. With a
+    cassette configured, responses are recorded or replayed (see cassette.py);
+    in batch mode, requests are answered from or queued for a batch job.
+    """
+    record = CallRecord(agent, model, template, CURRENT_STAGE.get())
+    key = None
+    if CASSETTE is not None or BATCH is not None:
+        key = fingerprint(model, messages, kwargs)
+    start = time.perf_counter()
+    try:
+        response = None
+        if BATCH is not None:
+            response = BATCH.lookup(key, template)
+            if response is None:
+                body = {"model": model, "messages": messages, **kwargs}
+                BATCH.enqueue(client, key, body, record.stage, template)
+                defer()
+                record.outcome = "deferred"
+                return _placeholder(model)
+            record.source = "batch"
+        elif CASSETTE is not None:
+            response = CASSETTE.replay(key, template)
+            if response is not None:
+                record.source = "cassette"
+        while response is None:
+            # A timed-out stage makes no more requests
+            stop_if_cancelled()
+            try:
+                response = client.chat.completions.create(
+                    model=model, messages=messages, **kwargs
+                )
+                if CASSETTE is not None:
+                    CASSETTE.record(
+                        key, template, response, time.perf_counter() - start
+                    )
+            except retryable_errors():
+                if record.retries >= MAX_RETRIES:
+                    raise
+                record.retries += 1
+                time.sleep(min(2**record.retries, 30))
+    except Exception as e:
+        record.outcome = f"error:{type(e).__name__}"
+        raise
+    finally:
+        record.latency = time.perf_counter() - start
+        METRICS.add(record)
+
+    prompt_tokens, completion_tokens, cached_tokens = usage_tokens(response)
+    record.prompt_tokens = prompt_tokens
+    record.completion_tokens = completion_tokens
+    record.cached_tokens = cached_tokens
+    CACHE_STATS.record(record.template, prompt_tokens, cached_tokens)
+    return response
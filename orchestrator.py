@@ -1,102 +1,271 @@
+import hashlib
 import os
 import json
-
-from issue_agents import (
-    DomAgent,
-    CssAgent,
-    JsAgent,
-    read_css_files,
-    read_js_files,
-    chunk_text,
+from concurrent.futures import ThreadPoolExecutor
+
+import config  # noqa: F401  (loads .env first)
+from assets import AssetFiles, read_assets
+from issue_clustering import cluster_issues
+from request_planner import attribute_file, plan_requests
+from issue_routing import build_routing_index
+from document import clear_documents
+from issue_store import IssueStore
+from output_tree import materialize, save_manifest, write_output
+from verification import FileVerification, print_summary, save_report, verify_file
+from prompt_minify import ENABLED as MINIFY_PROMPTS, for_prompt
+from prompt_templates import PROMPTS
+import llm_client
+from llm_client import CACHE_STATS, METRICS
+from pipeline import (
+    Stage,
+    has_deferred,
+    stop_if_deferred,
+    run_in_rounds,
+    run_pipeline,
+    stage_report,
+    with_stage,
 )
-from js_corrector_agent import JsCorrectorAgent
-from css_corrector_agent import CssCorrectorAgent
-from html_audio_video_tool_agent import ExternalToolRecommenderAgent
-from html_corrector_agent import HtmlCorrectorAgent
-from image_captioning_agent import ImageCaptioningAgent
+from profiling import Profiler, timed
+
+# Seconds a single stage may run before it is abandoned
+STAGE_TIMEOUT = float(os.getenv("STAGE_TIMEOUT", "600"))
+# "regions" corrects only affected landmark subtrees; "document" rewrites the page
+HTML_CORRECTION_MODE = os.getenv("HTML_CORRECTION_MODE", "regions")
+# Site to audit, where corrected files go and where run artifacts go
+SITE_DIR = os.getenv("SITE_DIR", "before")
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "after")
+OUTPUTS_DIR = os.getenv("OUTPUTS_DIR", "outputs")
+# Analysis requests of one stage sent at a time (lets backends batch them)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+# SQLite store of every run's issues, captions and corrections
+ISSUE_DB = os.getenv("ISSUE_DB", os.path.join(OUTPUTS_DIR, "issues.db"))
+# Corrections of a file re-requested after failing verification
+VERIFY_RETRIES = int(os.getenv("VERIFY_RETRIES", "1"))
+# "0" verifies with static checks only, without re-running the analysis agents
+VERIFY_ANALYSIS = os.getenv("VERIFY_ANALYSIS", "1") != "0"
+# "0" analyzes every file, instead of reusing what the issue store holds for
+# files with the same content (shared stylesheets, libraries, unchanged pages)
+ANALYSIS_CACHE = os.getenv("ANALYSIS_CACHE", "1") != "0"
+# Bump when a change to analysis or issue attribution makes stored results stale
+ANALYSIS_VERSION = 1
+
+KINDS = ("html", "css", "js")
+# Kinds of file the current run works on (audit --only)
+ONLY = KINDS
+
+
+def save_issues(category: str, records: list[dict]) -> list[str]:
+    # Merge near-duplicates, keep provenance in the cluster file and the
+    # representative texts in the flat per-category list used downstream
+    clusters = cluster_issues(records, category)
+    issues = [cluster["text"] for cluster in clusters]
+    print(f"🧮 {category.upper()}: {len(records)} issues → {len(clusters)} after dedup")
+
+    STORE.add_issues(METRICS.run_id, category, clusters)
+    # JSON exports for tools that read the flat lists
+    STORE.export_json(
+        METRICS.run_id,
+        category,
+        os.path.join(OUTPUTS_DIR, "issues", f"accessibility_issues_{category}.json"),
+    )
+    with open(
+        os.path.join(OUTPUTS_DIR, "issues", f"issue_clusters_{category}.json"),
+        "w",
+        encoding="utf-8",
+    ) as f:
+        json.dump(clusters, f, indent=2, ensure_ascii=False)
+    return issues
 
 
-def analyze_accessibility_issues():
-    print("📄 Reading HTML, CSS, and JS files...")
+def analyzer_key(agent) -> str:
+    # Everything that shapes what an agent finds in a file
+    models = "+".join(tier.model for tier in agent.backend.tiers)
+    return (
+        f"{PROMPTS[agent.prompt].key}/{models}/"
+        f"minify={int(MINIFY_PROMPTS)}/v{ANALYSIS_VERSION}"
+    )
+
 
-    with open("before/index.html", "r", encoding="utf-8") as f:
+def cached_analyses(kind: str, analyzer: str, digests) -> dict[str, list[str]]:
+    if not ANALYSIS_CACHE:
+        return {}
+    return STORE.cached_analyses(kind, analyzer, digests)
+
+
+def save_analyses(kind: str, analyzer: str, results: dict[str, list[str]]):
+    # Answers still queued in a batch, lost to an API error (an empty issue)
+    # or not parsed as a list are not results, so a later run asks again
+    from issue_agents import Unparsed
+
+    results = {
+        d: found
+        for d, found in results.items()
+        if all(found) and not isinstance(found, Unparsed)
+    }
+    if ANALYSIS_CACHE and results and not has_deferred():
+        STORE.save_analyses(kind, analyzer, results)
+
+
+def analyze_html():
+    print("📄 Reading HTML file...")
+    with open(os.path.join(SITE_DIR, "index.html"), "r", encoding="utf-8") as f:
         html_code = f.read()
 
-    css_files = read_css_files("before/css")
-    css_code = "\n".join(css_files.values())
+    print("🔍 Running HTML accessibility analysis...")
+    from issue_agents import DomAgent
+
+    agent = DomAgent()
+    analyzer = analyzer_key(agent)
+    digest = hashlib.sha256(html_code.encode("utf-8")).hexdigest()
+    cached = cached_analyses("html", analyzer, [digest])
+    if digest in cached:
+        print("♻️ Reused the HTML analysis of an identical page.")
+        dom_issues = cached[digest]
+    else:
+        dom_issues = agent.analyze(for_prompt(html_code, "html").text)
+        stop_if_deferred()
+        save_analyses("html", analyzer, {digest: dom_issues})
+    dom_issues = save_issues(
+        "html", [{"text": issue, "file": "index.html"} for issue in dom_issues]
+    )
+    print("✅ HTML accessibility issues saved.")
+    return dom_issues, html_code
+
+
+def analyze_files(agent, files: AssetFiles, kind: str) -> list[dict]:
+    # Files analyzed before, here or on another site, by the same analyzer
+    # reuse their stored issues; only the rest are sent
+    from issue_agents import Unparsed
+
+    analyzer = analyzer_key(agent)
+    digests = {name: files.assets[name].digest for name in files}
+    cached = cached_analyses(kind, analyzer, digests.values())
+    issues = [
+        {"text": issue, "file": name}
+        for name in files
+        if digests[name] in cached
+        for issue in cached[digests[name]]
+    ]
+    fresh = files.only(name for name in files if digests[name] not in cached)
+    if len(fresh) < len(files):
+        print(
+            f"♻️ Reused the {kind.upper()} analysis of "
+            f"{len(files) - len(fresh)} of {len(files)} files."
+        )
+    if not fresh:
+        return issues
+
+    # Files are read and minified again as requests are rendered, so only
+    # the requests in flight are held in memory
+    minified = fresh.derive(lambda code: for_prompt(code, kind).text)
+    requests = plan_requests(minified, kind)
+    print(
+        f"📦 Packed {len(fresh)} {kind.upper()} files "
+        f"({fresh.total_bytes / 1e6:.1f} MB) into {len(requests)} requests."
+    )
 
-    js_files = read_js_files("before/js")
-    all_js_code = "\n".join(js_files.values())
-    js_chunks = chunk_text(all_js_code)
+    def analyze(request):
+        with timed(f"analyze_{kind}", ", ".join(request.files)):
+            return agent.analyze(request.render())
+
+    with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+        results = list(executor.map(with_stage(analyze), requests))
+    stop_if_deferred()
+
+    by_file = {name: [] for name in fresh}
+    for i, (request, found) in enumerate(zip(requests, results)):
+        if isinstance(found, Unparsed):
+            for name in request.files:
+                by_file.pop(name, None)
+        for issue in found:
+            name = attribute_file(issue, request.files)
+            issues.append({"text": issue, "chunk": i, "file": name})
+            if name is None:
+                # Files whose issues can't be told apart aren't stored
+                for other in request.files:
+                    by_file.pop(other, None)
+            elif name in by_file:
+                by_file[name].append(issue)
+    save_analyses(
+        kind, analyzer, {digests[name]: found for name, found in by_file.items()}
+    )
+    return issues
 
-    print("🔍 Running accessibility analysis...")
 
-    dom_agent = DomAgent()
-    css_agent = CssAgent()
-    js_agent = JsAgent()
+def analyze_css():
+    from issue_agents import CssAgent, read_css_files
 
-    dom_issues = dom_agent.analyze(html_code)
-    css_issues = css_agent.analyze(css_code)
-    js_issues = []
-    for chunk in js_chunks:
-        js_issues.extend(js_agent.analyze(chunk))
+    print("📄 Reading CSS files...")
+    css_files = read_css_files(os.path.join(SITE_DIR, "css"))
 
-    print("💾 Saving accessibility issues to JSON files...")
+    print("🔍 Running CSS accessibility analysis...")
+    css_issues = save_issues("css", analyze_files(CssAgent(), css_files, "css"))
+    print("✅ CSS accessibility issues saved.")
+    return css_issues, css_files
 
-    os.makedirs("outputs/issues", exist_ok=True)
-    with open(
-        "outputs/issues/accessibility_issues_html.json", "w", encoding="utf-8"
-    ) as f:
-        json.dump(dom_issues, f, indent=2, ensure_ascii=False)
-    with open(
-        "outputs/issues/accessibility_issues_css.json", "w", encoding="utf-8"
-    ) as f:
-        json.dump(css_issues, f, indent=2, ensure_ascii=False)
-    with open(
-        "outputs/issues/accessibility_issues_js.json", "w", encoding="utf-8"
-    ) as f:
-        json.dump(js_issues, f, indent=2, ensure_ascii=False)
 
-    print("✅ Accessibility issues saved.")
+def analyze_js():
+    from issue_agents import JsAgent, read_js_files
+
+    print("📄 Reading JS files...")
+    js_files = read_js_files(os.path.join(SITE_DIR, "js"))
+
+    print("🔍 Running JS accessibility analysis...")
+    js_issues = save_issues("js", analyze_files(JsAgent(), js_files, "js"))
+    print("✅ JS accessibility issues saved.")
+    return js_issues, js_files
+
+
+def analyze_accessibility_issues():
+    dom_issues, html_code = analyze_html()
+    css_issues, css_files = analyze_css()
+    js_issues, js_files = analyze_js()
     return dom_issues, css_issues, js_issues, html_code, css_files, js_files
 
 
-def generate_image_captions():
+def generate_image_captions(dom_issues: list[str] | None = None):
     print("📦 Generating external tool tasks from HTML issues...")
 
-    issues_path = "outputs/issues/accessibility_issues_html.json"
     captions = {}
 
-    if os.path.exists(issues_path):
-        with open(issues_path, "r", encoding="utf-8") as f:
-            issues = json.load(f)
+    if dom_issues is None:
+        dom_issues = STORE.issue_texts(METRICS.run_id, "html")
+
+    if dom_issues:
+        issues = dom_issues
+        from html_audio_video_tool_agent import ExternalToolRecommenderAgent
 
         recommender = ExternalToolRecommenderAgent()
         tool_tasks = recommender.recommend_tools(issues)  # use updated method
+        stop_if_deferred()
 
-        os.makedirs("outputs/tools", exist_ok=True)
-        with open("outputs/tools/external_tool_tasks.json", "w", encoding="utf-8") as f:
+        tasks_path = os.path.join(OUTPUTS_DIR, "tools", "external_tool_tasks.json")
+        os.makedirs(os.path.dirname(tasks_path), exist_ok=True)
+        with open(tasks_path, "w", encoding="utf-8") as f:
             json.dump(tool_tasks, f, indent=2)
 
-        print("✅ External tool tasks saved to outputs/tools/external_tool_tasks.json")
+        print(f"✅ External tool tasks saved to {tasks_path}")
 
         # tool_tasks is dict: { "image_captioning_tool": [file1, file2], ... }
         image_files = tool_tasks.get("image_captioning_tool", [])
 
         if image_files:
             print("🧠 Running image captioning agent...")
+            from image_captioning_agent import ImageCaptioningAgent
+
             api_key = "sk-proj-..."  # Replace with your actual API key
             agent = ImageCaptioningAgent(api_key=api_key)
             # Pass relative file paths as-is (like "images/filename.jpg")
-            captions = agent.process_images(image_files)
+            captions = agent.process_images(image_files, base_dir=SITE_DIR)
+            stop_if_deferred()
 
-            os.makedirs("outputs/captions", exist_ok=True)
-            with open(
-                "outputs/captions/image_captions.json", "w", encoding="utf-8"
-            ) as f:
+            captions_path = os.path.join(OUTPUTS_DIR, "captions", "image_captions.json")
+            os.makedirs(os.path.dirname(captions_path), exist_ok=True)
+            with open(captions_path, "w", encoding="utf-8") as f:
                 json.dump(captions, f, indent=2, ensure_ascii=False)
+            STORE.add_captions(METRICS.run_id, captions)
 
-            print("✅ Captions saved to outputs/captions/image_captions.json")
+            print(f"✅ Captions saved to {captions_path}")
         else:
             print("⚠️ No image files found for captioning.")
     else:
@@ -105,49 +274,492 @@ def generate_image_captions():
     return captions
 
 
-def correct_html(dom_issues, html_code, image_captions):
+def captioned_images(image_captions) -> set[str]:
+    # Images the alt_text stage writes a caption into; None if captioning failed
+    from alt_text import CaptionIndex
+
+    return set(CaptionIndex(image_captions or {}).by_path)
+
+
+def correct_html(dom_issues, html_code):
     print("🛠️ Correcting HTML issues...")
-    os.makedirs("after", exist_ok=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    from html_corrector_agent import HtmlCorrectorAgent
+
     agent = HtmlCorrectorAgent()
     corrected = agent.analyze_and_correct(
-        {"index.html": html_code}, dom_issues, image_captions=image_captions
+        {"index.html": html_code},
+        dom_issues,
+        mode=HTML_CORRECTION_MODE,
+    )
+    stop_if_deferred()
+
+    html_path = os.path.join(OUTPUT_DIR, "index.html")
+    write_output(
+        html_path, corrected["index.html"], os.path.join(SITE_DIR, "index.html")
     )
+    print(f"✅ Corrected HTML saved to {html_path}")
+    return corrected["index.html"]
+
+
+def apply_image_captions(corrected_html, image_captions):
+    print("🖼️ Writing image captions into alt attributes...")
+    from alt_text import inject_alt_text
+
+    # Without captions (the captioning stage failed) the page passes through
+    html_code, updated = inject_alt_text(corrected_html, image_captions or {})
 
-    with open("after/index.html", "w", encoding="utf-8") as f:
-        f.write(corrected["index.html"])
-    print("✅ Corrected HTML saved to after/index.html")
+    html_path = os.path.join(OUTPUT_DIR, "index.html")
+    write_output(html_path, html_code, os.path.join(SITE_DIR, "index.html"))
+    print(f"✅ Alt text set on {updated} images in {html_path}")
+    return html_code
 
 
 def correct_css(css_issues, css_files):
     print("🎨 Correcting CSS issues...")
-    os.makedirs("after/css", exist_ok=True)
+    css_dir = os.path.join(OUTPUT_DIR, "css")
+    os.makedirs(css_dir, exist_ok=True)
+    from css_corrector_agent import CssCorrectorAgent
+
     agent = CssCorrectorAgent()
-    corrected = agent.analyze_and_correct(css_files, css_issues)
+    corrected = agent.correct_files(
+        css_files, css_issues, hints=STORE.issue_files(METRICS.run_id, "css")
+    )
+    stop_if_deferred()
 
     for filename, corrected_code in corrected.items():
-        with open(os.path.join("after/css", filename), "w", encoding="utf-8") as f:
-            f.write(corrected_code)
-    print("✅ Corrected CSS files saved to after/css/")
+        write_output(
+            os.path.join(css_dir, filename),
+            corrected_code,
+            os.path.join(SITE_DIR, "css", filename),
+        )
+    print(f"✅ Corrected CSS files saved to {css_dir}/")
+    return corrected
 
 
 def correct_js(js_issues, js_files):
     print("🧠 Correcting JS issues...")
-    os.makedirs("after/js", exist_ok=True)
+    js_dir = os.path.join(OUTPUT_DIR, "js")
+    os.makedirs(js_dir, exist_ok=True)
+    from js_corrector_agent import JsCorrectorAgent
+
     agent = JsCorrectorAgent()
-    corrected = agent.analyze_and_correct(js_files, js_issues)
+    corrected = agent.correct_files(
+        js_files, js_issues, hints=STORE.issue_files(METRICS.run_id, "js")
+    )
+    stop_if_deferred()
 
     for filename, corrected_code in corrected.items():
-        with open(os.path.join("after/js", filename), "w", encoding="utf-8") as f:
-            f.write(corrected_code)
-    print("✅ Corrected JS files saved to after/js/")
+        write_output(
+            os.path.join(js_dir, filename),
+            corrected_code,
+            os.path.join(SITE_DIR, "js", filename),
+        )
+    print(f"✅ Corrected JS files saved to {js_dir}/")
+    return corrected
+
+
+def recorrect(kind, name, before, issues, errors, image_captions):
+    # The rejection goes into the request as one more issue, so the retry is
+    # not the same request answered the same way
+    from alt_text import inject_alt_text
+    from css_corrector_agent import CssCorrectorAgent
+    from html_corrector_agent import HtmlCorrectorAgent
+    from js_corrector_agent import JsCorrectorAgent
+
+    note = (
+        f"The previous correction of {name} was rejected ({'; '.join(errors)}). "
+        f"Return the complete file as valid {kind.upper()}."
+    )
+    if kind == "html":
+        # Region prompts would drop the note, which names no region
+        corrected = HtmlCorrectorAgent().analyze_and_correct(
+            {name: before},
+            issues + [note],
+            mode="document",
+            captioned=captioned_images(image_captions),
+        )[name]
+        return inject_alt_text(corrected, image_captions or {})[0]
+    agent = CssCorrectorAgent() if kind == "css" else JsCorrectorAgent()
+    return agent.correct_files({name: before}, issues + [note])[name]
+
+
+def verify_corrections(
+    dom_issues,
+    css_issues,
+    js_issues,
+    html_code,
+    css_files,
+    js_files,
+    image_captions,
+    final_html,
+    corrected_css,
+    corrected_js,
+):
+    print("🔬 Verifying corrected files...")
+    from issue_agents import CssAgent, DomAgent, JsAgent
+
+    # (kind, name, originals, corrections, issues the file was corrected
+    # for); texts are looked up when the file is verified, not all at once
+    targets = []
+    if "html" in ONLY:
+        targets.append(
+            (
+                "html",
+                "index.html",
+                {"index.html": html_code},
+                {"index.html": final_html},
+                dom_issues,
+            )
+        )
+    for kind, files, corrected, issues in (
+        ("css", css_files, corrected_css or {}, css_issues),
+        ("js", js_files, corrected_js or {}, js_issues),
+    ):
+        if kind not in ONLY:
+            continue
+        index = build_routing_index(
+            files, issues, kind, STORE.issue_files(METRICS.run_id, kind)
+        )
+        # Issues that matched no file were corrected over every candidate
+        targets += [
+            (
+                kind,
+                name,
+                files,
+                corrected,
+                index.by_file.get(name, [])
+                + (index.unrouted if name in index.candidates else []),
+            )
+            for name in files
+        ]
+    agents = {"html": DomAgent(), "css": CssAgent(), "js": JsAgent()}
+    paths = {
+        "html": OUTPUT_DIR,
+        "css": os.path.join(OUTPUT_DIR, "css"),
+        "js": os.path.join(OUTPUT_DIR, "js"),
+    }
+    sources = {
+        "html": SITE_DIR,
+        "css": os.path.join(SITE_DIR, "css"),
+        "js": os.path.join(SITE_DIR, "js"),
+    }
+
+    def verify(target) -> FileVerification:
+        kind, name, originals, corrections, issues = target
+        before, after = originals[name], corrections.get(name)
+        analyze = agents[kind].analyze if VERIFY_ANALYSIS else None
+        with timed(f"verify_{kind}", name):
+            result = verify_file(name, kind, before, after, issues, analyze)
+        if has_deferred():
+            return result  # judged on placeholder answers; verified next round
+        for _ in range(VERIFY_RETRIES):
+            if not result.failed or not issues:
+                break
+            print(f"🔁 {name} failed verification; correcting it again.")
+            after = recorrect(kind, name, before, issues, result.errors, image_captions)
+            with timed(f"verify_{kind}", name):
+                result = verify_file(name, kind, before, after, issues, analyze)
+            result.retried = True
+            if has_deferred():
+                return result
+        if result.failed:
+            # Better the original than a broken file
+            after, result.status = before, "reverted"
+        if result.retried or result.status == "reverted":
+            write_output(
+                os.path.join(paths[kind], name),
+                after,
+                os.path.join(sources[kind], name),
+            )
+        return result
+
+    with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS) as executor:
+        results = list(executor.map(with_stage(verify), targets))
+    stop_if_deferred()
+
+    print_summary(results)
+    STORE.add_verification(METRICS.run_id, results)
+    report_path = os.path.join(OUTPUTS_DIR, "verification", "verification.json")
+    save_report(report_path, results)
+    print(f"✅ Verification report saved to {report_path}")
+    return results
+
+
+STAGES = [
+    Stage("analyze_html", analyze_html, outputs=("dom_issues", "html_code")),
+    Stage("analyze_css", analyze_css, outputs=("css_issues", "css_files")),
+    Stage("analyze_js", analyze_js, outputs=("js_issues", "js_files")),
+    Stage(
+        "captions",
+        generate_image_captions,
+        inputs=("dom_issues",),
+        outputs=("image_captions",),
+        on_failure="skip",
+    ),
+    Stage(
+        "correct_html",
+        correct_html,
+        # Runs alongside captioning: the model writes alt text for every
+        # image, and alt_text then replaces it with the captions there are
+        inputs=("dom_issues", "html_code"),
+        outputs=("corrected_html",),
+        timeout=STAGE_TIMEOUT,
+        on_failure="skip",
+    ),
+    Stage(
+        "alt_text",
+        apply_image_captions,
+        inputs=("corrected_html", "image_captions"),
+        outputs=("final_html",),
+        on_failure="skip",
+        optional=("image_captions",),
+    ),
+    Stage(
+        "correct_css",
+        correct_css,
+        inputs=("css_issues", "css_files"),
+        outputs=("corrected_css",),
+        timeout=STAGE_TIMEOUT,
+        on_failure="skip",
+    ),
+    Stage(
+        "correct_js",
+        correct_js,
+        inputs=("js_issues", "js_files"),
+        outputs=("corrected_js",),
+        timeout=STAGE_TIMEOUT,
+        on_failure="skip",
+    ),
+    Stage(
+        "verify",
+        verify_corrections,
+        inputs=(
+            "dom_issues",
+            "css_issues",
+            "js_issues",
+            "html_code",
+            "css_files",
+            "js_files",
+            "image_captions",
+            "final_html",
+            "corrected_css",
+            "corrected_js",
+        ),
+        outputs=("verification",),
+        timeout=STAGE_TIMEOUT,
+        on_failure="skip",
+        # A failed captioning or correction stage leaves files uncorrected,
+        # which verification reports (and retries) file by file
+        optional=("image_captions", "final_html", "corrected_css", "corrected_js"),
+    ),
+]
+
+
+# Stages each command of audit.py runs; without a command, all of them
+COMMANDS = {
+    "analyze": ("analyze_html", "analyze_css", "analyze_js"),
+    "caption": ("captions", "alt_text"),
+    "correct": ("correct_html", "alt_text", "correct_css", "correct_js"),
+    "verify": ("verify",),
+}
+# The kind of file each stage works on; verify checks every selected kind
+STAGE_KINDS = {
+    "analyze_html": "html",
+    "analyze_css": "css",
+    "analyze_js": "js",
+    "captions": "html",
+    "correct_html": "html",
+    "alt_text": "html",
+    "correct_css": "css",
+    "correct_js": "js",
+    "verify": None,
+}
+
+
+def select_stages(command: str | None = None, only=KINDS) -> list[Stage]:
+    names = COMMANDS[command] if command else STAGE_KINDS
+    return [
+        stage
+        for stage in STAGES
+        if stage.name in names and STAGE_KINDS[stage.name] in (None, *only)
+    ]
+
+
+def stored_issues(category: str) -> list[str]:
+    # The issues of the site's latest run that has them, copied into this
+    # run so its exports and verification records are complete
+    source = STORE.latest_run(SITE_DIR, category, exclude=METRICS.run_id)
+    if source is None:
+        print(
+            f"⚠️ No stored {category.upper()} issues for {SITE_DIR}; "
+            "run `audit.py analyze` first."
+        )
+        return []
+    STORE.copy_issues(source, METRICS.run_id, category)
+    STORE.export_json(
+        METRICS.run_id,
+        category,
+        os.path.join(OUTPUTS_DIR, "issues", f"accessibility_issues_{category}.json"),
+    )
+    print(f"📥 {category.upper()} issues of run {source}.")
+    return STORE.issue_texts(METRICS.run_id, category)
+
+
+def read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def stored_captions() -> dict[str, str]:
+    path = os.path.join(OUTPUTS_DIR, "captions", "image_captions.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Inputs of a partial run that none of its stages produce, read back from
+# the issue store and the files of earlier runs: value -> (kind, loader,
+# value when the kind is not selected)
+LOADERS = {
+    "dom_issues": ("html", lambda: stored_issues("html"), []),
+    "css_issues": ("css", lambda: stored_issues("css"), []),
+    "js_issues": ("js", lambda: stored_issues("js"), []),
+    "html_code": ("html", lambda: read_text(os.path.join(SITE_DIR, "index.html")), ""),
+    "css_files": (
+        "css",
+        lambda: read_assets(os.path.join(SITE_DIR, "css"), ".css"),
+        {},
+    ),
+    "js_files": ("js", lambda: read_assets(os.path.join(SITE_DIR, "js"), ".js"), {}),
+    "image_captions": ("html", stored_captions, {}),
+    "corrected_html": (
+        "html",
+        lambda: read_text(os.path.join(OUTPUT_DIR, "index.html")),
+        "",
+    ),
+    "final_html": (
+        "html",
+        lambda: read_text(os.path.join(OUTPUT_DIR, "index.html")),
+        "",
+    ),
+    "corrected_css": (
+        "css",
+        lambda: read_assets(os.path.join(OUTPUT_DIR, "css"), ".css"),
+        {},
+    ),
+    "corrected_js": (
+        "js",
+        lambda: read_assets(os.path.join(OUTPUT_DIR, "js"), ".js"),
+        {},
+    ),
+}
+
+
+def load_inputs(stages: list[Stage]) -> dict:
+    produced = {output for stage in stages for output in stage.outputs}
+    needed = {name for stage in stages for name in stage.inputs} - produced
+    context = {}
+    for name, (kind, load, empty) in LOADERS.items():
+        if name in needed:
+            context[name] = load() if kind in ONLY else empty
+    return context
+
+
+STORE = IssueStore(ISSUE_DB)
+
+
+def run_audit(
+    batch: bool = False,
+    profile: bool = False,
+    cprofile: bool = False,
+    command: str | None = None,
+    only=KINDS,
+) -> dict:
+    """Audit SITE_DIR into OUTPUT_DIR; returns the stage results by name.
+
+    `command` (see COMMANDS) and `only` (file kinds) limit the stages run;
+    their other inputs come from earlier runs (see LOADERS). Metrics,
+    profiles and issues are recorded under METRICS.run_id.
+    """
+    global ONLY
+    ONLY = tuple(only)
+    stages, profiler, max_workers = select_stages(command, ONLY), None, None
+    if profile or cprofile:
+        profiler = Profiler(
+            os.path.join(OUTPUTS_DIR, "profiles", METRICS.run_id),
+            cprofile=cprofile,
+        )
+        stages, max_workers = profiler.wrap(stages), 1
+        profiler.start()
+    STORE.start_run(METRICS.run_id, SITE_DIR)
+    # Unchanged files are linked up front; the correction stages replace
+    # the ones they change
+    manifest = os.path.join(OUTPUTS_DIR, "corrected_files.json")
+    with timed("materialize", OUTPUT_DIR):
+        linked = materialize(SITE_DIR, OUTPUT_DIR, manifest)
+    print(
+        f"🔗 {OUTPUT_DIR}/: {linked['reflink'] + linked['link']} files linked, "
+        f"{linked['copy']} copied, {linked['kept']} already in place."
+    )
+    with timed("load_inputs", command or "audit"):
+        context = load_inputs(stages)
+    try:
+        if batch:
+            from batch_jobs import BatchQueue
+
+            queue = BatchQueue(os.path.join(OUTPUTS_DIR, "batches"))
+            llm_client.BATCH = queue
+            queue.wait()  # batches left open by an interrupted run
+            _, results = run_in_rounds(
+                stages, queue.wait, context, max_workers=max_workers
+            )
+        else:
+            _, results = run_pipeline(stages, context, max_workers=max_workers)
+    finally:
+        llm_client.BATCH = None
+        save_manifest(OUTPUT_DIR, manifest)
+        if profiler is not None:
+            profiler.stop()
+            profiler.save()
+    CACHE_STATS.print_report()
+    CACHE_STATS.save(os.path.join(OUTPUTS_DIR, "metrics", "prompt_cache.json"))
+    METRICS.print_report()
+    METRICS.save_json(
+        os.path.join(OUTPUTS_DIR, "metrics", f"run_{METRICS.run_id}.json"),
+        pipeline=stage_report(results),
+    )
+    METRICS.save_prometheus(os.path.join(OUTPUTS_DIR, "metrics", "llm.prom"))
+    ok = all(result.status == "ok" for result in results.values())
+    STORE.finish_run(METRICS.run_id, "ok" if ok else "incomplete")
+    return results
+
+
+def audit_site(
+    site_dir: str, output_dir: str, outputs_dir: str, run_id: str | None = None
+) -> dict:
+    """Audit one site in a process that audits many, one at a time.
+
+    Points this module's directories at the site and starts a new metrics
+    run; backends, clients and the issue store stay warm between sites.
+    """
+    global SITE_DIR, OUTPUT_DIR, OUTPUTS_DIR
+    SITE_DIR, OUTPUT_DIR, OUTPUTS_DIR = site_dir, output_dir, outputs_dir
+    METRICS.reset(run_id)
+    CACHE_STATS.reset()
+    clear_documents()
+    results = run_audit()
+    return {
+        "run_id": METRICS.run_id,
+        "stages": stage_report(results),
+        "llm": METRICS.report()["run"],
+    }
 
 
 if __name__ == "__main__":
-    dom_issues, css_issues, js_issues, html_code, css_files, js_files = (
-        analyze_accessibility_issues()
-    )
-    image_captions = generate_image_captions()
-    correct_html(dom_issues, html_code, image_captions)
-    correct_css(css_issues, css_files)
-    correct_js(js_issues, js_files)
-    print("\n🎉 All steps completed successfully!")
+    import sys
+
+    import audit
+
+    sys.exit(audit.main())
@@ -0,0 +1,191 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from pipeline import StageCancelled, stop_if_cancelled
+
+# The corrected site in OUTPUT_DIR is mostly the original site: images,
+# libraries and every file no stage changed. Those are linked to the
+# originals instead of copied, and only changed files take new space.
+#
+# Linked files share their data with the originals, so nothing may write
+# into them in place: every write goes to a temporary file that replaces
+# the link (write_output), which leaves the original untouched.
+
+# "auto" tries a reflink, then a hard link, then a copy; "copy" always copies
+OUTPUT_LINK_MODE = os.getenv("OUTPUT_LINK_MODE", "auto")
+
+# FICLONE from linux/fs.h: share the source's blocks copy-on-write
+_FICLONE = 0x40049409
+
+_digests = {}  # (path, size, mtime_ns) -> sha256 of the decoded text
+_lock = threading.Lock()
+# Absolute path -> sha256 of the correction write_output put there, or None
+# where it linked the original back (see save_manifest)
+_written = {}
+
+
+def text_digest(path: str) -> str | None:
+    """Hash of a text file as the pipeline reads it, or None if unreadable."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if key in _digests:
+            return _digests[key]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            digest = hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+    except (OSError, UnicodeDecodeError):
+        digest = None
+    with _lock:
+        _digests[key] = digest
+    return digest
+
+
+def _reflink(source: str, target: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return True
+        except OSError:
+            return False
+
+
+def link_or_copy(source: str, target: str) -> str:
+    """Put `source` at `target` atomically; returns how: reflink, link or copy."""
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp = f"{target}.tmp-{os.getpid()}-{threading.get_ident()}"
+    how = "copy"
+    try:
+        if OUTPUT_LINK_MODE == "auto":
+            if _reflink(source, tmp):
+                how = "reflink"
+            else:
+                os.remove(tmp)
+                try:
+                    os.link(source, tmp)
+                    how = "link"
+                except OSError as e:
+                    # Other filesystem, or one without hard links
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                        raise
+        if how == "copy":
+            shutil.copy2(source, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return how
+
+
+def write_output(path: str, text: str, source: str | None = None) -> bool:
+    """Write a corrected file atomically; returns True if it was linked.
+
+    When `text` is exactly what `source` (the original file) reads as, the
+    original is linked into place instead, so unchanged files cost nothing.
+    Raises StageCancelled instead if the calling stage has timed out.
+    """
+    stop_if_cancelled()
+    if source is not None:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if digest == text_digest(source):
+            if not os.path.exists(path) or not os.path.samefile(source, path):
+                link_or_copy(source, path)
+            with _lock:
+                _written[os.path.abspath(path)] = None
+            return True
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    try:
+        stop_if_cancelled()  # it may have timed out while writing
+    except StageCancelled:
+        os.remove(tmp)
+        raise
+    digest = _file_digest(tmp)
+    os.replace(tmp, path)
+    with _lock:
+        _written[os.path.abspath(path)] = digest
+    return False
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _load_manifest(manifest: str) -> dict[str, str]:
+    try:
+        with open(manifest, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(output_dir: str, manifest: str):
+    """Record in `manifest` the corrections written into `output_dir`.
+
+    The manifest maps each corrected file, relative to `output_dir`, to the
+    digest of what was written, and carries over entries of earlier runs
+    that this one didn't touch (runs of other commands or file kinds).
+    """
+    output_dir = os.path.abspath(output_dir)
+    entries = _load_manifest(manifest)
+    with _lock:
+        for path, digest in list(_written.items()):
+            if os.path.commonpath([path, output_dir]) != output_dir:
+                continue
+            del _written[path]  # recorded now
+            name = os.path.relpath(path, output_dir)
+            if digest is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = digest
+    os.makedirs(os.path.dirname(manifest) or ".", exist_ok=True)
+    tmp = f"{manifest}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+    os.replace(tmp, manifest)
+
+
+def materialize(
+    site_dir: str, output_dir: str, manifest: str | None = None
+) -> dict[str, int]:
+    """Link every file of `site_dir` into `output_dir`; returns counts by method.
+
+    Files already linked, and corrections an earlier run wrote (those in
+    `manifest`, still as written), are left alone. Every other file is
+    refreshed from `site_dir`, so nothing stale survives a changed original.
+    """
+    counts = {"reflink": 0, "link": 0, "copy": 0, "kept": 0}
+    site_dir = os.path.abspath(site_dir)
+    output_dir = os.path.abspath(output_dir)
+    corrected = _load_manifest(manifest) if manifest else {}
+    for root, dirs, files in os.walk(site_dir):
+        if os.path.commonpath([root, output_dir]) == output_dir:
+            dirs[:] = []  # an output tree inside the site
+            continue
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(output_dir, os.path.relpath(source, site_dir))
+            if os.path.exists(target):
+                name = os.path.relpath(target, output_dir)
+                if os.path.samefile(source, target) or (
+                    name in corrected and _file_digest(target) == corrected[name]
+                ):
+                    counts["kept"] += 1
+                    continue
+            counts[link_or_copy(source, target)] += 1
+    return counts
@@ -0,0 +1,403 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextvars import ContextVar
+
+# Failure policies:
+# - "abort": stop scheduling new stages and fail the run once running ones finish
+# - "skip": skip every stage that (transitively) depends on the failed one
+FAILURE_POLICIES = ("abort", "skip")
+# Statuses of a stage that has finished for this run (or will not run)
+FINISHED = ("ok", "failed", "timeout", "skipped")
+
+# Seconds between checks for queued stages with a timeout having started
+QUEUED_POLL = 0.1
+
+
+# Name of the stage the current thread is working for (used to tag metrics)
+CURRENT_STAGE = ContextVar("current_stage", default=None)
+# Event set once the current thread's stage has timed out (see stop_if_cancelled)
+CURRENT_CANCEL = ContextVar("current_cancel", default=None)
+
+# Stage name -> work it handed off to be finished later (see defer)
+_deferred = {}
+_deferred_lock = threading.Lock()
+
+
+class StageFailed(Exception):
+    pass
+
+
+class StageDeferred(Exception):
+    pass
+
+
+class StageCancelled(Exception):
+    pass
+
+
+def defer(count: int = 1):
+    """Note that the current stage queued work whose result comes later.
+
+    The stage still runs to the end, but its outputs are discarded and it is
+    reported as "deferred", so run_in_rounds runs it again next round.
+    """
+    stage = CURRENT_STAGE.get()
+    with _deferred_lock:
+        _deferred[stage] = _deferred.get(stage, 0) + count
+
+
+def has_deferred() -> bool:
+    """Whether the current stage has queued work whose result comes later."""
+    with _deferred_lock:
+        return bool(_deferred.get(CURRENT_STAGE.get()))
+
+
+def stop_if_deferred():
+    """End the current stage here if it queued work whose result comes later.
+
+    Stages call this after making their requests and before using the
+    answers, so nothing is saved or written from placeholder answers.
+    """
+    if has_deferred():
+        raise StageDeferred("requests queued")
+
+
+def stop_if_cancelled():
+    """End the current stage here if it has timed out.
+
+    Threads can't be killed, so a timed-out stage keeps running until it
+    gets here. Anything that writes outputs calls this first: the pipeline
+    has moved on, and later stages may already have read or replaced them.
+    """
+    cancel = CURRENT_CANCEL.get()
+    if cancel is not None and cancel.is_set():
+        raise StageCancelled(f"stage '{CURRENT_STAGE.get()}' timed out")
+
+
+def with_stage(func):
+    """Wrap `func` so worker threads started by a stage report as that stage."""
+    stage = CURRENT_STAGE.get()
+    cancel = CURRENT_CANCEL.get()
+
+    def run(*args, **kwargs):
+        token = CURRENT_STAGE.set(stage)
+        cancel_token = CURRENT_CANCEL.set(cancel)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            CURRENT_CANCEL.reset(cancel_token)
+            CURRENT_STAGE.reset(token)
+
+    return run
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        func,
+        inputs: tuple = (),
+        outputs: tuple = (),
+        timeout: float | None = None,
+        on_failure: str = "abort",
+        optional: tuple = (),
+    ):
+        if on_failure not in FAILURE_POLICIES:
+            raise ValueError(f"Unknown failure policy: {on_failure}")
+        if set(optional) - set(inputs):
+            raise ValueError(f"Optional inputs of '{name}' must be among its inputs")
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        # Inputs the stage can do without: if their producer fails or is
+        # skipped, the stage still runs and gets None for them
+        self.optional = tuple(optional)
+        self.timeout = timeout
+        self.on_failure = on_failure
+
+    def run(self, context: dict, cancel: threading.Event | None = None) -> dict:
+        token = CURRENT_STAGE.set(self.name)
+        cancel_token = CURRENT_CANCEL.set(cancel)
+        with _deferred_lock:
+            _deferred.pop(self.name, None)
+        try:
+            result = self.func(
+                *(
+                    context.get(name) if name in self.optional else context[name]
+                    for name in self.inputs
+                )
+            )
+        except StageDeferred:
+            result = None  # stopped early by stop_if_deferred
+        finally:
+            CURRENT_CANCEL.reset(cancel_token)
+            CURRENT_STAGE.reset(token)
+        with _deferred_lock:
+            deferred = _deferred.pop(self.name, 0)
+        if deferred:
+            raise StageDeferred(f"{deferred} requests queued")
+        if not self.outputs:
+            return {}
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        if not isinstance(result, tuple) or len(result) != len(self.outputs):
+            raise StageFailed(
+                f"Stage '{self.name}' must return {len(self.outputs)} values"
+            )
+        return dict(zip(self.outputs, result))
+
+
+class StageResult:
+    def __init__(self, name: str):
+        self.name = name
+        # pending | queued | running | ok | failed | timeout | skipped |
+        # deferred | waiting
+        self.status = "pending"
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+def build_dependencies(stages: list[Stage], seeds=()) -> dict[str, set[str]]:
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(
+                    f"Output '{output}' is produced by both "
+                    f"'{producers[output]}' and '{stage.name}'"
+                )
+            producers[output] = stage.name
+
+    deps = {}
+    for stage in stages:
+        deps[stage.name] = set()
+        for name in stage.inputs:
+            if name in producers:
+                deps[stage.name].add(producers[name])
+            elif name not in seeds and name not in stage.optional:
+                raise ValueError(f"Stage '{stage.name}' needs unknown input '{name}'")
+
+    # Reject cycles up front so the scheduler can never deadlock
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through stage '{name}'")
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in deps:
+        visit(name)
+    return deps
+
+
+def critical_path(
+    stages: list[Stage], deps: dict[str, set[str]], results: dict[str, StageResult]
+) -> tuple[list[str], float]:
+    # Longest chain of stage durations through the dependency graph
+    best = {}
+
+    def chain(name):
+        if name not in best:
+            prev = max(
+                (chain(dep) for dep in deps[name]),
+                key=lambda c: c[1],
+                default=([], 0.0),
+            )
+            best[name] = (prev[0] + [name], prev[1] + results[name].duration)
+        return best[name]
+
+    paths = [chain(stage.name) for stage in stages]
+    return max(paths, key=lambda c: c[1], default=([], 0.0))
+
+
+def print_summary(stages, deps, results, wall_time):
+    print("\n⏱️ Stage summary:")
+    for stage in stages:
+        result = results[stage.name]
+        line = f"  {stage.name:<20} {result.status:<8} {result.duration:8.2f}s"
+        if result.error:
+            line += f"  ({result.error})"
+        print(line)
+
+    path, length = critical_path(stages, deps, results)
+    serial = sum(r.duration for r in results.values())
+    print(f"  Critical path: {' → '.join(path)} ({length:.2f}s)")
+    print(f"  Wall time: {wall_time:.2f}s (serial would be {serial:.2f}s)")
+
+
+def stage_report(results: dict[str, StageResult]) -> dict[str, dict]:
+    return {
+        name: {"status": r.status, "duration": r.duration, "error": r.error}
+        for name, r in results.items()
+    }
+
+
+def run_pipeline(
+    stages: list[Stage], context: dict | None = None, max_workers: int | None = None
+) -> tuple[dict, dict[str, StageResult]]:
+    context = dict(context or {})
+    deps = build_dependencies(stages, seeds=context)
+    by_name = {stage.name: stage for stage in stages}
+    # The dependencies a stage can't run without (see Stage.optional)
+    producers = {output: stage.name for stage in stages for output in stage.outputs}
+    required = {
+        stage.name: {
+            producers[name]
+            for name in stage.inputs
+            if name in producers and name not in stage.optional
+        }
+        for stage in stages
+    }
+    results = {stage.name: StageResult(stage.name) for stage in stages}
+    remaining = {stage.name for stage in stages}
+    running = {}  # future -> stage name
+    cancels = {name: threading.Event() for name in remaining}
+    aborted = False
+    start = time.perf_counter()
+
+    def skip_dependents(failed, status="skipped"):
+        # Stages that merely could use the failed stage's outputs still run;
+        # all dependents wait for a deferred one
+        for name in list(remaining):
+            needs = deps[name] if status == "waiting" else required[name]
+            if failed in needs:
+                results[name].status = status
+                results[name].error = f"depends on {failed}"
+                remaining.discard(name)
+                skip_dependents(name, status)
+
+    def handle_failure(name, status, error):
+        nonlocal aborted
+        results[name].status = status
+        results[name].error = error
+        results[name].finished = time.perf_counter()
+        print(f"❌ Stage '{name}' {status}: {error}")
+        if by_name[name].on_failure == "abort":
+            aborted = True
+        skip_dependents(name)
+
+    def run(name, context):
+        # Stages wait for a free worker after they are submitted; their time
+        # (and timeout) starts when they do
+        results[name].status = "running"
+        results[name].started = time.perf_counter()
+        return by_name[name].run(context, cancels[name])
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1)
+    try:
+        while remaining or running:
+            if not aborted:
+                for name in sorted(remaining):
+                    if all(
+                        results[dep].status == "ok" for dep in required[name]
+                    ) and all(results[dep].status in FINISHED for dep in deps[name]):
+                        remaining.discard(name)
+                        results[name].status = "queued"
+                        running[executor.submit(run, name, dict(context))] = name
+            elif remaining:
+                for name in remaining:
+                    results[name].status = "skipped"
+                    results[name].error = "run aborted"
+                remaining.clear()
+
+            if not running:
+                break
+
+            now = time.perf_counter()
+            timed = [name for name in running.values() if by_name[name].timeout]
+            deadlines = [
+                results[name].started + by_name[name].timeout
+                for name in timed
+                if results[name].started is not None
+            ]
+            if len(deadlines) < len(timed):
+                # A queued stage may start at any moment; look again soon
+                deadlines.append(now + QUEUED_POLL)
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+            done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+                try:
+                    context.update(future.result())
+                    results[name].status = "ok"
+                    results[name].finished = time.perf_counter()
+                except StageDeferred as e:
+                    # Not a failure: the stage reruns once its work is done
+                    results[name].status = "deferred"
+                    results[name].error = str(e)
+                    results[name].finished = time.perf_counter()
+                    skip_dependents(name, "waiting")
+                except Exception as e:
+                    handle_failure(name, "failed", f"{type(e).__name__}: {e}")
+
+            # Threads can't be killed, so a timed-out stage is told to stop
+            # (see stop_if_cancelled) and whatever it returns is discarded.
+            now = time.perf_counter()
+            for future, name in list(running.items()):
+                timeout, started = by_name[name].timeout, results[name].started
+                if (
+                    timeout is not None
+                    and started is not None
+                    and (now - started >= timeout)
+                ):
+                    running.pop(future)
+                    cancels[name].set()
+                    future.cancel()
+                    handle_failure(name, "timeout", f"exceeded {timeout:g}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    print_summary(stages, deps, results, time.perf_counter() - start)
+
+    failed = [name for name, r in results.items() if r.status in ("failed", "timeout")]
+    if aborted:
+        raise StageFailed(f"Pipeline aborted after failure in: {', '.join(failed)}")
+    return context, results
+
+
+def run_in_rounds(
+    stages: list[Stage],
+    settle,
+    context: dict | None = None,
+    max_workers: int | None = None,
+    max_rounds: int = 20,
+) -> tuple[dict, dict[str, StageResult]]:
+    """Run the pipeline until no stage is deferred.
+
+    `settle()` is called between rounds to finish the deferred work (e.g. wait
+    for a batch job). Each round only runs deferred stages and the stages
+    waiting on them, with the outputs of earlier rounds as inputs.
+    """
+    context = dict(context or {})
+    results = {}
+    pending = list(stages)
+    for round_number in range(1, max_rounds + 1):
+        print(f"\n🔁 Round {round_number}: {', '.join(s.name for s in pending)}")
+        context, round_results = run_pipeline(pending, context, max_workers)
+        results.update(round_results)
+        rerun = {
+            name
+            for name, r in round_results.items()
+            if r.status in ("deferred", "waiting")
+        }
+        if not rerun:
+            return context, results
+        settle()
+        pending = [stage for stage in pending if stage.name in rerun]
+    raise StageFailed(f"Stages still deferred after {max_rounds} rounds")
@@ -0,0 +1,168 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from pipeline import CURRENT_STAGE, Stage
+
+# The Profiler of the current run, or None. Everything in this module is a
+# no-op while it is None, so call sites can stay in place when profiling is off.
+ACTIVE = None
+_DISABLED = nullcontext()
+
+
+def timed(kind: str, name: str):
+    """Time one unit of local work (a file, region or image) under `kind`."""
+    if ACTIVE is None:
+        return _DISABLED
+    return ACTIVE.timed(kind, name)
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+class Profiler:
+    """Per-stage wall/CPU time, peak memory and optional cProfile output.
+
+    Stages should run one at a time while profiling (see `wrap`): process CPU
+    time and the tracemalloc peak are process-wide, so they are only
+    attributable to a stage when nothing else runs alongside it.
+    """
+
+    def __init__(self, directory: str, cprofile: bool = False, memory: bool = True):
+        self.directory = directory
+        self.cprofile = cprofile
+        self.memory = memory
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.items = []
+
+    def start(self):
+        global ACTIVE
+        os.makedirs(self.directory, exist_ok=True)
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        ACTIVE = self
+
+    def stop(self):
+        global ACTIVE
+        ACTIVE = None
+        self.wall = time.perf_counter() - self.started
+        self.cpu = time.process_time() - self.cpu_started
+        if self.memory:
+            tracemalloc.stop()
+
+    def wrap(self, stages: list[Stage]) -> list[Stage]:
+        return [
+            Stage(
+                stage.name,
+                self._profiled(stage.name, stage.func),
+                inputs=stage.inputs,
+                outputs=stage.outputs,
+                timeout=stage.timeout,
+                on_failure=stage.on_failure,
+                optional=stage.optional,
+            )
+            for stage in stages
+        ]
+
+    def _profiled(self, name: str, func):
+        def run(*args):
+            profile = cProfile.Profile() if self.cprofile else None
+            if self.memory:
+                tracemalloc.reset_peak()
+                memory_before = tracemalloc.get_traced_memory()[0]
+            wall, cpu = time.perf_counter(), time.process_time()
+            if profile is not None:
+                profile.enable()
+            try:
+                return func(*args)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                stats = {
+                    "wall": time.perf_counter() - wall,
+                    "cpu": time.process_time() - cpu,
+                }
+                if self.memory:
+                    current, peak = tracemalloc.get_traced_memory()
+                    stats["memory_peak"] = peak
+                    stats["memory_growth"] = current - memory_before
+                    self._save_snapshot(name)
+                if profile is not None:
+                    self._save_cprofile(name, profile)
+                with self.lock:
+                    self.stages[name] = stats
+
+        return run
+
+    def _save_snapshot(self, name: str, limit: int = 25):
+        # Largest allocations still alive when the stage finished, by line
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        path = os.path.join(self.directory, f"{_safe_name(name)}.memory.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:limit]:
+                f.write(f"{stat}\n")
+
+    def _save_cprofile(self, name: str, profile: cProfile.Profile, limit: int = 40):
+        base = os.path.join(self.directory, _safe_name(name))
+        profile.dump_stats(base + ".prof")
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(limit)
+        with open(base + ".cprofile.txt", "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+
+    @contextmanager
+    def timed(self, kind: str, name: str):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            item = {
+                "stage": CURRENT_STAGE.get(),
+                "kind": kind,
+                "name": name,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.thread_time() - cpu,
+            }
+            with self.lock:
+                self.items.append(item)
+
+    def report(self) -> dict:
+        with self.lock:
+            stages, items = dict(self.stages), list(self.items)
+        return {
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "memory_peak": max(
+                (s.get("memory_peak", 0) for s in stages.values()), default=0
+            ),
+            "stages": stages,
+            "items": sorted(items, key=lambda item: item["wall"], reverse=True),
+        }
+
+    def save(self):
+        report = self.report()
+        with open(
+            os.path.join(self.directory, "profile.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(report, f, indent=2)
+
+        print(f"\n🔬 Profile ({self.directory}):")
+        for name, stats in report["stages"].items():
+            line = f"  {name:<20} {stats['wall']:8.2f}s wall {stats['cpu']:8.2f}s cpu"
+            if "memory_peak" in stats:
+                line += f"  {stats['memory_peak'] / 2**20:8.1f} MiB peak"
+            print(line)
+        for item in report["items"][:5]:
+            print(f"  slowest {item['kind']}: {item['name']} ({item['wall']:.2f}s)")
@@ -0,0 +1,263 @@
+import os
+import re
+from difflib import SequenceMatcher
+
+# Set MINIFY_PROMPTS=0 to send code to the model exactly as it is on disk
+ENABLED = os.getenv("MINIFY_PROMPTS", "1") != "0"
+
+_TOKEN = re.compile(r"\w+|\s+|[^\w\s]")
+_HTML_RAW_TAGS = ("pre", "textarea", "script", "style")
+# JS characters after which a "/" starts a regex literal rather than a division
+_JS_REGEX_PREFIX = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+class MinifiedText:
+    """Minified code plus, for every kept character, its offset in the original."""
+
+    def __init__(self, original: str, text: str, positions: list[int]):
+        self.original = original
+        self.text = text
+        self.positions = positions
+
+    def _original_offset(self, offset: int) -> int:
+        if offset == 0:
+            return 0
+        if offset >= len(self.positions):
+            return len(self.original)
+        return self.positions[offset]
+
+    def restore(self, corrected: str) -> str:
+        """Map a corrected version of `text` back onto the original formatting.
+
+        Spans the model left unchanged are copied from the original, with
+        their whitespace and comments; only changed spans use the model's text.
+        """
+        if corrected == self.text:
+            return self.original
+        a = [m.start() for m in _TOKEN.finditer(self.text)] + [len(self.text)]
+        b = [m.start() for m in _TOKEN.finditer(corrected)] + [len(corrected)]
+        a_tokens = [self.text[a[i] : a[i + 1]] for i in range(len(a) - 1)]
+        b_tokens = [corrected[b[i] : b[i + 1]] for i in range(len(b) - 1)]
+
+        # Corrections are usually local, so only diff what lies between the
+        # common prefix and suffix
+        head = 0
+        while (
+            head < min(len(a_tokens), len(b_tokens))
+            and a_tokens[head] == b_tokens[head]
+        ):
+            head += 1
+        tail = 0
+        while (
+            tail < min(len(a_tokens), len(b_tokens)) - head
+            and a_tokens[-1 - tail] == b_tokens[-1 - tail]
+        ):
+            tail += 1
+
+        opcodes = [("equal", 0, head, 0, head)]
+        middle = (
+            a_tokens[head : len(a_tokens) - tail],
+            b_tokens[head : len(b_tokens) - tail],
+        )
+        # The junk heuristic costs some formatting fidelity but keeps huge
+        # rewrites (whole bundles) from taking quadratic time
+        matcher = SequenceMatcher(None, *middle, autojunk=len(middle[0]) > 20000)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            opcodes.append((tag, i1 + head, i2 + head, j1 + head, j2 + head))
+        opcodes.append(
+            (
+                "equal",
+                len(a_tokens) - tail,
+                len(a_tokens),
+                len(b_tokens) - tail,
+                len(b_tokens),
+            )
+        )
+
+        out = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal":
+                start = self._original_offset(a[i1])
+                end = self._original_offset(a[i2])
+                out.append(self.original[start:end])
+            else:
+                out.append(corrected[b[j1] : b[j2]])
+        return "".join(out)
+
+
+class _Builder:
+    def __init__(self, source: str):
+        self.source = source
+        self.chars = []
+        self.positions = []
+
+    def keep(self, start: int, end: int):
+        self.chars.append(self.source[start:end])
+        self.positions.extend(range(start, end))
+
+    def space(self, offset: int, char: str = " "):
+        self.chars.append(char)
+        self.positions.append(offset)
+
+    def last(self) -> str:
+        return self.chars[-1][-1] if self.chars and self.chars[-1] else ""
+
+    def build(self) -> MinifiedText:
+        return MinifiedText(self.source, "".join(self.chars), self.positions)
+
+
+def minify_html(code: str) -> MinifiedText:
+    out = _Builder(code)
+    i, n = 0, len(code)
+    raw = re.compile(rf"<({'|'.join(_HTML_RAW_TAGS)})\b", re.I)
+    while i < n:
+        if code.startswith("<!--", i) and not code.startswith("<!--[if", i):
+            end = code.find("-->", i)
+            i = n if end < 0 else end + 3
+            continue
+        match = raw.match(code, i)
+        if match:
+            # Raw-text elements are kept verbatim
+            close = re.compile(rf"</{match.group(1)}\s*>", re.I).search(code, i)
+            end = n if close is None else close.end()
+            out.keep(i, end)
+            i = end
+            continue
+        if code[i].isspace():
+            j = i
+            while j < n and code[j].isspace():
+                j += 1
+            # Whitespace touching a tag is layout only; elsewhere keep one space
+            if out.last() not in (">", "") and j < n and code[j] != "<":
+                out.space(i)
+            i = j
+            continue
+        j = i + 1
+        while j < n and not code[j].isspace() and code[j] != "<":
+            j += 1
+        out.keep(i, j)
+        i = j
+    return out.build()
+
+
+def minify_css(code: str) -> MinifiedText:
+    out = _Builder(code)
+    i, n = 0, len(code)
+    tight = set("{}:;,>+~()")
+    while i < n:
+        c = code[i]
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if c in "\"'":
+            end = _string_end(code, i)
+            out.keep(i, end)
+            i = end
+            continue
+        if c.isspace():
+            j = i
+            while j < n and code[j].isspace():
+                j += 1
+            if out.last() not in tight and out.last() != "" and j < n:
+                if code[j] not in tight and not code.startswith("/*", j):
+                    out.space(i)
+            i = j
+            continue
+        out.keep(i, i + 1)
+        i += 1
+    return out.build()
+
+
+def _string_end(code: str, start: int) -> int:
+    quote, i = code[start], start + 1
+    while i < len(code):
+        if code[i] == "\\":
+            i += 2
+            continue
+        if code[i] == quote:
+            return i + 1
+        if code[i] == "\n" and quote != "`":
+            return i
+        i += 1
+    return len(code)
+
+
+def _regex_end(code: str, start: int) -> int:
+    i, in_class = start + 1, False
+    while i < len(code) and code[i] != "\n":
+        if code[i] == "\\":
+            i += 2
+            continue
+        if code[i] == "[":
+            in_class = True
+        elif code[i] == "]":
+            in_class = False
+        elif code[i] == "/" and not in_class:
+            i += 1
+            while i < len(code) and code[i].isalpha():
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+def minify_js(code: str) -> MinifiedText:
+    # Conservative: newlines are kept (automatic semicolon insertion depends on
+    # them); comments, indentation, blank lines and repeated spaces go.
+    out = _Builder(code)
+    i, n = 0, len(code)
+    prev = ""  # last significant character, to tell regexes from division
+    while i < n:
+        c = code[i]
+        if code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if c in "\"'`":
+            end = _string_end(code, i)
+            out.keep(i, end)
+            prev, i = code[end - 1], end
+            continue
+        if c == "/" and (prev in _JS_REGEX_PREFIX or _ends_with_keyword(out)):
+            end = _regex_end(code, i)
+            out.keep(i, end)
+            prev, i = "/", end
+            continue
+        if c.isspace():
+            j, newline = i, -1
+            while j < n and code[j].isspace():
+                if code[j] == "\n" and newline < 0:
+                    newline = j
+                j += 1
+            if out.last() == "":
+                pass
+            elif newline >= 0:
+                if out.last() != "\n":
+                    out.space(newline, "\n")
+            elif out.last() != "\n" and j < n:
+                out.space(i)
+            i = j
+            continue
+        out.keep(i, i + 1)
+        prev = c
+        i += 1
+    return out.build()
+
+
+def _ends_with_keyword(out: _Builder) -> bool:
+    tail = "".join(out.chars[-8:])
+    return re.search(r"\b(return|typeof|case|in|of|do|else)\s*$", tail) is not None
+
+
+MINIFIERS = {"html": minify_html, "css": minify_css, "js": minify_js}
+
+
+def for_prompt(code: str, kind: str) -> MinifiedText:
+    if not ENABLED or kind not in MINIFIERS:
+        return MinifiedText(code, code, list(range(len(code))))
+    return MINIFIERS[kind](code)
@@ -0,0 +1,210 @@
+# Versioned prompt templates. Every template keeps its instructions and
+# examples in a fixed leading prefix and appends the variable payload (code,
+# issues, captions) last, so repeated calls share a byte-identical prefix the
+# provider can cache. Bump a template's version whenever its static text changes.
+
+
+class PromptTemplate:
+    def __init__(
+        self, name: str, version: int, system: str, instructions: str, payload: str
+    ):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.instructions = instructions
+        self.payload = payload
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def user_content(self, **fields) -> str:
+        return self.instructions + "\n\n" + self.payload.format(**fields)
+
+    def messages(self, **fields) -> list[dict]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user_content(**fields)},
+        ]
+
+
+PROMPTS = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    PROMPTS[template.name] = template
+    return template
+
+
+def bullet_list(items: list[str]) -> str:
+    return "\n".join(f"- {item}" for item in items)
+
+
+register(
+    PromptTemplate(
+        "dom_analysis",
+        1,
+        "You are an expert in web accessibility.",
+        "Analyze the HTML code at the end of this message for **any and all** accessibility issues. "
+        "Be exhaustive and check for:\n"
+        "- Missing alt attributes on <img>\n"
+        "- Improper heading structure or skipped heading levels\n"
+        "- Non-semantic tags used instead of semantic ones\n"
+        "- Missing form labels or misassociated labels\n"
+        "- Inaccessible link text (e.g., 'click here')\n"
+        "- Visual-only cues\n"
+        "- Missing ARIA roles on landmarks\n"
+        "- Non-keyboard focusable elements\n"
+        "- Missing `lang` attribute or incorrect usage\n"
+        "- Tables missing headers or structure\n\n"
+        "Return only a **Python list of strings**, each one describing a unique accessibility issue and the element involved.\n\n"
+        "Example:\n['Image element <img> missing alt text.', 'Heading levels are skipped or improperly nested.']",
+        "HTML Code:\n{code}",
+    )
+)
+
+register(
+    PromptTemplate(
+        "css_analysis",
+        1,
+        "You are an expert in web accessibility.",
+        "Analyze the CSS code at the end of this message for accessibility issues. Be thorough and check for:\n"
+        "- Insufficient contrast between text and background\n"
+        "- Use of color alone to convey information\n"
+        "- Hidden or removed focus indicators\n"
+        "- Fixed or absolute font sizes\n"
+        "- Content overlapping or hidden due to positioning/z-index\n"
+        "- Animations/flashing violating accessibility\n"
+        "- Lack of responsive design\n"
+        "- Use of background images for critical text\n\n"
+        "Return only a **Python list of strings**, each one describing an issue clearly and mentioning the CSS rule or selector involved.\n"
+        "If the code contains `/* FILE: ... */` markers, also name the file each issue is in.\n\n"
+        "Example:\n['Text color #ccc on white background has insufficient contrast.', 'Focus outline removed from buttons.']",
+        "CSS Code:\n{code}",
+    )
+)
+
+register(
+    PromptTemplate(
+        "js_analysis",
+        1,
+        "You are an expert in web accessibility.",
+        "Analyze the JavaScript code at the end of this message for accessibility issues. Look for:\n"
+        "- Dynamic DOM updates without ARIA live region announcements\n"
+        "- Custom UI components lacking keyboard interaction\n"
+        "- Incorrect or missing focus management\n"
+        "- Mouse-only event listeners (e.g., click without keydown)\n"
+        "- Use of alert()/confirm() disrupting screen readers\n"
+        "- Incomplete ARIA roles/attributes\n"
+        "- Dynamic tab order issues\n"
+        "- Time-based or animated content that lacks user control\n\n"
+        "Return only a **Python list of strings**, each clearly describing a single accessibility issue and the JS behavior or element involved.\n"
+        "If the code contains `// FILE: ...` markers, also name the file each issue is in.\n\n"
+        "Example:\n['Custom dropdown lacks keyboard navigation.', 'Modal does not trap focus when opened.']",
+        "JavaScript Code:\n{code}",
+    )
+)
+
+register(
+    PromptTemplate(
+        "html_correction",
+        1,
+        "You are an expert in accessible HTML coding.",
+        "You are an expert web developer specialized in accessibility.\n\n"
+        "Your job is to fix **only** the HTML-based accessibility issues listed below.\n"
+        "These issues are related to structure, missing attributes, or semantic markup.\n\n"
+        "**Guidelines:**\n"
+        "- Do NOT fix issues requiring audio/video transcripts.\n"
+        "- Do NOT change any CSS or JavaScript logic.\n"
+        "- Keep the structure and styling intact unless needed for fixing the issue.\n"
+        "- Do NOT introduce extra explanations. Just return the corrected HTML code.",
+        "{alt_guideline}\nIssues:\n{issues}\n\n{captions}HTML Code:\n{code}\n",
+    )
+)
+
+register(
+    PromptTemplate(
+        "html_region_correction",
+        1,
+        "You are an expert in accessible HTML coding.",
+        "You are an expert web developer specialized in accessibility.\n\n"
+        "You are given one fragment of a larger HTML document and the accessibility issues "
+        "that may concern it. Fix **only** the listed issues that apply to this fragment.\n\n"
+        "**Guidelines:**\n"
+        "- Do NOT fix issues requiring audio/video transcripts.\n"
+        "- Do NOT change any CSS or JavaScript logic.\n"
+        "- Keep the same outermost element; return the whole fragment, not just the changed lines.\n"
+        "- Keep ids and classes intact so the rest of the page still works.\n"
+        "- Do NOT introduce extra explanations. Just return the corrected HTML fragment.",
+        "{alt_guideline}\nIssues:\n{issues}\n\n{captions}HTML Fragment:\n{code}\n",
+    )
+)
+
+register(
+    PromptTemplate(
+        "css_correction",
+        1,
+        "You are an expert in web accessibility and CSS.",
+        "You are an expert web developer specializing in CSS accessibility.\n\n"
+        "You will be given:\n"
+        "- A list of CSS accessibility issues.\n"
+        "- CSS code from one or more files (with filename markers).\n\n"
+        "**Your task:**\n"
+        "- Fix the accessibility issues *only* in the CSS.\n"
+        "- Keep unrelated styles unchanged.\n"
+        "- Return your answer strictly as a Python dictionary mapping each filename to its corrected CSS code.\n"
+        "- Do NOT return explanations, just the dictionary object.",
+        "Accessibility Issues:\n{issues}\n\nCSS Code:\n{code}\n",
+    )
+)
+
+register(
+    PromptTemplate(
+        "js_correction",
+        1,
+        "You are an expert in web accessibility and JavaScript.",
+        "You are an expert web accessibility and JavaScript developer.\n\n"
+        "You will be given:\n"
+        "- A list of accessibility issues found in JavaScript files.\n"
+        "- JavaScript code from one or more files (each marked with its filename).\n\n"
+        "**Your task:**\n"
+        "- Fix the issues in the JS code.\n"
+        "- Do not modify unrelated logic.\n"
+        "- Return your answer strictly as a Python dictionary mapping each JS filename to its corrected JS code.\n"
+        "- Do NOT include explanations, just the dictionary.",
+        "Accessibility Issues:\n{issues}\n\nJavaScript Code:\n{code}\n",
+    )
+)
+
+register(
+    PromptTemplate(
+        "tool_recommendation",
+        1,
+        "You are an expert accessibility engineer.",
+        "You are an expert accessibility engineer.\n"
+        "You are given a list of accessibility issues detected in HTML, CSS, or JavaScript files.\n"
+        "Your job is to recommend which external tools should be used based on the issues.\n\n"
+        "Supported tools:\n"
+        "- 'image_captioning_tool': Use if image alt attributes are missing or non-descriptive.\n"
+        "- 'video_transcription_tool': Use if video elements are missing captions.\n"
+        "- Other tools may be included if you can justify them based on accessibility needs.\n\n"
+        "Return your answer strictly as a Python dictionary in this format:\n"
+        "{\n"
+        "  'image_captioning_tool': ['img1.jpg', 'img2.png'],\n"
+        "  'video_transcription_tool': ['video1.mp4']\n"
+        "}\n"
+        "Use only the file name or relative path from the issue description if available.\n"
+        "If the file is not specified, write 'UNKNOWN'.",
+        "Accessibility Issues:\n{issues}\n",
+    )
+)
+
+register(
+    PromptTemplate(
+        "image_caption",
+        1,
+        "You are an assistant that generates concise and descriptive alt text for web accessibility.",
+        "Describe this image in one sentence as alt text.",
+        "",
+    )
+)
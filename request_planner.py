@@ -0,0 +1,143 @@
+import math
+import os
+from collections.abc import Mapping
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to a character estimate
+    _ENCODING = None
+
+# Token budget for the code carried by one analysis request
+DEFAULT_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "8000"))
+
+MARKERS = {
+    "css": "/* FILE: {name} */",
+    "js": "// FILE: {name}",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+class FilePart:
+    # `load` returns the text; parts hold no code until a request is rendered
+    def __init__(self, name: str, load, index: int = 1, total: int = 1):
+        self.name = name
+        self.load = load
+        self.index = index
+        self.total = total
+
+    @property
+    def text(self) -> str:
+        return self.load()
+
+    def header(self, kind: str) -> str:
+        marker = MARKERS[kind].format(name=self.name)
+        if self.total > 1:
+            marker = marker.replace(
+                self.name, f"{self.name} (part {self.index}/{self.total})"
+            )
+        return marker
+
+
+class PlannedRequest:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.parts = []
+        self.tokens = 0
+
+    @property
+    def files(self) -> list[str]:
+        return list(dict.fromkeys(part.name for part in self.parts))
+
+    def render(self) -> str:
+        return "\n\n".join(
+            f"{part.header(self.kind)}\n{part.text}" for part in self.parts
+        )
+
+
+def split_spans(text: str, budget: int) -> list[tuple[int, int]]:
+    # (start, end) of line-aligned pieces of at most `budget` tokens (a single
+    # huge line, as in minified bundles, is cut by characters)
+    spans, start, end, used, offset = [], None, 0, 0, 0
+    for line in text.split("\n"):
+        line_end = offset + len(line)
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            if start is not None:
+                spans.append((start, end))
+                start, used = None, 0
+            step = max(1, len(line) * budget // cost)
+            spans.extend(
+                (i, min(i + step, line_end)) for i in range(offset, line_end, step)
+            )
+        else:
+            if used + cost > budget and start is not None:
+                spans.append((start, end))
+                start, used = None, 0
+            if start is None:
+                start = offset
+            end = line_end
+            used += cost
+        offset = line_end + 1
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+
+def split_text(text: str, budget: int) -> list[str]:
+    return [text[start:end] for start, end in split_spans(text, budget)]
+
+
+def _loader(files, name: str, start: int = 0, end: int | None = None):
+    return lambda: files[name][start:end]
+
+
+def plan_requests(
+    files: Mapping[str, str], kind: str, budget: int = DEFAULT_BUDGET
+) -> list[PlannedRequest]:
+    """Pack files into as few requests as possible without exceeding `budget`.
+
+    Files are measured once, oversized ones are split on line boundaries, and
+    the pieces are packed first-fit-decreasing. Each piece keeps a FILE marker
+    so issues can be attributed back to their file. Parts refer back to
+    `files` instead of holding text, so with a lazy mapping (assets.AssetFiles)
+    only the requests being rendered are in memory.
+    """
+    items = []
+    for name in files:
+        text = files[name]
+        marker_cost = estimate_tokens(MARKERS[kind].format(name=name)) + 8
+        cost = estimate_tokens(text) + marker_cost
+        if cost <= budget:
+            items.append((cost, FilePart(name, _loader(files, name))))
+            continue
+        spans = split_spans(text, budget - marker_cost)
+        for i, (start, end) in enumerate(spans, 1):
+            part = FilePart(name, _loader(files, name, start, end), i, len(spans))
+            items.append((estimate_tokens(text[start:end]) + marker_cost, part))
+
+    requests = []
+    for cost, part in sorted(items, key=lambda item: item[0], reverse=True):
+        target = next((r for r in requests if r.tokens + cost <= budget), None)
+        if target is None:
+            target = PlannedRequest(kind)
+            requests.append(target)
+        target.parts.append(part)
+        target.tokens += cost
+    return requests
+
+
+def attribute_file(issue: str, files: list[str]) -> str | None:
+    if len(files) == 1:
+        return files[0]
+    # Models often shorten the marker name to its tail, e.g. "before-carousel.js"
+    mentioned = [
+        name for name in files if name in issue or name.rsplit("_", 1)[-1] in issue
+    ]
+    return mentioned[0] if len(mentioned) == 1 else None
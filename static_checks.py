@@ -0,0 +1,278 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from document import document_for
+
+# Local checks on model output: does the code still parse, and do static rules
+# still find the problem an issue describes. Used to validate corrections
+# (cascade escalation) and to verify files written to after/.
+
+TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp")
+PARSE_JS_AST = os.path.join(TEMP_DIR, "parse_js_ast.js")
+PARSE_CSS_AST = os.path.join(TEMP_DIR, "parse_css_ast.js")
+
+
+def node_parse(script: str, code: str, suffix: str) -> tuple[dict | None, str | None]:
+    """Parse `code` with one of the node scripts in temp/.
+
+    Returns (ast, None) on success, (None, message) on a syntax error and
+    (None, None) when node or the parser module is not installed.
+    """
+    if shutil.which("node") is None or not os.path.exists(script):
+        return None, None
+    with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as f:
+        f.write(code)
+    try:
+        result = subprocess.run(
+            ["node", script, f.name],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(script),
+            timeout=30,
+        )
+    except subprocess.TimeoutExpired:
+        return None, None
+    finally:
+        os.remove(f.name)
+    if result.returncode != 0:
+        if "Cannot find module" in result.stderr:
+            return None, None
+        lines = [line for line in result.stderr.splitlines() if "Error" in line]
+        return None, lines[0].strip() if lines else "parse error"
+    try:
+        return json.loads(result.stdout), None
+    except json.JSONDecodeError:
+        return None, None
+
+
+def _scan(code: str, kind: str) -> list[str]:
+    # Fallback syntax check: strings and comments terminate and brackets
+    # balance. Catches the usual damage (truncated output, dropped braces).
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack, errors = [], []
+    i, n, prev = 0, len(code), ""
+    while i < n:
+        c = code[i]
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end < 0:
+                return errors + [f"unterminated comment at line {_line(code, i)}"]
+            i = end + 2
+            continue
+        if kind == "js" and code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if c in "\"'" or (kind == "js" and c == "`"):
+            j = i + 1
+            while j < n and code[j] != c:
+                if code[j] == "\\":
+                    j += 1
+                elif code[j] == "\n" and c != "`":
+                    break
+                j += 1
+            if j >= n or code[j] != c:
+                return errors + [f"unterminated string at line {_line(code, i)}"]
+            i, prev = j + 1, c
+            continue
+        if kind == "js" and c == "/" and (prev == "" or prev in "(,=:[!&|?{};"):
+            j = i + 1
+            while j < n and code[j] not in "/\n":
+                j += 2 if code[j] == "\\" else 1
+            if j < n and code[j] == "/":
+                i, prev = j + 1, "/"
+                continue
+        if c in "([{":
+            stack.append((c, i))
+        elif c in ")]}":
+            if not stack or stack[-1][0] != pairs[c]:
+                return errors + [f"unexpected '{c}' at line {_line(code, i)}"]
+            stack.pop()
+        if not c.isspace():
+            prev = c
+        i += 1
+    if stack:
+        errors.append(
+            f"unclosed '{stack[-1][0]}' from line {_line(code, stack[-1][1])}"
+        )
+    return errors
+
+
+def _line(code: str, offset: int) -> int:
+    return code.count("\n", 0, offset) + 1
+
+
+def check_syntax(code: str, kind: str) -> list[str]:
+    """Syntax errors in CSS, JS or HTML code; empty when it parses."""
+    if kind == "html":
+        return check_html(code)
+    script = PARSE_JS_AST if kind == "js" else PARSE_CSS_AST
+    ast, error = node_parse(script, code, "." + kind)
+    if ast is not None:
+        return []
+    if error is not None:
+        return [error]
+    return _scan(code, kind)
+
+
+def check_html(code: str, original: str | None = None) -> list[str]:
+    """Problems with corrected HTML: empty output, or sections and ids lost."""
+    if not code.strip():
+        return ["empty document"]
+    errors = []
+    document = document_for(code)
+    if original is not None:
+        before = document_for(original)
+        for tag in ("head", "body", "header", "nav", "main", "footer", "form"):
+            lost = len(before.tags(tag)) - len(document.tags(tag))
+            if lost > 0:
+                errors.append(f"{lost} <{tag}> elements lost")
+        missing = set(before.by_id) - set(document.by_id)
+        if missing:
+            errors.append(f"ids lost: {', '.join(sorted(missing)[:5])}")
+    return errors
+
+
+class Rule:
+    """A static check for one kind of issue.
+
+    `keywords` are regular expressions that tie an issue description to the
+    rule, matched as whole words; `find` returns one entry per occurrence of
+    the problem in a piece of code.
+    """
+
+    def __init__(self, name: str, kind: str, keywords: tuple, find):
+        self.name = name
+        self.kind = kind
+        self.keywords = keywords
+        # "alt" is not in "default", nor "lang" in "language"
+        self.pattern = re.compile(
+            "|".join(rf"\b(?:{keyword})\b" for keyword in keywords), re.I
+        )
+        self.find = find
+
+    def matches(self, issue: str) -> bool:
+        return self.pattern.search(issue) is not None
+
+
+def _imgs_without_alt(code: str) -> list[str]:
+    return [
+        img.get("src", "")
+        for img in document_for(code).tags("img")
+        if not img.has_attr("alt")
+    ]
+
+
+def _html_without_lang(code: str) -> list[str]:
+    # Some parsers add an <html> to fragments; only judge one that is written
+    if not re.search(r"<html\b", code, re.I):
+        return []
+    html = document_for(code).tags("html")
+    return ["html"] if html and not html[0].get("lang") else []
+
+
+def _unlabeled_inputs(code: str) -> list[str]:
+    document = document_for(code)
+    labelled = {label.get("for") for label in document.tags("label")}
+    found = []
+    for el in document.tags("input", "select", "textarea"):
+        if el.get("type") in ("hidden", "submit", "button", "image", "reset"):
+            continue
+        if el.get("aria-label") or el.get("aria-labelledby") or el.get("title"):
+            continue
+        if el.get("id") in labelled or el.find_parent("label") is not None:
+            continue
+        found.append(el.get("id") or el.get("name") or el.name)
+    return found
+
+
+def _vague_links(code: str) -> list[str]:
+    vague = {"click here", "here", "read more", "more", "link"}
+    return [
+        a.get("href", "")
+        for a in document_for(code).tags("a")
+        if a.get_text(" ", strip=True).lower() in vague and not a.get("aria-label")
+    ]
+
+
+def _regex_rule(pattern: str, unless: str | None = None):
+    compiled = re.compile(pattern, re.I)
+    guard = re.compile(unless, re.I) if unless else None
+
+    def find(code: str) -> list[str]:
+        if guard is not None and guard.search(code):
+            return []
+        return [m.group(0) for m in compiled.finditer(code)]
+
+    return find
+
+
+RULES = [
+    Rule("img_alt", "html", ("alt", "alternative text", "text alternatives?"), _imgs_without_alt),
+    Rule("html_lang", "html", ("lang",), _html_without_lang),
+    Rule("input_label", "html", ("labels?", "unlabell?ed"), _unlabeled_inputs),
+    Rule("link_text", "html", ("click here", "link text"), _vague_links),
+    Rule("focus_outline", "css", ("outlines?", "focus (?:indicator|outline|ring|style)s?", "focus-visible"), _regex_rule(r"outline\s*:\s*(?:none|0)\b")),
+    Rule("fixed_font_size", "css", ("font[- ]sizes?",), _regex_rule(r"font-size\s*:\s*\d+(?:\.\d+)?px")),
+    Rule("endless_animation", "css", ("animations?", "flash(?:es|ing)?", "blink(?:s|ing)?"), _regex_rule(r"animation[^;{}]*\binfinite\b")),
+    Rule("alert", "js", ("alerts?", "confirm"), _regex_rule(r"\b(?:alert|confirm)\s*\(")),
+    Rule(
+        "mouse_only", "js", ("keyboard", "mouse[- ]only"),
+        _regex_rule(r"""addEventListener\(\s*['"]click['"]|\.click\(\s*function|onclick\s*=""",
+                    unless=r"""['"]key(?:down|up|press)['"]|onkey(?:down|up|press)|\.key(?:down|up|press)\("""),
+    ),
+]  # fmt: skip
+
+
+def rules_for(issue: str, kind: str) -> list[Rule]:
+    return [rule for rule in RULES if rule.kind == kind and rule.matches(issue)]
+
+
+def find_problems(code: str, kind: str) -> dict[str, list[str]]:
+    """Every rule of `kind` that finds something in `code`, with its findings."""
+    found = {}
+    for rule in RULES:
+        if rule.kind == kind:
+            hits = rule.find(code)
+            if hits:
+                found[rule.name] = hits
+    return found
+
+
+def unresolved(before: str, after: str, issues: list[str], kind: str) -> list[str]:
+    """Issues a static rule still finds as often after a correction as before.
+
+    Issues no rule understands are not judged.
+    """
+    counts = {}
+    left = []
+    for issue in issues:
+        for rule in rules_for(issue, kind):
+            if rule.name not in counts:
+                counts[rule.name] = (len(rule.find(before)), len(rule.find(after)))
+            old, new = counts[rule.name]
+            if old and new >= old:
+                left.append(issue)
+                break
+    return left
+
+
+def validate_correction(
+    before: str, after: str, issues: list[str], kind: str
+) -> list[str]:
+    """Reasons to reject a corrected file; empty when it looks right."""
+    if not after.strip():
+        return ["empty correction"]
+    if kind == "html":
+        problems = check_html(after, before)
+    else:
+        # Code that was already broken is not held against the correction
+        problems = check_syntax(after, kind) if not check_syntax(before, kind) else []
+    problems += [
+        f"still present: {issue}" for issue in unresolved(before, after, issues, kind)
+    ]
+    return problems
@@ -0,0 +1,194 @@
+import difflib
+import json
+import os
+
+from issue_clustering import jaccard, shingles
+from static_checks import RULES, check_html, check_syntax, rules_for
+
+# Checks on what the correctors wrote to after/. Work is limited to what
+# changed: unchanged files are skipped, syntax is only checked for changed
+# files, and static rules and agent analysis only look at changed regions.
+
+# Unchanged lines kept around each changed region
+CONTEXT_LINES = 3
+# How similar a finding must be to a known issue to count as that issue
+SAME_ISSUE = 0.4
+
+
+class Hunk:
+    # A changed region: lines [start, end) of the original and corrected file
+    def __init__(self, before_start, before_end, after_start, after_end):
+        self.before_start = before_start
+        self.before_end = before_end
+        self.after_start = after_start
+        self.after_end = after_end
+
+    def to_dict(self) -> dict:
+        return {
+            "before": [self.before_start + 1, self.before_end],
+            "after": [self.after_start + 1, self.after_end],
+        }
+
+
+def diff_hunks(
+    before: list[str], after: list[str], context: int = CONTEXT_LINES
+) -> list[Hunk]:
+    """Changed regions between two files given as lists of lines."""
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    hunks = []
+    for group in matcher.get_grouped_opcodes(context):
+        hunks.append(Hunk(group[0][1], group[-1][2], group[0][3], group[-1][4]))
+    return hunks
+
+
+class FileVerification:
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.status = "unchanged"  # unchanged | ok | failed | reverted
+        self.hunks = []
+        self.changed_lines = 0
+        self.errors = []
+        self.resolved = []
+        self.open = []
+        self.unverified = []  # issues no static rule understands
+        self.new = []
+        self.retried = False
+
+    @property
+    def failed(self) -> bool:
+        return self.status == "failed"
+
+    def to_dict(self) -> dict:
+        return {
+            **vars(self),
+            "hunks": [hunk.to_dict() for hunk in self.hunks],
+        }
+
+
+def _count(rules, code: str) -> int:
+    return sum(len(rule.find(code)) for rule in rules)
+
+
+def verify_file(
+    name: str,
+    kind: str,
+    before: str,
+    after: str | None,
+    issues: list[str],
+    analyze=None,
+) -> FileVerification:
+    """Check one corrected file against its original.
+
+    `issues` are the issues the file was corrected for. `analyze`, when
+    given, is an analysis agent's analyze(); it sees only the changed
+    regions, and what it finds there that matches no known issue is new.
+    """
+    result = FileVerification(name, kind)
+    if after is None:
+        result.status = "failed"
+        result.errors.append("no corrected file written")
+        result.open = list(issues)
+        return result
+    if after == before:
+        result.open = list(issues)
+        return result
+
+    before_lines = before.splitlines(keepends=True)
+    after_lines = after.splitlines(keepends=True)
+    result.hunks = diff_hunks(before_lines, after_lines)
+    result.changed_lines = sum(h.after_end - h.after_start for h in result.hunks)
+    old = "".join(
+        "".join(before_lines[h.before_start : h.before_end]) for h in result.hunks
+    )
+    new = "".join(
+        "".join(after_lines[h.after_start : h.after_end]) for h in result.hunks
+    )
+
+    if not after.strip():
+        result.errors.append("empty file")
+    elif kind == "html":
+        result.errors.extend(check_html(after, before))
+    else:
+        errors = check_syntax(after, kind)
+        # A file that never parsed is not held against the correction
+        if errors and not check_syntax(before, kind):
+            result.errors.extend(errors)
+
+    for issue in issues:
+        rules = rules_for(issue, kind)
+        if not rules:
+            result.unverified.append(issue)
+            continue
+        found_before = _count(rules, old)
+        if found_before:
+            fixed = _count(rules, new) < found_before
+        else:
+            # The edits didn't touch where the rule finds it
+            fixed = _count(rules, after) == 0
+        (result.resolved if fixed else result.open).append(issue)
+
+    for rule in RULES:
+        if rule.kind != kind:
+            continue
+        hits = rule.find(new)
+        if len(hits) > len(rule.find(old)):
+            result.new.append(f"{rule.name}: {', '.join(map(str, hits[:3]))}")
+
+    if analyze is not None and new.strip():
+        known = [shingles(issue) for issue in issues]
+        for finding in analyze(new):
+            if finding and all(
+                jaccard(shingles(finding), s) < SAME_ISSUE for s in known
+            ):
+                result.new.append(finding)
+
+    result.status = "failed" if result.errors else "ok"
+    return result
+
+
+def summarize(results: list[FileVerification]) -> dict:
+    changed = [r for r in results if r.status != "unchanged"]
+    return {
+        "files": len(results),
+        "changed_files": len(changed),
+        "changed_lines": sum(r.changed_lines for r in results),
+        "failed": [r.name for r in results if r.failed],
+        "reverted": [r.name for r in results if r.status == "reverted"],
+        "retried": [r.name for r in results if r.retried],
+        "resolved": sum(len(r.resolved) for r in results),
+        "open": sum(len(r.open) for r in results),
+        "unverified": sum(len(r.unverified) for r in results),
+        "new": sum(len(r.new) for r in results),
+    }
+
+
+def print_summary(results: list[FileVerification]):
+    totals = summarize(results)
+    print(
+        f"\n🔬 Verified {totals['changed_files']} changed of {totals['files']} files "
+        f"({totals['changed_lines']} changed lines):"
+    )
+    print(
+        f"  {totals['resolved']} resolved, {totals['open']} open, "
+        f"{totals['unverified']} unverified, {totals['new']} new"
+    )
+    for r in results:
+        if r.errors:
+            print(f"  ❌ {r.name} ({r.status}): {'; '.join(r.errors[:3])}")
+        for problem in r.new[:5]:
+            print(f"  🆕 {r.name}: {problem}")
+
+
+def save_report(path: str, results: list[FileVerification]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "summary": summarize(results),
+                "files": [r.to_dict() for r in results],
+            },
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )